@@ -0,0 +1,278 @@
+import argparse
+import json
+import sys
+
+import config
+from logic.file_processor import FileProcessor
+from logic.generation_service import GenerationService, ServiceClient
+from logic.key_matcher import MODES as KEY_MATCH_MODES, MODE_FUZZY
+from logic.mapping_profile import MAPPING_AUTO, MAPPING_MODES, delete_profile, load_profile
+from logic.output_store import OutputStore, materialize_record, referenced_digests
+from logic.project_regenerator import apply_updates, regenerate_records
+from logic.run_metrics import DIMENSIONS, METRIC_KEYS, MetricsAggregator
+from logic.xml_validator import MAX_ERRORS, get_validator
+
+# Подкоманды, при которых main.py не запускает окно; новая подкоманда добавляется в config.CLI_COMMANDS
+COMMANDS = config.CLI_COMMANDS
+
+
+def _open_settings():
+    # Те же настройки, что использует окно (QtCore не требует QApplication)
+    from PyQt6.QtCore import QSettings
+    return QSettings(config.APP_DB_NAME, "FileProcessor")
+
+
+def _load_json_setting(settings, key):
+    try:
+        return json.loads(settings.value(key, "{}"))
+    except (TypeError, ValueError):
+        return {}
+
+
+def _add_address_args(parser):
+    parser.add_argument('--socket', dest='socket_path', help="путь к Unix сокету сервиса")
+    parser.add_argument('--port', type=int, help="порт на localhost вместо Unix сокета")
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog='gosmost', description="ГосМост: генерация VM шаблонов без окна")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    serve = subparsers.add_parser('serve', help="запустить сервис генерации с теплыми кэшами")
+    _add_address_args(serve)
+    serve.add_argument('--workers', type=int, default=4, help="размер пула обработчиков")
+
+    submit = subparsers.add_parser('submit', help="отправить задание запущенному сервису")
+    _add_address_args(submit)
+    submit_ops = submit.add_subparsers(dest='op', required=True)
+
+    build = submit_ops.add_parser('build', help="сгенерировать шаблоны")
+    build.add_argument('scenario')
+    build.add_argument('xsd')
+    build.add_argument('-o', '--output-dir', required=True, help="папка результатов на стороне сервиса")
+    build.add_argument('--key-match', choices=KEY_MATCH_MODES, default=MODE_FUZZY,
+                       help="сопоставление элементов с ключами сценария (compat — прежний порядок поиска)")
+    build.add_argument('--mapping', choices=MAPPING_MODES, default=MAPPING_AUTO,
+                       help="профиль сопоставления схемы: применить сохраненный, не использовать или записать")
+    build.add_argument('--project', help="проект запуска для журнала метрик")
+
+    batch = submit_ops.add_parser('batch', help="пакет заданий из JSON файла (список scenario_path/xsd_path/output_dir)")
+    batch.add_argument('jobs_file')
+
+    render = submit_ops.add_parser('render', help="подставить значения сценария в готовый шаблон")
+    render.add_argument('template')
+    render.add_argument('scenario')
+    render.add_argument('--xsd')
+    render.add_argument('-o', '--output')
+
+    submit_validate = submit_ops.add_parser('validate', help="проверить готовые XML документы по схеме")
+    _add_validate_args(submit_validate)
+
+    submit_ops.add_parser('stats', help="состояние сервиса")
+    submit_ops.add_parser('shutdown', help="остановить сервис")
+
+    regenerate = subparsers.add_parser('regenerate', help="перегенерировать все шаблоны проекта")
+    regenerate.add_argument('project', help="название проекта")
+    regenerate.add_argument('--workers', type=int, default=4, help="число параллельных генераций")
+    regenerate.add_argument('--force', action='store_true', help="перегенерировать и неизмененные записи")
+
+    store = subparsers.add_parser('store', help="хранилище шаблонов по содержимому")
+    store_ops = store.add_subparsers(dest='op', required=True)
+    materialize = store_ops.add_parser('materialize', help="выгрузить шаблоны записи истории в папку")
+    materialize.add_argument('record_id', type=int, help="ID записи истории")
+    materialize.add_argument('dest_dir')
+    store_ops.add_parser('gc', help="удалить шаблоны, на которые не ссылается история")
+
+    profile = subparsers.add_parser('profile', help="профили сопоставления элементов схемы с ключами сценария")
+    profile_ops = profile.add_subparsers(dest='op', required=True)
+    capture = profile_ops.add_parser('capture', help="записать профиль схемы по сопоставлениям для сценария")
+    capture.add_argument('scenario')
+    capture.add_argument('xsd')
+    show = profile_ops.add_parser('show', help="показать профиль схемы")
+    show.add_argument('xsd')
+    delete = profile_ops.add_parser('delete', help="удалить профиль схемы")
+    delete.add_argument('xsd')
+
+    validate = subparsers.add_parser('validate', help="проверить готовые XML документы по схеме")
+    _add_validate_args(validate)
+
+    metrics = subparsers.add_parser('metrics', help="статистика длительности запусков из журнала метрик")
+    metrics.add_argument('--by', choices=DIMENSIONS, default='schema', help="разрез статистики")
+    metrics.add_argument('--metric', choices=METRIC_KEYS, default='total_ms', help="этап запуска")
+    return parser
+
+
+def _add_validate_args(parser):
+    parser.add_argument('xsd')
+    parser.add_argument('documents', nargs='+', help="XML документы")
+    parser.add_argument('--max-errors', type=int, default=MAX_ERRORS,
+                        help="после скольких ошибок прекращать проверку документа")
+
+
+def _regenerate_project(args):
+    from logic.single_instance import is_running
+    if is_running():
+        # Историю пишет только окно: иначе сохранения окна и командной строки затирают друг друга
+        print("Окно приложения открыто: перегенерируйте проект из него или закройте окно", file=sys.stderr)
+        return 1
+    settings = _open_settings()
+    history_settings = _load_json_setting(settings, "history")
+    group_settings = _load_json_setting(settings, "groups")
+
+    members = group_settings.get('groups', {}).get(args.project)
+    if members is None:
+        print(f"Проект '{args.project}' не найден", file=sys.stderr)
+        return 1
+    member_ids = {int(item_id) for item_id in members}
+    records = [record for record in history_settings.get('history', []) if record.get('id') in member_ids]
+
+    def on_progress(done, total, record, status):
+        print(f"[{done}/{total}] {status}: {record.get('file', '').replace(chr(10), ' | ')}", flush=True)
+
+    store = OutputStore() if settings.value("use_output_store", False, type=bool) else None
+    summary = regenerate_records(records, args.workers, args.force, on_progress, store)
+    apply_updates(summary)
+    settings.setValue("history", json.dumps(history_settings))
+    settings.sync()
+    _print(summary)
+    return 1 if summary['failed'] else 0
+
+
+def _store_command(args):
+    history = _load_json_setting(_open_settings(), "history").get('history', [])
+    store = OutputStore()
+    if args.op == 'gc':
+        from logic.single_instance import is_running
+        if is_running():
+            # Ссылки на хранилище из записей, еще не сохраненных окном, не видны в настройках
+            print("Окно приложения открыто: очистите хранилище из него или закройте окно", file=sys.stderr)
+            return 1
+        _print(store.gc(referenced_digests(history)))
+        return 0
+
+    record = next((record for record in history if record.get('id') == args.record_id), None)
+    if record is None:
+        print(f"Запись {args.record_id} не найдена", file=sys.stderr)
+        return 1
+    try:
+        _print(materialize_record(record, store, args.dest_dir))
+    except (OSError, ValueError) as e:
+        print(e, file=sys.stderr)
+        return 1
+    return 0
+
+
+def _profile_command(args):
+    try:
+        if args.op == 'capture':
+            scenario, structure = FileProcessor._stage_load(args.scenario, args.xsd)
+            generated = FileProcessor._stage_generate(scenario, structure, capture=True)
+            FileProcessor._stage_save_profile(args.xsd, generated)
+            _print(generated['mapping'])
+            return 0
+        schema_hash = FileProcessor._schema_hash(args.xsd)
+    except (OSError, ValueError, RuntimeError) as e:
+        print(e, file=sys.stderr)
+        return 1
+
+    if args.op == 'delete':
+        if not delete_profile(schema_hash):
+            print("Профиль схемы не найден", file=sys.stderr)
+            return 1
+        _print({'deleted': schema_hash})
+        return 0
+
+    profile = load_profile(schema_hash)
+    if profile is None:
+        print("Профиль схемы не найден", file=sys.stderr)
+        return 1
+    _print(profile.to_dict())
+    return 0
+
+
+def _validate_documents(args):
+    try:
+        validator = get_validator(FileProcessor._load_structure(args.xsd))
+    except (OSError, RuntimeError) as e:
+        print(e, file=sys.stderr)
+        return 1
+    invalid = 0
+    for path, errors in validator.iter_validate(args.documents, args.max_errors):
+        if errors:
+            invalid += 1
+            for error in errors:
+                location = f"{path}: {error['path']}" if error['path'] else path
+                print(f"{location}: {error['message']}")
+    print(f"Проверено документов: {len(args.documents)}, с ошибками: {invalid}", file=sys.stderr)
+    return 1 if invalid else 0
+
+
+def _metrics_report(args):
+    aggregator = MetricsAggregator()
+    aggregator.update()
+    rows = aggregator.report(args.by, args.metric)
+    if not rows:
+        print("В журнале метрик нет запусков", file=sys.stderr)
+        return 0
+    width = max(len(row[0]) for row in rows)
+    print(f"{'':<{width}}  {'запусков':>8}  {'p50, мс':>10}  {'p95, мс':>10}  {'макс., мс':>10}")
+    for key, count, p50, p95, peak in rows:
+        print(f"{key:<{width}}  {count:>8}  {p50:>10.1f}  {p95:>10.1f}  {peak:>10.1f}")
+    return 0
+
+
+def _print(result):
+    print(json.dumps(result, ensure_ascii=False, indent=2))
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+
+    if args.command == 'serve':
+        service = GenerationService(args.socket_path, args.port, args.workers).start()
+        address = f"127.0.0.1:{service.port}" if service.port is not None else service.socket_path
+        print(f"Сервис генерации слушает {address}", flush=True)
+        try:
+            service.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        return 0
+
+    if args.command == 'regenerate':
+        return _regenerate_project(args)
+
+    if args.command == 'store':
+        return _store_command(args)
+
+    if args.command == 'profile':
+        return _profile_command(args)
+
+    if args.command == 'validate':
+        return _validate_documents(args)
+
+    if args.command == 'metrics':
+        return _metrics_report(args)
+
+    with ServiceClient(args.socket_path, args.port) as client:
+        if args.op == 'build':
+            result = client.build_vm_template(args.scenario, args.xsd, args.output_dir, args.key_match, args.mapping,
+                                              args.project)
+        elif args.op == 'batch':
+            with open(args.jobs_file, encoding='utf-8') as f:
+                result = client.batch(json.load(f))
+        elif args.op == 'render':
+            result = client.render(args.template, args.scenario, args.xsd, args.output)
+        elif args.op == 'validate':
+            result = client.validate(args.xsd, args.documents, args.max_errors)
+        elif args.op == 'stats':
+            result = client.stats()
+        else:
+            result = client.shutdown()
+    _print(result)
+    if isinstance(result, dict) and result.get('success') is False:
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1 +1,29 @@
-APP_DB_NAME = "GosMost"
\ No newline at end of file
+import os
+import tempfile
+
+APP_DB_NAME = "GosMost"
+
+# Подкоманды командной строки (cli.py): с ними main.py не запускает окно.
+# Список здесь, чтобы main.py проверял аргумент, не импортируя cli и логику генерации
+CLI_COMMANDS = ('serve', 'submit', 'regenerate', 'store', 'profile', 'validate', 'metrics')
+
+# Сервис генерации (python main.py serve)
+SERVICE_SOCKET = os.path.join(tempfile.gettempdir(), "gosmost.sock")
+SERVICE_PORT = 8765
+
+# Сокет единственного экземпляра окна: повторный запуск передает ему свои аргументы
+INSTANCE_NAME = "gosmost-gui-" + os.path.basename(os.path.expanduser("~"))
+
+# Хранилище результатов по содержимому (включается в меню «Файл» окна)
+OUTPUT_STORE_DIR = os.path.join(os.path.expanduser("~"), ".gosmost", "store")
+PROFILE_DIR = os.path.join(os.path.expanduser("~"), ".gosmost", "profiles")
+
+# Каталог локальных копий подключаемых схем (xs:include/xs:import):
+# {"schemaLocation или пространство имен": "путь относительно папки каталога"}
+SCHEMA_CATALOG = os.path.join(os.path.expanduser("~"), ".gosmost", "schemas", "catalog.json")
+
+# Журнал метрик запусков генерации (JSON Lines, только дозапись)
+METRICS_LOG = os.path.join(os.path.expanduser("~"), ".gosmost", "metrics.jsonl")
+
+# Карты сегментов прошлых запусков по папкам результатов: повторная генерация пересобирает только изменившиеся узлы
+INCREMENTAL_DIR = os.path.join(os.path.expanduser("~"), ".gosmost", "incremental")
@@ -0,0 +1,145 @@
+import asyncio
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from logic.file_processor import FileProcessor
+from logic.key_matcher import MODE_FUZZY
+from logic.mapping_profile import MAPPING_AUTO
+
+
+class AsyncFileProcessor:
+    """
+    Асинхронная обертка над FileProcessor для встраивания в asyncio сервисы.
+    Чтение/запись файлов и генерация выполняются в отдельных ограниченных пулах, цикл событий не блокируется.
+    Число одновременных генераций ограничено max_concurrency; отмена задачи срабатывает между этапами.
+    Задания с одной папкой результатов выполняются по очереди, с разными — параллельно.
+    """
+
+    def __init__(self, max_concurrency=8, io_workers=4, cpu_workers=2, cpu_executor=None):
+        self.max_concurrency = max_concurrency
+        self.io_executor = ThreadPoolExecutor(max_workers=io_workers, thread_name_prefix="gosmost-io")
+        self._own_cpu_executor = cpu_executor is None
+        self.cpu_executor = cpu_executor or ThreadPoolExecutor(max_workers=cpu_workers,
+                                                               thread_name_prefix="gosmost-cpu")
+        self._semaphore = None
+        self._semaphore_loop = None
+        # Блокировки папок результатов: папка -> asyncio.Lock; привязаны к циклу событий, как и семафор
+        self._output_locks = {}
+        self._output_locks_loop = None
+
+    def _get_semaphore(self):
+        # Семафор привязан к циклу событий, поэтому создается внутри работающего цикла
+        loop = asyncio.get_running_loop()
+        if self._semaphore is None or self._semaphore_loop is not loop:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+            self._semaphore_loop = loop
+        return self._semaphore
+
+    @staticmethod
+    def _output_dir(output_dir, scenario_path):
+        """
+        Папка результатов задания, приведенная к одному виду для разных записей одного пути.
+        Без нее шаблоны попали бы в текущую папку процесса, общую для всех заданий, поэтому такое задание отклоняется.
+        """
+        if not output_dir:
+            raise ValueError(f"Не указана папка результатов (output_dir) для {scenario_path}")
+        return os.path.normcase(os.path.abspath(output_dir))
+
+    def _output_lock(self, output_dir):
+        loop = asyncio.get_running_loop()
+        if self._output_locks_loop is not loop:
+            self._output_locks = {}
+            self._output_locks_loop = loop
+        lock = self._output_locks.get(output_dir)
+        if lock is None:
+            lock = self._output_locks[output_dir] = asyncio.Lock()
+        return lock
+
+    async def build_vm_template_async(self, scenario_path, xsd_path, output_dir, key_match=MODE_FUZZY,
+                                      mapping=MAPPING_AUTO, project=None):
+        """Асинхронный аналог FileProcessor.build_vm_template; возвращает такой же словарь результата"""
+        loop = asyncio.get_running_loop()
+        # Два задания в одну папку перезаписывали бы файлы и состояние друг друга. Очередь к папке
+        # ждется до семафора, чтобы ожидающее задание не занимало место работающего
+        async with self._output_lock(self._output_dir(output_dir, scenario_path)), self._get_semaphore():
+            # Этапы и их порядок те же, что у синхронного пути; здесь выбирается только пул для каждого этапа
+            steps = FileProcessor._build_steps(scenario_path, xsd_path, output_dir, key_match, mapping, project)
+            result = error = None
+            try:
+                while True:
+                    try:
+                        pool, function, args = steps.throw(error) if error is not None else steps.send(result)
+                    except StopIteration as stop:
+                        return stop.value
+                    executor = self.cpu_executor if pool == 'cpu' else self.io_executor
+                    result = error = None
+                    try:
+                        result = await loop.run_in_executor(executor, function, *args)
+                    except asyncio.CancelledError:
+                        raise
+                    except Exception as e:
+                        error = e
+            finally:
+                steps.close()
+
+    async def iter_build_vm_templates(self, jobs):
+        """
+        Выполняет пакет заданий и отдает (задание, результат) по мере готовности.
+        jobs — итерируемое словарей с ключами scenario_path, xsd_path, output_dir (и необязательными key_match, mapping, project).
+        В работе одновременно не больше max_concurrency заданий; при отмене или закрытии
+        генератора незавершенные задания отменяются.
+        """
+        jobs = iter(jobs)
+        pending = {}
+        try:
+            while True:
+                while len(pending) < self.max_concurrency:
+                    job = next(jobs, None)
+                    if job is None:
+                        break
+                    task = asyncio.ensure_future(self.build_vm_template_async(
+                        job['scenario_path'], job['xsd_path'], job.get('output_dir'),
+                        job.get('key_match', MODE_FUZZY), job.get('mapping', MAPPING_AUTO), job.get('project')))
+                    pending[task] = job
+                if not pending:
+                    return
+                done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    job = pending.pop(task)
+                    yield job, task.result()
+        finally:
+            for task in pending:
+                task.cancel()
+            if pending:
+                await asyncio.gather(*pending, return_exceptions=True)
+
+    def close(self):
+        self.io_executor.shutdown(wait=False)
+        if self._own_cpu_executor:
+            self.cpu_executor.shutdown(wait=False)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        self.close()
+
+
+_default_processor = None
+
+
+def _get_default_processor():
+    global _default_processor
+    if _default_processor is None:
+        _default_processor = AsyncFileProcessor()
+    return _default_processor
+
+
+async def build_vm_template_async(scenario_path, xsd_path, output_dir, key_match=MODE_FUZZY, mapping=MAPPING_AUTO,
+                                  project=None):
+    return await _get_default_processor().build_vm_template_async(scenario_path, xsd_path, output_dir, key_match,
+                                                                  mapping, project)
+
+
+def iter_build_vm_templates(jobs):
+    return _get_default_processor().iter_build_vm_templates(jobs)
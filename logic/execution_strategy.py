@@ -0,0 +1,123 @@
+import mmap
+import os
+import re
+
+from logic.schema_modules import resolve_reference
+
+# Начало сценария, по которому оцениваются число ключей и списков во всем файле
+SAMPLE_BYTES = 1024 * 1024
+
+# Выше этой оценки простых значений сценария индексы ключей держат по одной записи на ключ,
+# а карта значений строится только для плейсхолдеров шаблона
+COMPACT_INDEX_SCALARS = 200_000
+# Выше этого числа узлов схемы шаблоны пишутся в файлы порциями строк, без сборки целого текста.
+# Потоковая только запись результатов: сценарий и схема при любой стратегии загружаются целиком
+STREAM_OUTPUT_NODES = 20_000
+
+# Способы записи результатов (ключ 'output' решения)
+OUTPUT_MEMORY = 'memory'
+OUTPUT_STREAM = 'stream'
+INDEX_FULL = 'full'
+INDEX_COMPACT = 'compact'
+
+_JSON_KEY_RE = re.compile(rb'"\s*:')
+_XSD_ELEMENT_RE = re.compile(rb'<(?:[\w.-]+:)?element\b')
+_XSD_COMPLEX_RE = re.compile(rb'<(?:[\w.-]+:)?complexType\b[^>]*\bname\s*=')
+_XSD_LIST_RE = re.compile(rb'maxOccurs\s*=\s*["\'](?:unbounded|0*[2-9]|0*[1-9]\d+)["\']')
+_XSD_REFERENCE_RE = re.compile(rb'<(?:[\w.-]+:)?(?:include|import)\b[^>]*>')
+_XSD_REFERENCE_ATTR_RE = re.compile(rb'\b(schemaLocation|namespace)\s*=\s*["\']([^"\']*)["\']')
+
+
+def _file_size(path):
+    try:
+        return os.path.getsize(path)
+    except (OSError, TypeError):
+        return 0
+
+
+def estimate_scenario(path):
+    """
+    Оценка сценария по размеру файла и его началу: число простых значений (пар ключ-значение)
+    и списков. Для файлов меньше SAMPLE_BYTES оценка точна с точностью до ключей внутри строк.
+    """
+    size = _file_size(path)
+    estimates = {'scenario_bytes': size, 'scenario_keys': 0, 'scenario_lists': 0, 'scenario_exact': True}
+    if not size:
+        return estimates
+    with open(path, 'rb') as f:
+        sample = f.read(SAMPLE_BYTES)
+    scale = size / len(sample) if sample else 0
+    estimates['scenario_keys'] = int(len(_JSON_KEY_RE.findall(sample)) * scale)
+    estimates['scenario_lists'] = int(sample.count(b'[') * scale)
+    estimates['scenario_exact'] = len(sample) == size
+    return estimates
+
+
+def estimate_schema_file(path):
+    """
+    Оценка схемы, которой еще нет в кэше: объявления элементов, complexType и повторяющихся элементов
+    в файле схемы и в модулях, которые она подключает через xs:include/xs:import (файлы ищутся так же,
+    как при разборе, — resolve_reference). Раскрытие именованных типов дает узлов больше, поэтому это нижняя граница.
+    """
+    estimates = {'xsd_bytes': 0, 'schema_nodes': 0, 'complex_types': 0, 'schema_lists': 0,
+                 'schema_cached': False}
+    if not path:
+        return estimates
+    # Обход в ширину по ссылкам на модули, каждый файл один раз
+    pending = [os.path.abspath(path)]
+    seen = set(pending)
+    while pending:
+        current = pending.pop(0)
+        size = _file_size(current)
+        if not size:
+            continue
+        try:
+            with open(current, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                estimates['schema_nodes'] += sum(1 for _ in _XSD_ELEMENT_RE.finditer(data))
+                estimates['complex_types'] += sum(1 for _ in _XSD_COMPLEX_RE.finditer(data))
+                estimates['schema_lists'] += sum(1 for _ in _XSD_LIST_RE.finditer(data))
+                references = [dict(_XSD_REFERENCE_ATTR_RE.findall(match.group(0)))
+                              for match in _XSD_REFERENCE_RE.finditer(data)]
+        except (OSError, ValueError):
+            continue
+        estimates['xsd_bytes'] += size
+        base_dir = os.path.dirname(current)
+        for attributes in references:
+            location = attributes.get(b'schemaLocation')
+            namespace = attributes.get(b'namespace')
+            module = resolve_reference(location.decode('utf-8', 'replace') if location else None,
+                                       namespace.decode('utf-8', 'replace') if namespace else None, base_dir)
+            if module is not None and module not in seen:
+                seen.add(module)
+                pending.append(module)
+    return estimates
+
+
+def structure_estimates(structure, xsd_bytes, complex_types):
+    """Точные значения для схемы из кэша: узлы и повторяющиеся элементы разобранной структуры"""
+    nodes = lists = 0
+    stack = [structure]
+    while stack:
+        node = stack.pop()
+        nodes += 1
+        max_occurs = node.get('maxOccurs') or '1'
+        if max_occurs == 'unbounded' or (max_occurs.isdigit() and int(max_occurs) > 1):
+            lists += 1
+        stack.extend(node.get('children', []))
+    return {'xsd_bytes': xsd_bytes, 'schema_nodes': nodes, 'complex_types': complex_types, 'schema_lists': lists,
+            'schema_cached': True}
+
+
+def choose_strategy(estimates):
+    """
+    Стратегия выполнения по оценкам: маленькие входы идут самым коротким путем (все в памяти,
+    полные индексы, без пулов). Для больших сценариев индексы ключей компактные, для больших схем
+    шаблоны пишутся порциями строк (OUTPUT_STREAM). Входные файлы в обоих случаях разбираются целиком:
+    потоковая только запись, расход памяти на разбор схемы и сценария стратегия не меняет.
+    """
+    index = INDEX_COMPACT if estimates['scenario_keys'] > COMPACT_INDEX_SCALARS else INDEX_FULL
+    output = OUTPUT_STREAM if estimates['schema_nodes'] > STREAM_OUTPUT_NODES else OUTPUT_MEMORY
+    # Два файла результата при потоковой записи пишутся одновременно. Чтение сценария параллельно
+    # с разбором схемы не выигрывает: разбор JSON и XML идет под GIL
+    workers = 2 if output == OUTPUT_STREAM else 1
+    return {'index': index, 'output': output, 'workers': workers}
@@ -1,77 +1,600 @@
+import functools
+import hashlib
+import itertools
 import json
 import re
 import os
-import xml.etree.ElementTree as ET
+import threading
+import time
 from datetime import datetime
 from pathlib import Path
 from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+from logic.key_matcher import KeyMatcher, MODE_FUZZY, MODE_COMPAT
+from logic.mapping_profile import (MappingProfile, MAPPING_AUTO, MAPPING_CAPTURE, MISSING,
+                                   format_scenario_path, load_profile, save_profile)
+from logic.execution_strategy import (INDEX_COMPACT, OUTPUT_STREAM, choose_strategy, estimate_scenario,
+                                      estimate_schema_file, structure_estimates)
+from logic.run_metrics import RunMemory, append_run, make_record
+from logic.schema_modules import (NS, clear_module_cache, load_schema_graph, parse_schema_root,
+                                  stamps_unchanged)
+from logic.segment_map import (FOOTER_LINES, HEADER_LINES, SegmentTracker, drop_state, file_stamp, load_previous,
+                               load_state, save_state, scenario_digest, splice_write)
+from logic.lazy_values import describe_markers, find_values, load_json_lazily, write_expanded
 
 
 class FileProcessor:
+    # Разобранные XSD: путь -> (отметки файлов графа модулей, структура, sha256 графа, граф).
+    # Общий для окна, сервиса и пакетных запусков
+    _schema_cache = {}
+    _schema_cache_lock = threading.Lock()
+    # Планы генерации: id структуры -> (структура, план); старые планы вытесняются в порядке добавления
+    _plan_cache = {}
+    _plan_cache_lock = threading.Lock()
+    PLAN_CACHE_SIZE = 32
+    # ${ph} или $ph не после буквы или $ и не перед буквой или точкой (как при замене по одному плейсхолдеру)
+    _PLACEHOLDER_RE = re.compile(r"\$\{([A-Za-z0-9_\.]+)\}|(?<![\w\$])\$([A-Za-z0-9_\.]+)(?![\w\.])")
+    # Строк шаблона в одной порции при потоковой записи
+    WRITE_CHUNK_LINES = 4096
+
     @staticmethod
     def process_file(filepath):
         # Заглушка для обработки файла
         return f"Обработан {os.path.basename(filepath)} ({datetime.now().strftime('%H:%M:%S')})"
 
     @staticmethod
-    def build_vm_template(scenario_path, xsd_path, output_dir=None):
+    def build_vm_template(scenario_path, xsd_path, output_dir=None, key_match=MODE_FUZZY, mapping=MAPPING_AUTO,
+                          project=None):
         """
         Генерирует адаптивный Velocity шаблон из трех входных файлов
         Возвращает два файла: template_raw.vm (чистый шаблон) и template_generated.vm (с частичной подстановкой)
+        key_match — сопоставление имен элементов с ключами сценария: 'fuzzy' или прежнее 'compat'
+        mapping — профиль сопоставления схемы: 'auto' (применить сохраненный), 'off' или 'capture' (сохранить)
+        project — проект запуска для журнала метрик
+        Способ выполнения выбирается по предварительной оценке входов (_stage_prescan) и возвращается в 'strategy'.
+        Повторный запуск в ту же папку пересобирает только изменившиеся узлы схемы (_stage_segments),
+        что сделано — в 'incremental'.
         """
+        return FileProcessor._run_steps(FileProcessor._build_steps(scenario_path, xsd_path, output_dir, key_match,
+                                                                   mapping, project))
+
+    @staticmethod
+    def _build_steps(scenario_path, xsd_path, output_dir, key_match, mapping, project):
+        """
+        Последовательность этапов build_vm_template, общая для синхронного и асинхронного API.
+        Генератор отдает этапы (пул, функция, аргументы) — пул 'io' для файлов или 'cpu' для генерации —
+        и получает результат этапа через send, а ошибку этапа через throw; словарь результата
+        возвращается как значение StopIteration. Выполняет этапы _run_steps или AsyncFileProcessor.
+        """
+        started = time.perf_counter()
+        memory = RunMemory()
+        timings = {}
+        generated = paths = strategy = schema_hash = None
         try:
-            # Обработка пути для сохранения
-            if output_dir is None or output_dir == "":
-                output_dir = Path.cwd()
-            else:
-                output_dir = Path(output_dir)
-
-            # Создаем директорию, если она не существует
-            output_dir.mkdir(parents=True, exist_ok=True)
-
-            # Загрузка и парсинг файлов
-            scenario = FileProcessor._load_maybe_json(scenario_path)
-            xsd_text = Path(xsd_path).read_text(encoding='utf-8')
-
-            # Парсинг XSD структуры
-            structure = FileProcessor._parse_xsd(xsd_text)
-            if structure is None:
-                raise RuntimeError("Не удалось распознать структуру из XSD. Проверьте файл схемы вида сведений.")
-
-            # Генерация сырого VM шаблона
-            raw_vm = FileProcessor._generate_raw_vm(structure, scenario)
-
-            # Частичная подстановка значений
-            filled_vm, replacements = FileProcessor._partially_render_vm(raw_vm, scenario, structure)
-
-            # Сохранение результатов
-            raw_output_path = output_dir / "template_raw.vm"
-            filled_output_path = output_dir / "template_generated.vm"
-
-            raw_output_path.write_text(raw_vm, encoding='utf-8')
-            filled_output_path.write_text(filled_vm, encoding='utf-8')
-
-            result_info = {
-                'success': True,
-                'raw_output_path': str(raw_output_path.resolve()),
-                'filled_output_path': str(filled_output_path.resolve()),
-                'output_dir': str(output_dir.resolve()),
-                'root_element': structure.get('name', 'Неизвестно'),
-                'replacements_count': len(replacements),
-                'replacements_sample': dict(list(replacements.items())[:10]),  # первые 10 замен
-                'structure_summary': FileProcessor._summarize_structure(structure)
-            }
-            return result_info
+            output_dir = yield 'io', FileProcessor._prepare_output_dir, (output_dir,)
+            strategy = yield 'io', FileProcessor._stage_prescan, (scenario_path, xsd_path)
+            decision = strategy['decision']
+            scenario, structure = yield 'io', FileProcessor._stage_load, (scenario_path, xsd_path)
+            schema_hash = FileProcessor._loaded_schema_hash(xsd_path, structure)
+            profile = yield 'io', FileProcessor._stage_profile, (xsd_path, mapping)
+            segments = yield 'io', FileProcessor._stage_segments, (output_dir, scenario_path, key_match, profile)
+            timings['load_ms'] = (time.perf_counter() - started) * 1000
+            generated = yield 'cpu', FileProcessor._stage_generate, (scenario, structure, key_match, profile,
+                                                                     mapping == MAPPING_CAPTURE, decision, segments)
+            if mapping == MAPPING_CAPTURE:
+                yield 'io', FileProcessor._stage_save_profile, (xsd_path, generated)
+            stage_started = time.perf_counter()
+            paths = yield 'io', FileProcessor._stage_write, (output_dir, generated, decision)
+            timings['write_ms'] = (time.perf_counter() - stage_started) * 1000
+            result = FileProcessor._make_result(output_dir, structure, generated, paths)
+            result['strategy'] = strategy
+            result['metrics'] = yield 'io', functools.partial(
+                FileProcessor._log_run, scenario_path, xsd_path, project, started, timings, generated, paths,
+                memory=memory, schema_hash=schema_hash, key_match=key_match, mapping=mapping, strategy=decision), ()
+            return result
 
         except Exception as e:
+            yield 'io', functools.partial(
+                FileProcessor._log_run, scenario_path, xsd_path, project, started, timings, generated, paths,
+                error=str(e), memory=memory, schema_hash=schema_hash, key_match=key_match, mapping=mapping,
+                strategy=strategy['decision'] if strategy else None), ()
             return {
                 'success': False,
                 'error': str(e)
             }
+        finally:
+            # Запуск, прерванный без записи в журнал (отмена асинхронной задачи), тоже завершает замер
+            memory.stop()
+
+    @staticmethod
+    def _run_steps(steps):
+        """Выполняет этапы генератора _build_steps в текущем потоке и возвращает результат"""
+        result = error = None
+        while True:
+            try:
+                _, function, args = steps.throw(error) if error is not None else steps.send(result)
+            except StopIteration as stop:
+                return stop.value
+            result = error = None
+            try:
+                result = function(*args)
+            except Exception as e:
+                error = e
+
+    # Этапы build_vm_template вынесены отдельно, чтобы асинхронный API мог выполнять их в разных пулах
+
+    @staticmethod
+    def _prepare_output_dir(output_dir):
+        # Обработка пути для сохранения
+        if output_dir is None or output_dir == "":
+            output_dir = Path.cwd()
+        else:
+            output_dir = Path(output_dir)
+
+        # Создаем директорию, если она не существует
+        output_dir.mkdir(parents=True, exist_ok=True)
+        return output_dir
+
+    @staticmethod
+    def _stage_prescan(scenario_path, xsd_path):
+        """
+        Быстрая оценка входов до их разбора: размеры файлов, число ключей и списков сценария,
+        узлы и типы схемы (точно, если схема уже в кэше). Возвращает {'estimates', 'decision', 'prescan_ms'}.
+        """
+        started = time.perf_counter()
+        estimates = estimate_scenario(scenario_path)
+        structure = FileProcessor._cached_structure(xsd_path)
+        if structure is not None:
+            graph = FileProcessor._schema_graph(xsd_path)
+            modules = (graph.root, *graph.modules)
+            estimates.update(structure_estimates(structure, sum(module.size for module in modules),
+                                                 sum(len(module.complex_types) for module in modules)))
+        else:
+            estimates.update(estimate_schema_file(xsd_path))
+        return {'estimates': estimates, 'decision': choose_strategy(estimates),
+                'prescan_ms': round((time.perf_counter() - started) * 1000, 2)}
+
+    @staticmethod
+    def _stage_load(scenario_path, xsd_path):
+        # Загрузка и парсинг файлов. Параллельно с разбором схемы сценарий не читается: и json, и ElementTree
+        # держат GIL, так что второй поток только добавлял переключения
+        scenario = FileProcessor._load_maybe_json(scenario_path, lazy=True)
+
+        # Парсинг XSD структуры (повторные запуски с той же схемой берут ее из кэша)
+        structure = FileProcessor._load_structure(xsd_path)
+        return scenario, structure
+
+    @staticmethod
+    def _stage_profile(xsd_path, mapping=MAPPING_AUTO):
+        """Сохраненный профиль сопоставления схемы для режима 'auto', иначе None"""
+        if mapping != MAPPING_AUTO:
+            return None
+        return load_profile(FileProcessor._schema_hash(xsd_path))
+
+    @staticmethod
+    def _stage_segments(output_dir, scenario_path, key_match=MODE_FUZZY, profile=None):
+        """
+        Карта сегментов прошлого запуска в этой папке результатов для инкрементальной генерации:
+        {'context', 'scenario_stamp', 'previous'}. 'previous' — None, если прошлого запуска нет, он был с другим
+        сценарием, сопоставлением или профилем, или шаблоны в папке с тех пор меняли: тогда шаблон собирается целиком.
+        """
+        state = load_state(output_dir)
+        digest, stamp = scenario_digest(scenario_path, state)
+        profile_digest = None
+        if profile is not None:
+            profile_digest = hashlib.sha256(json.dumps(profile.to_dict(), sort_keys=True,
+                                                       ensure_ascii=False).encode('utf-8')).hexdigest()
+        context = {'scenario': digest, 'key_match': key_match, 'profile': profile_digest}
+        previous = load_previous(state, context, output_dir / "template_raw.vm", output_dir / "template_generated.vm")
+        return {'context': context, 'scenario_stamp': stamp, 'previous': previous}
+
+    @staticmethod
+    def _stage_generate(scenario, structure, key_match=MODE_FUZZY, profile=None, capture=False, decision=None,
+                        segments=None):
+        """
+        Генерация сырого шаблона и частичная подстановка значений.
+        При потоковой стратегии текст шаблонов не собирается: в результате остаются строки 'raw_lines',
+        а подстановка выполняется порциями при записи.
+        С segments (см. _stage_segments) шаблоны собираются строками с картой сегментов: неизменившиеся узлы
+        и их подстановки берутся из прошлого запуска, а запись меняет в файлах только отличающиеся строки.
+        """
+        if capture:
+            # При записи профиля каждый путь должен пройти сопоставление заново
+            segments = None
+        started = time.perf_counter()
+        fragment_stats = {}
+        resolutions = None
+        if capture:
+            if key_match == MODE_COMPAT:
+                raise ValueError("Профиль можно записать только при нечетком сопоставлении ключей")
+            resolutions = {}
+        compact = decision is not None and decision['index'] == INDEX_COMPACT
+        stream = decision is not None and decision['output'] == OUTPUT_STREAM
+        raw_vm = FileProcessor._generate_raw_vm(structure, scenario, fragment_stats, key_match, profile, resolutions,
+                                                compact=compact, as_lines=stream or segments is not None,
+                                                segments=segments)
+        rendered = time.perf_counter()
+
+        # Частичная подстановка значений
+        render_stats = {}
+        filled_lines = None
+        incremental = {'mode': 'off'}
+        if segments is not None:
+            filled_lines, replacements, incremental = FileProcessor._render_segments(
+                raw_vm, segments, scenario, structure, profile, render_stats)
+            filled_vm = None
+        else:
+            filled_vm, replacements = FileProcessor._partially_render_vm(raw_vm, scenario, structure, profile,
+                                                                         render_stats, compact=compact)
+        stale_rules = profile.stale_rules(scenario) if profile is not None else []
+        as_text = isinstance(raw_vm, str)
+        # Маркеры длинных значений сценария, которые попали в шаблоны; раскрываются при записи
+        lazy_values = find_values(itertools.chain([raw_vm] if as_text else raw_vm, replacements.values()))
+        return {
+            'raw_vm': raw_vm if as_text else None,
+            'filled_vm': filled_vm,
+            'raw_lines': None if as_text else raw_vm,
+            'filled_lines': filled_lines,
+            'replacements': replacements,
+            'placeholders_count': render_stats['placeholders'],
+            'timings': {
+                'generate_ms': (rendered - started) * 1000,
+                'render_ms': (time.perf_counter() - rendered) * 1000,
+            },
+            'fragment_stats': fragment_stats,
+            'mapping': {
+                'applied': profile is not None,
+                'rules': len(profile.rules) if profile is not None else 0,
+                # Правила, пути которых нет в сценарии: для этих элементов значение искалось эвристикой
+                'stale_rules': len(stale_rules),
+                'stale_examples': stale_rules[:10],
+            },
+            'resolutions': resolutions,
+            'segments': segments,
+            'incremental': incremental,
+            'lazy_values': lazy_values
+        }
+
+    @staticmethod
+    def _count_placeholders(counts, lines, start, end, sign=1):
+        """Добавляет (sign=1) или вычитает (sign=-1) вхождения плейсхолдеров в строках lines[start:end]"""
+        step = FileProcessor.WRITE_CHUNK_LINES
+        for chunk_start in range(start, end, step):
+            chunk = "\n".join(lines[chunk_start:min(chunk_start + step, end)])
+            for ph in re.findall(r"\$\{?([A-Za-z0-9_\.]+)\}?", chunk):
+                counts[ph] = counts.get(ph, 0) + sign
+
+    @staticmethod
+    def _substitute_lines(lines, start, end, replacements):
+        """Строки lines[start:end] с подставленными значениями (замена с переводом строки дает больше строк)"""
+        if start >= end:
+            return []
+        if not replacements:
+            return lines[start:end]
+
+        def substitute(match):
+            return replacements.get(match.group(1) or match.group(2), match.group(0))
+
+        return FileProcessor._PLACEHOLDER_RE.sub(substitute, "\n".join(lines[start:end])).split("\n")
+
+    @staticmethod
+    def _render_segments(raw_lines, segments, scenario, structure, profile=None, stats=None):
+        """
+        Частичная подстановка по карте сегментов; возвращает (строки заполненного шаблона, замены, статистика).
+        Вхождения плейсхолдеров пересчитываются только в строках, которые не скопированы из прошлого шаблона,
+        значения ищутся только для новых плейсхолдеров и тех, что берутся из имен структуры.
+        Скопированные строки берутся из прошлого заполненного шаблона, если их замены не изменились.
+        """
+        tracker, previous = segments['tracker'], segments['previous']
+        body_end = len(raw_lines) - FOOTER_LINES
+        reused = sorted(tracker.reused, key=lambda span: span[0])
+        disjoint = all(reused[n][0] >= reused[n - 1][1] for n in range(1, len(reused)))
+
+        # Свежие строки нового тела — промежутки между скопированными диапазонами
+        fresh = []
+        position = HEADER_LINES
+        for old_start, old_end, new_start in tracker.reused:
+            fresh.append((position, HEADER_LINES + new_start))
+            position = HEADER_LINES + new_start + old_end - old_start
+        fresh.append((position, body_end))
+
+        counts = {}
+        fixed = {}
+        old_counts = {}
+        by_structure = set()
+        if previous is not None and disjoint:
+            old_counts = previous.state['placeholder_counts']
+            counts = dict(old_counts)
+            fixed = dict(previous.state['resolved'])
+            # Прошлые плейсхолдеры без значения из профиля или сценария: сценарий тот же, остается структура
+            by_structure = {ph for ph in old_counts if ph not in fixed}
+            position = 0
+            for old_start, old_end, _ in reused:
+                FileProcessor._count_placeholders(counts, previous.lines, position, old_start, -1)
+                position = old_end
+            FileProcessor._count_placeholders(counts, previous.lines, position, len(previous.lines), -1)
+            for start, end in fresh:
+                FileProcessor._count_placeholders(counts, raw_lines, start, end)
+        else:
+            FileProcessor._count_placeholders(counts, raw_lines, HEADER_LINES, body_end)
+        counts = {ph: count for ph, count in counts.items() if count > 0}
+        placeholders = {ph for ph in counts
+                        if ph.lower() not in ('foreach', 'end', 'if', 'else', 'set') and not ph.isdigit()}
+        if stats is not None:
+            stats['placeholders'] = len(placeholders)
+        # Карта значений строится только для ключей новых плейсхолдеров (результат тот же, что у полной карты)
+        old_replacements = previous.state['replacements'] if previous is not None else {}
+        replacements = {}
+        if by_structure and previous.state['plan_digest'] == tracker.plan_digest:
+            # План тот же, значит те же и имена элементов структуры: их значения остаются прежними
+            for ph in by_structure & placeholders:
+                if ph in old_replacements:
+                    replacements[ph] = old_replacements[ph]
+            placeholders_left = placeholders - by_structure
+        else:
+            placeholders_left = placeholders
+        replacements.update(FileProcessor._resolve_placeholders(placeholders_left, scenario, structure, profile, True,
+                                                                fixed, by_structure))
+
+        header = raw_lines[:HEADER_LINES]
+        footer = raw_lines[body_end:]
+        stable = (previous is not None and disjoint and previous.filled_body is not None
+                  and all(old_replacements.get(ph) == replacements.get(ph) for ph in placeholders if ph in old_counts))
+        if stable:
+            filled_lines = list(header)
+            for (start, end), span in zip(fresh, tracker.reused + [None]):
+                filled_lines.extend(FileProcessor._substitute_lines(raw_lines, start, end, replacements))
+                if span is not None:
+                    filled_lines.extend(previous.filled_body[span[0]:span[1]])
+            filled_lines.extend(footer)
+        else:
+            filled_lines = header + FileProcessor._substitute_lines(raw_lines, HEADER_LINES, body_end,
+                                                                    replacements) + footer
+
+        segments['state'] = {
+            'context': segments['context'],
+            'scenario_stamp': segments['scenario_stamp'],
+            'body_lines': body_end - HEADER_LINES,
+            'plan_digest': tracker.plan_digest,
+            'records': tracker.records,
+            'events': tracker.events,
+            'placeholder_counts': counts,
+            'resolved': {ph: value for ph, value in fixed.items() if ph in counts},
+            'replacements': replacements,
+        }
+        incremental = {
+            'mode': 'incremental' if previous is not None else 'full',
+            'reused_nodes': tracker.reused_nodes,
+            'reused_lines': sum(old_end - old_start for old_start, old_end, _ in tracker.reused),
+            'filled_reused': stable,
+        }
+        return filled_lines, replacements, incremental
+
+    @staticmethod
+    def _stage_save_profile(xsd_path, generated):
+        """Сохраняет сопоставления этого запуска как профиль схемы"""
+        profile = MappingProfile(generated['resolutions'], schema_hash=FileProcessor._schema_hash(xsd_path))
+        generated['mapping']['captured'] = str(save_profile(profile))
+        generated['mapping']['rules'] = len(profile.rules)
+
+    @staticmethod
+    def _log_run(scenario_path, xsd_path, project, started, timings, generated=None, paths=None, error=None,
+                 memory=None, schema_hash=None, **fields):
+        """
+        Дописывает запись о запуске в журнал метрик и возвращает ее.
+        memory — RunMemory запуска, schema_hash — хэш схемы, по которой он шел.
+        Журнал вспомогательный: ошибка записи в него не влияет на результат генерации.
+        """
+        timings = dict(timings)
+        if memory is not None:
+            fields.update(memory.stop())
+        if generated is not None:
+            timings.update(generated['timings'])
+            stats = generated['fragment_stats']
+            fields.update(schema_nodes=stats.get('schema_nodes'), plan_cached=stats.get('plan_cached'),
+                          placeholders=generated['placeholders_count'],
+                          replacements=len(generated['replacements']),
+                          incremental=generated['incremental']['mode'])
+        timings['total_ms'] = (time.perf_counter() - started) * 1000
+        sizes = {'scenario_bytes': scenario_path, 'xsd_bytes': xsd_path}
+        for key, path in sizes.items():
+            try:
+                fields[key] = os.path.getsize(path)
+            except (OSError, TypeError):
+                fields[key] = None
+        if paths is not None:
+            fields['output_bytes'] = sum(os.path.getsize(path) for path in paths)
+        if error is not None:
+            fields['error'] = error
+        record = make_record(scenario_path, xsd_path, project, timings, error is None, schema_hash, **fields)
+        try:
+            append_run(record)
+        except OSError:
+            pass
+        return record
+
+    @staticmethod
+    def _stage_write(output_dir, generated, decision=None):
+        # Сохранение результатов
+        raw_output_path = output_dir / "template_raw.vm"
+        filled_output_path = output_dir / "template_generated.vm"
+
+        if generated.get('segments') is not None:
+            return FileProcessor._write_segments(raw_output_path, filled_output_path, generated)
+
+        lazy_values = generated.get('lazy_values')
+        if generated.get('raw_lines') is None:
+            if lazy_values:
+                FileProcessor._write_lines(raw_output_path, [generated['raw_vm']], lazy_values=lazy_values)
+                FileProcessor._write_lines(filled_output_path, [generated['filled_vm']], lazy_values=lazy_values)
+            else:
+                raw_output_path.write_text(generated['raw_vm'], encoding='utf-8')
+                filled_output_path.write_text(generated['filled_vm'], encoding='utf-8')
+            return raw_output_path, filled_output_path
+
+        lines, replacements = generated['raw_lines'], generated['replacements']
+        if decision is not None and decision['workers'] > 1:
+            with ThreadPoolExecutor(max_workers=2, thread_name_prefix="gosmost-write") as pool:
+                raw_future = pool.submit(FileProcessor._write_lines, raw_output_path, lines, None, lazy_values)
+                FileProcessor._write_lines(filled_output_path, lines, replacements, lazy_values)
+                raw_future.result()
+        else:
+            FileProcessor._write_lines(raw_output_path, lines, lazy_values=lazy_values)
+            FileProcessor._write_lines(filled_output_path, lines, replacements, lazy_values)
+        return raw_output_path, filled_output_path
+
+    @staticmethod
+    def _write_segments(raw_output_path, filled_output_path, generated):
+        """
+        Запись по карте сегментов: поверх шаблонов прошлого запуска пишутся только отличающиеся строки
+        (splice_write), иначе файлы пишутся целиком. Затем сохраняется карта сегментов для следующего запуска.
+        """
+        segments = generated['segments']
+        previous = segments['previous']
+        raw_lines, filled_lines = generated['raw_lines'], generated['filled_lines']
+        lazy_values = generated.get('lazy_values')
+        if lazy_values:
+            # Строки с маркерами длинных значений не совпадают со строками файлов: пишем целиком и без карты
+            FileProcessor._write_lines(raw_output_path, raw_lines, lazy_values=lazy_values)
+            FileProcessor._write_lines(filled_output_path, filled_lines, lazy_values=lazy_values)
+            generated['incremental'].update(mode='full', bytes_written=os.path.getsize(raw_output_path)
+                                            + os.path.getsize(filled_output_path))
+            drop_state(raw_output_path.parent)
+            return raw_output_path, filled_output_path
+        if previous is not None:
+            written = (splice_write(raw_output_path, previous.raw_lines, raw_lines)
+                       + splice_write(filled_output_path, previous.filled_lines, filled_lines))
+        else:
+            FileProcessor._write_lines(raw_output_path, raw_lines)
+            FileProcessor._write_lines(filled_output_path, filled_lines)
+            written = os.path.getsize(raw_output_path) + os.path.getsize(filled_output_path)
+        generated['incremental']['bytes_written'] = written
+        save_state(raw_output_path.parent,
+                   dict(segments['state'], raw_stamp=file_stamp(raw_output_path),
+                        filled_stamp=file_stamp(filled_output_path)))
+        return raw_output_path, filled_output_path
+
+    @staticmethod
+    def _write_lines(path, lines, replacements=None, lazy_values=None):
+        """
+        Пишет строки шаблона порциями (тот же текст, что "\n".join(lines)).
+        С replacements плейсхолдеры заменяются в каждой порции: плейсхолдер не переходит через перевод строки,
+        поэтому результат совпадает с заменой по всему тексту.
+        lazy_values — маркеры длинных значений сценария раскрываются чтением из его файла (см. find_values).
+        """
+        def substitute(match):
+            return replacements.get(match.group(1) or match.group(2), match.group(0))
+
+        step = FileProcessor.WRITE_CHUNK_LINES
+        with open(path, 'w', encoding='utf-8', newline='') as f:
+            for start in range(0, len(lines), step):
+                chunk = "\n".join(lines[start:start + step])
+                if replacements:
+                    chunk = FileProcessor._PLACEHOLDER_RE.sub(substitute, chunk)
+                if start:
+                    f.write("\n")
+                if lazy_values:
+                    write_expanded(f, chunk, lazy_values)
+                else:
+                    f.write(chunk)
+
+    @staticmethod
+    def _make_result(output_dir, structure, generated, paths):
+        raw_output_path, filled_output_path = paths
+        replacements = generated['replacements']
+        lazy_values = generated.get('lazy_values') or {}
+        return {
+            'success': True,
+            'raw_output_path': str(raw_output_path.resolve()),
+            'filled_output_path': str(filled_output_path.resolve()),
+            'output_dir': str(output_dir.resolve()),
+            'root_element': structure.get('name', 'Неизвестно'),
+            'replacements_count': len(replacements),
+            'replacements_sample': {ph: describe_markers(value, lazy_values)  # первые 10 замен
+                                    for ph, value in list(replacements.items())[:10]},
+            'structure_summary': FileProcessor._summarize_structure(structure),
+            'structure': structure,
+            'fragment_cache': generated['fragment_stats'],
+            'mapping_profile': generated['mapping'],
+            'incremental': generated['incremental'],
+            'lazy_values': {'count': len(lazy_values), 'bytes': sum(value.size for value in lazy_values.values())}
+        }
+
+    @staticmethod
+    def _load_structure(xsd_path):
+        """
+        Возвращает разобранную структуру XSD вместе с типами из xs:include/xs:import.
+        Структура собирается заново, только если изменился файл схемы или одного из ее модулей;
+        неизменившиеся модули берутся из общего кэша schema_modules.
+        """
+        key = os.path.abspath(xsd_path)
+        with FileProcessor._schema_cache_lock:
+            cached = FileProcessor._schema_cache.get(key)
+        if cached is not None and stamps_unchanged(cached[0]):
+            return cached[1]
+
+        graph = load_schema_graph(key)
+        if cached is not None and cached[2] == graph.digest:
+            # Файлы тронуты, но содержимое прежнее: структура и планы генерации остаются в силе
+            structure = cached[1]
+        else:
+            structure = FileProcessor._build_structure(graph.root.root, graph.modules)
+        if structure is None:
+            raise RuntimeError("Не удалось распознать структуру из XSD. Проверьте файл схемы вида сведений.")
+        with FileProcessor._schema_cache_lock:
+            FileProcessor._schema_cache[key] = (graph.stamps(), structure, graph.digest, graph)
+        return structure
+
+    @staticmethod
+    def _cached_structure(xsd_path):
+        """Структура схемы из кэша, если ни один файл ее графа не менялся; иначе None (без разбора)"""
+        with FileProcessor._schema_cache_lock:
+            cached = FileProcessor._schema_cache.get(os.path.abspath(xsd_path))
+        if cached is not None and stamps_unchanged(cached[0]):
+            return cached[1]
+        return None
+
+    @staticmethod
+    def _loaded_schema_hash(xsd_path, structure):
+        """Хэш схемы, из которой собрана structure; None, если кэш уже держит другую ее версию (без разбора)"""
+        with FileProcessor._schema_cache_lock:
+            cached = FileProcessor._schema_cache.get(os.path.abspath(xsd_path))
+        return cached[2] if cached is not None and cached[1] is structure else None
 
     @staticmethod
-    def _load_maybe_json(path):
-        """Загружает файл, пытаясь распарсить как JSON, иначе возвращает текст"""
+    def _schema_hash(xsd_path):
+        """SHA-256 содержимого XSD и ее модулей; считается вместе с разбором и берется из того же кэша"""
+        FileProcessor._load_structure(xsd_path)
+        with FileProcessor._schema_cache_lock:
+            return FileProcessor._schema_cache[os.path.abspath(xsd_path)][2]
+
+    @staticmethod
+    def _schema_graph(xsd_path):
+        """Граф модулей схемы (SchemaGraph) из того же кэша, что и структура"""
+        FileProcessor._load_structure(xsd_path)
+        with FileProcessor._schema_cache_lock:
+            return FileProcessor._schema_cache[os.path.abspath(xsd_path)][3]
+
+    @staticmethod
+    def clear_schema_cache():
+        clear_module_cache()
+        with FileProcessor._schema_cache_lock:
+            FileProcessor._schema_cache.clear()
+        with FileProcessor._plan_cache_lock:
+            FileProcessor._plan_cache.clear()
+
+    @staticmethod
+    def _load_maybe_json(path, lazy=False):
+        """
+        Загружает файл, пытаясь распарсить как JSON, иначе возвращает текст.
+        lazy — длинные строки (вложения base64) не читаются в память, а остаются в файле как LazyValue
+        и раскрываются при записи шаблонов.
+        """
+        if lazy:
+            scenario = load_json_lazily(path)
+            if scenario is not None:
+                return scenario
         txt = Path(path).read_text(encoding='utf-8')
         try:
             return json.loads(txt)
@@ -89,34 +612,16 @@ class FileProcessor:
         return txt
 
     @staticmethod
-    def _parse_xsd(xsd_text):
-        try:
-            root = ET.fromstring(xsd_text.encode('utf-8'))
-        except Exception as e:
-            # попытаемся найти начало тега <xs: or <xsd:
-            m = re.search(r"<(xsd:|xs:)?schema", xsd_text)
-            if m:
-                idx = m.start()
-                root = ET.fromstring(xsd_text[idx:].encode('utf-8'))
-            else:
-                raise
-
-        # Сбор namespace map
-        nsmap = {}
-        for k, v in root.attrib.items():
-            if k.startswith("xmlns:"):
-                ns = k.split(":", 1)[1]
-                nsmap[ns] = v
-
-        # Стандартный XSD namespace
-        XSD_NS = ''
-        for prefix, uri in nsmap.items():
-            if uri in ("http://www.w3.org/2001/XMLSchema", "http://www.w3.org/2001/XMLSchema-instance"):
-                XSD_NS = uri
-        if not XSD_NS:
-            XSD_NS = "http://www.w3.org/2001/XMLSchema"
+    def _parse_xsd(xsd_text, modules=()):
+        return FileProcessor._build_structure(parse_schema_root(xsd_text), modules)
 
-        ns = {'xsd': XSD_NS, 'xs': XSD_NS}
+    @staticmethod
+    def _build_structure(root, modules=()):
+        """
+        Структура корневого элемента схемы. modules — подключенные модули (SchemaModule):
+        их именованные типы и глобальные элементы доступны наравне с объявленными в самой схеме.
+        """
+        ns = NS
 
         # Находим элементы
         elements = root.findall('.//xsd:element', ns)
@@ -130,77 +635,275 @@ class FileProcessor:
         if root_element is None and elements:
             root_element = elements[0]
 
-        # Собираем complex types
+        # Собираем complex types и simple types
         complex_types = {ct.get('name'): ct for ct in root.findall('.//xsd:complexType', ns) if ct.get('name')}
+        simple_types = {st.get('name'): st for st in root.findall('.//xsd:simpleType', ns) if st.get('name')}
+        global_elements = {el.get('name'): el for el in root.findall('xsd:element', ns) if el.get('name')}
+        # Типы модулей не перекрывают объявленные в самой схеме и в более близких модулях
+        for module in modules:
+            for name, ct in module.complex_types.items():
+                complex_types.setdefault(name, ct)
+            for name, st in module.simple_types.items():
+                simple_types.setdefault(name, st)
+            for name, el in module.elements.items():
+                global_elements.setdefault(name, el)
+
+        def element_children(ct):
+            seq = ct.find('.//xsd:sequence', ns)
+            if seq is None:
+                return []
+            # Префиксы xsd и xs указывают на одно пространство имен: один findall находит всех детей
+            return seq.findall('xsd:element', ns)
+
+        # Модели содержимого по complexType: тип -> (модель, элементы вне children)
+        content_models = {}
+
+        def content_model(ct, flat):
+            """
+            Модель содержимого complexType для проверки документов (xml_validator), если ее не описывает
+            одна последовательность children: дерево частиц {'kind': sequence|choice|all, 'minOccurs',
+            'maxOccurs', 'items'}, элемент в items — номер в children + extra_children. Частицы базовых типов
+            complexContent/extension идут перед собственными. xs:group, xs:any и базовые типы вне схемы
+            не разбираются: модель такого типа {'kind': 'open'}, порядок его детей не проверяется.
+            Возвращает (модель или None, элементы XSD, которых нет в flat).
+            """
+            cached = content_models.get(ct)
+            if cached is not None:
+                return cached
+            # Частицы типа от самого базового к производному
+            parts = []
+            is_open = False
+            current = ct
+            seen = set()
+            while True:
+                holder = current
+                derivation = None
+                complex_content = current.find('xsd:complexContent', ns)
+                if complex_content is not None:
+                    derivation = complex_content.find('xsd:extension', ns)
+                    if derivation is None:
+                        derivation = complex_content.find('xsd:restriction', ns)
+                    if derivation is not None:
+                        holder = derivation
+                particle = next((child for child in holder
+                                 if child.tag.rsplit('}', 1)[-1] in ('sequence', 'choice', 'all', 'group')), None)
+                if particle is not None:
+                    parts.append(particle)
+                # Ограничение (restriction) заменяет содержимое базового типа целиком
+                if derivation is None or derivation.tag.rsplit('}', 1)[-1] != 'extension':
+                    break
+                base = (derivation.get('base') or '').split(':', 1)[-1]
+                if base == 'anyType':
+                    break
+                if base not in complex_types or base in seen:
+                    is_open = True
+                    break
+                seen.add(base)
+                current = complex_types[base]
+            parts.reverse()
+
+            positions = {el: position for position, el in enumerate(flat)}
+            extra = []
+            top = {'kind': 'sequence', 'minOccurs': '1', 'maxOccurs': '1', 'items': []}
+            # Обход с явным стеком; элементы добавляются при снятии со стека, поэтому порядок items сохраняется
+            stack = [(part, top['items']) for part in reversed(parts)]
+            while stack and not is_open:
+                current, items = stack.pop()
+                tag = current.tag.rsplit('}', 1)[-1]
+                if tag == 'element':
+                    position = positions.get(current)
+                    if position is None:
+                        position = len(flat) + len(extra)
+                        extra.append(current)
+                    items.append(position)
+                elif tag in ('sequence', 'choice', 'all'):
+                    group = {'kind': tag, 'minOccurs': current.get('minOccurs') or '1',
+                             'maxOccurs': current.get('maxOccurs') or '1', 'items': []}
+                    items.append(group)
+                    for child in reversed(current):
+                        stack.append((child, group['items']))
+                elif tag in ('group', 'any'):
+                    is_open = True
+
+            if is_open:
+                model = {'kind': 'open'}
+                extra = []
+            elif not parts:
+                model = None
+            else:
+                model = top['items'][0] if len(top['items']) == 1 else top
+                # Одна последовательность из тех же детей: хватает children
+                if (not extra and model['kind'] == 'sequence' and model['minOccurs'] == '1'
+                        and model['maxOccurs'] == '1' and model['items'] == list(range(len(flat)))):
+                    model = None
+            content_models[ct] = (model, extra)
+            return model, extra
+
+        def element_facets(el, type_attr):
+            """
+            Ограничения значения простого элемента: базовый встроенный тип и фасеты restriction.
+            Цепочка именованных simpleType проходится до встроенного типа; перечисление берется
+            у самого производного типа, шаблоны всех уровней должны выполняться вместе.
+            """
+            facets = {}
+            st = el.find('xsd:simpleType', ns)
+            type_name = type_attr.split(':', 1)[-1] if type_attr else None
+            if st is None and type_name in complex_types:
+                # Нераскрытый рекурсивный complexType — содержимое не описывается фасетами
+                return facets
+            seen = set()
+            while True:
+                if st is None:
+                    if type_name in simple_types and type_name not in seen:
+                        seen.add(type_name)
+                        st = simple_types[type_name]
+                    else:
+                        if type_name and 'base' not in facets:
+                            facets['base'] = type_name
+                        break
+                restriction = st.find('xsd:restriction', ns)
+                st = None
+                if restriction is None:
+                    break
+                for facet in restriction:
+                    tag = facet.tag.rsplit('}', 1)[-1]
+                    value = facet.get('value')
+                    if value is None:
+                        continue
+                    if tag == 'enumeration':
+                        facets.setdefault('enumeration_levels', {}).setdefault(len(seen), []).append(value)
+                    elif tag == 'pattern':
+                        facets.setdefault('pattern', []).append(value)
+                    elif tag in ('length', 'minLength', 'maxLength') and tag not in facets:
+                        facets[tag] = int(value)
+                st = restriction.find('xsd:simpleType', ns)
+                base = restriction.get('base')
+                type_name = base.split(':', 1)[-1] if base else None
+            levels = facets.pop('enumeration_levels', None)
+            if levels:
+                facets['enumeration'] = levels[min(levels)]
+            return facets
 
         def parse_element(el):
-            name = el.get('name')
-            type_attr = el.get('type')
-            max_occurs = el.get('maxOccurs') or '1'
-            min_occurs = el.get('minOccurs') or '1'
-            node = {
-                'name': name,
-                'type': type_attr,
-                'minOccurs': min_occurs,
-                'maxOccurs': max_occurs,
-                'children': []
-            }
+            # Обход с явным стеком: (элемент XSD, список детей родителя, типы на пути от корня)
+            result = []
+            stack = [(el, result, ())]
+            while stack:
+                current, target, type_path = stack.pop()
+                max_occurs = current.get('maxOccurs') or '1'
+                min_occurs = current.get('minOccurs') or '1'
+                ref = current.get('ref')
+                if ref and not current.get('name'):
+                    # <xs:element ref="..."/>: объявление берем у глобального элемента, число вхождений — у ссылки
+                    ref_name = ref.split(':', 1)[-1]
+                    marker = '@' + ref_name
+                    if ref_name in global_elements and marker not in type_path:
+                        current = global_elements[ref_name]
+                        type_path = type_path + (marker,)
+                    name = ref_name
+                else:
+                    name = current.get('name')
+                type_attr = current.get('type')
+                node = {
+                    'name': name,
+                    'type': type_attr,
+                    'minOccurs': min_occurs,
+                    'maxOccurs': max_occurs,
+                    'children': []
+                }
+                target.append(node)
+
+                # Inline complexType?
+                child_elements = []
+                child_type_path = type_path
+                content_type = None
+                ct = current.find('xsd:complexType', ns)
+                if ct is not None:
+                    content_type = ct
+                    child_elements = element_children(ct)
+                elif type_attr and ':' in type_attr:
+                    # Тип, возможно complexType объявлен elsewhere
+                    tname = type_attr.split(':', 1)[1]
+                    # Рекурсивные типы не раскрываем повторно, иначе обход не закончится
+                    if tname in complex_types and tname not in type_path:
+                        content_type = complex_types[tname]
+                        child_elements = element_children(content_type)
+                        child_type_path = type_path + (tname,)
 
-            # Inline complexType?
-            ct = el.find('xsd:complexType', ns) or el.find('xs:complexType', ns)
-            if ct is not None:
-                seq = ct.find('.//xsd:sequence', ns) or ct.find('.//xs:sequence', ns)
-                if seq is not None:
-                    for child in seq.findall('xsd:element', ns) + seq.findall('xs:element', ns):
-                        node['children'].append(parse_element(child))
-            elif type_attr and ':' in type_attr:
-                # Тип, возможно complexType объявлен elsewhere
-                tname = type_attr.split(':', 1)[1]
-                if tname in complex_types:
-                    ct = complex_types[tname]
-                    seq = ct.find('.//xsd:sequence', ns) or ct.find('.//xs:sequence', ns)
-                    if seq is not None:
-                        for child in seq.findall('xsd:element', ns) + seq.findall('xs:element', ns):
-                            node['children'].append(parse_element(child))
-            return node
+                if ct is None and not child_elements:
+                    facets = element_facets(current, type_attr)
+                    if facets:
+                        node['facets'] = facets
+
+                if content_type is not None:
+                    model, extra_elements = content_model(content_type, child_elements)
+                    if model is not None:
+                        node['content'] = model
+                    if extra_elements:
+                        # Элементы модели, которых нет в шаблоне (ветви choice, дети базового типа):
+                        # нужны только проверке документов
+                        node['extra_children'] = []
+                        for child in reversed(extra_elements):
+                            stack.append((child, node['extra_children'], child_type_path))
+
+                for child in reversed(child_elements):
+                    stack.append((child, node['children'], child_type_path))
+            return result[0]
 
         structure = None
         if root_element is not None:
             structure = parse_element(root_element)
         return structure
 
+    @staticmethod
+    def _new_key_matcher(scenario, key_match=MODE_FUZZY, compact=False):
+        """Сопоставитель ключей на один сценарий; режим compat повторяет _deep_search_for_key"""
+        return KeyMatcher(scenario, key_match, FileProcessor._deep_search_for_key, compact)
+
     @staticmethod
     def _deep_search_for_key(obj, target_key):
         """Поиск значения по ключу (игнорируя регистр и подстроки). Возвращает первое найденное"""
         target = target_key.lower()
+        # Каждый кадр стека — генератор шагов для одного объекта; порядок обхода тот же, что у рекурсии
+        stack = [FileProcessor._deep_search_steps(obj, target)]
+        while stack:
+            step = next(stack[-1], None)
+            if step is None:
+                stack.pop()
+                continue
+            kind, value = step
+            if kind == 'found':
+                if value is not None:
+                    return value
+                # Прямое совпадение с пустым значением завершает поиск только в этом объекте
+                stack.pop()
+                continue
+            stack.append(FileProcessor._deep_search_steps(value, target))
+        return None
+
+    @staticmethod
+    def _deep_search_steps(obj, target):
+        """Шаги поиска по одному объекту: ('found', значение) или ('descend', вложенный объект)"""
         if isinstance(obj, dict):
             # Прямые совпадения сначала
             for k, v in obj.items():
                 if k.lower() == target:
-                    return v
+                    yield 'found', v
             for k, v in obj.items():
                 if target in k.lower() or k.lower() in target:
                     # Если v простое, вернем его; иначе продолжаем глубже
                     if isinstance(v, (str, int, float, bool)):
-                        return v
+                        yield 'found', v
                     # Если список с простыми значениями, вернем первое простое
                     if isinstance(v, list) and v and isinstance(v[0], (str, int, float, bool)):
-                        return v[0]
-                    # Иначе рекурсия
-                    found = FileProcessor._deep_search_for_key(v, target_key)
-                    if found is not None:
-                        return found
-            # Рекурсия в детей
+                        yield 'found', v[0]
+                    yield 'descend', v
+            # Спуск в детей
             for k, v in obj.items():
-                found = FileProcessor._deep_search_for_key(v, target_key)
-                if found is not None:
-                    return found
+                yield 'descend', v
         elif isinstance(obj, list):
             for item in obj:
-                found = FileProcessor._deep_search_for_key(item, target_key)
-                if found is not None:
-                    return found
-        return None
+                yield 'descend', item
 
     @staticmethod
     def _to_camel_case(s):
@@ -210,89 +913,311 @@ class FileProcessor:
         return parts[0] + ''.join(p.title() for p in parts[1:])
 
     @staticmethod
-    def _generate_vm_for_node(node, scenario, indent=2, list_name_overrides=None):
-        if list_name_overrides is None:
-            list_name_overrides = {}
+    def _build_list_index(scenario):
+        """
+        Строит индекс списков сценария на любой глубине.
+        Для каждого списка объектов, доступного из корня через словари, запоминает путь переменной,
+        набор ключей первого элемента и сам элемент; для всех списков (и вложенных в элементы других
+        списков) — первое простое значение каждого ключа среди элементов.
+        Списки верхнего уровня идут первыми (обход в ширину), как и при прежнем поиске.
+        """
+        index = {'entries': [], 'by_key': {}, 'values': {}}
+        if not isinstance(scenario, (dict, list)):
+            return index
+
+        # Очередь: (объект, путь через словари или None, последний ключ)
+        queue = [(scenario, '', None)]
+        pos = 0
+        while pos < len(queue):
+            obj, path, last_key = queue[pos]
+            pos += 1
+            if isinstance(obj, dict):
+                for k, v in obj.items():
+                    child_path = f"{path}.{k}" if path else k
+                    if isinstance(v, list):
+                        if v and isinstance(v[0], dict):
+                            # Velocity умеет обращаться к вложенным словарям через точку. Список внутри
+                            # элемента другого списка доступен только через переменную внешнего цикла,
+                            # а циклы шаблона не вкладываются, поэтому к нему #foreach не привязывается:
+                            # он дает только примеры значений
+                            entry = None
+                            if path is not None:
+                                entry = {
+                                    'order': len(index['entries']),
+                                    'var': child_path,
+                                    'keys': frozenset(v[0].keys()),
+                                    'item': v[0],
+                                }
+                                index['entries'].append(entry)
+                            for key, val in v[0].items():
+                                if entry is not None:
+                                    index['by_key'].setdefault(key, entry)
+                                if key not in index['values'] and isinstance(val, (str, int, float, bool)):
+                                    index['values'][key] = val
+                        queue.append((v, None, k))
+                    elif isinstance(v, dict):
+                        queue.append((v, child_path if path is not None else None, k))
+            elif isinstance(obj, list):
+                for item in obj:
+                    if isinstance(item, (dict, list)):
+                        queue.append((item, None, last_key))
+        return index
+
+    @staticmethod
+    def _find_list_binding(child_names, list_index):
+        """Возвращает запись индекса списка, ключи которого пересекаются с именами дочерних элементов"""
+        best = None
+        by_key = list_index['by_key']
+        for name in child_names:
+            entry = by_key.get(name)
+            if entry is not None and (best is None or entry['order'] < best['order']):
+                best = entry
+        return best
+
+    @staticmethod
+    def _new_fragment_cache():
+        """
+        Кэш сгенерированных фрагментов для повторяющихся именованных complexType в рамках одного сценария.
+        Фрагмент — содержимое элемента между его открывающим и закрывающим тегами.
+        """
+        return {'fragments': {}, 'hits': 0, 'misses': 0, 'lines_from_cache': 0}
+
+    @staticmethod
+    def _cached_fragment(fragment_cache, key, indent):
+        """Возвращает фрагмент из кэша с нужным отступом или None"""
+        fragment = fragment_cache['fragments'].get(key)
+        if fragment is None:
+            fragment_cache['misses'] += 1
+            return None
+        fragment_cache['hits'] += 1
+        fragment_cache['lines_from_cache'] += len(fragment)
         pad = " " * indent
-        lines = []
-        name = node['name']
-        tag = name
-        maxocc = node.get('maxOccurs', '1')
-        children = node.get('children', [])
-
-        if children:
-            if maxocc == 'unbounded' or (maxocc.isdigit() and int(maxocc) > 1):
-                # Список: создаем foreach
-                list_var = None
-                if isinstance(scenario, dict):
-                    for k, v in scenario.items():
-                        if isinstance(v, list):
-                            if v and isinstance(v[0], dict):
-                                item_keys = set(v[0].keys())
-                                child_key_names = set(ch['name'] for ch in children)
-                                if item_keys & child_key_names:
-                                    list_var = k
-                                    break
-                if not list_var:
-                    list_var = list_name_overrides.get(name, name + "List")
-                item_var = name.rstrip('s') if name.endswith('s') else name + "Item"
-                lines.append(f'{pad}#foreach(${item_var} in ${list_var})')
-                lines.append(f'{pad}<{tag}>')
-                for ch in children:
-                    child_lines = FileProcessor._generate_vm_for_node_inner(ch, scenario, indent + 2, item_var,
-                                                                            list_name_overrides)
-                    lines.extend(child_lines)
-                lines.append(f'{pad}</{tag}>')
-                lines.append(f'{pad}#end')
-            else:
-                lines.append(f'{pad}<{tag}>')
-                for ch in children:
-                    lines.extend(FileProcessor._generate_vm_for_node(ch, scenario, indent + 2, list_name_overrides))
-                lines.append(f'{pad}</{tag}>')
+        return [pad + line for line in fragment]
+
+    @staticmethod
+    def _store_fragment(fragment_cache, key, indent, lines):
+        # Храним фрагмент без отступа, чтобы переиспользовать его на любой глубине
+        fragment_cache['fragments'][key] = [line[indent:] for line in lines]
+
+    @staticmethod
+    def _get_plan(structure):
+        """
+        План генерации для структуры: (план, взят ли он из кэша).
+        План зависит только от схемы, поэтому строится один раз на разобранную структуру.
+        """
+        key = id(structure)
+        with FileProcessor._plan_cache_lock:
+            cached = FileProcessor._plan_cache.get(key)
+        # Структура хранится вместе с планом, поэтому ее id не может достаться другому объекту
+        if cached is not None and cached[0] is structure:
+            return cached[1], True
+        plan = FileProcessor._compile_plan(structure)
+        with FileProcessor._plan_cache_lock:
+            FileProcessor._plan_cache[key] = (structure, plan)
+            while len(FileProcessor._plan_cache) > FileProcessor.PLAN_CACHE_SIZE:
+                del FileProcessor._plan_cache[next(iter(FileProcessor._plan_cache))]
+        return plan, False
+
+    @staticmethod
+    def _compile_plan(structure):
+        """
+        Компилирует структуру в плоский список инструкций тела шаблона.
+        Все, что зависит только от схемы (теги, отступы, циклы, переменные элементов, ключи кэша фрагментов),
+        вычисляется здесь; значения и связанные списки сценария остаются слотами для _bind_plan:
+          ('open', отступ, ключ кэша, путь, конец, строка открытия)
+          ('loop', отступ, ключ кэша, путь, конец, открывающий тег, имена детей, переменная элемента, имя узла)
+          ('close', строки закрытия, закрывает ли цикл)
+          ('value', имя, путь, (префикс, суффикс) строки со значением, строка с плейсхолдером)
+          ('item', имя, префикс, суффикс, строка с плейсхолдером)
+        'конец' — индекс инструкции 'close' узла, к ней переходит попадание в кэш фрагментов.
+        """
+        if structure.get('children'):
+            roots = [(child, f"{structure['name']}/{child['name']}") for child in structure['children']]
         else:
-            # Простой элемент: пытаемся найти значение в сценарии
-            found = FileProcessor._deep_search_for_key(scenario, name)
-            varname = FileProcessor._to_camel_case(name)
-            if found is not None and isinstance(found, (str, int, float, bool)):
-                val = str(found).replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;')
-                lines.append(f'{pad}<{tag}>{val}</{tag}>')
-            else:
-                lines.append(f'{pad}<{tag}>${varname}</{tag}>')
-        return lines
+            roots = [(structure, structure['name'])]
+
+        signatures = FileProcessor._subtree_signatures(structure)
+        plan = []
+        for root, root_path in roots:
+            # ('enter', узел, отступ, переменная элемента, путь) | ('close', индекс открытия, строки, цикл)
+            stack = [('enter', root, 4, None, root_path)]
+            while stack:
+                op = stack.pop()
+                if op[0] == 'close':
+                    _, open_index, close_lines, is_loop = op
+                    plan[open_index] = plan[open_index][:4] + (len(plan),) + plan[open_index][5:]
+                    plan.append(('close', close_lines, is_loop))
+                    continue
+
+                _, node, indent, item_var, path = op
+                pad = " " * indent
+                name = node['name']
+                tag = name
+                maxocc = node.get('maxOccurs', '1')
+                children = node.get('children', [])
+
+                if children:
+                    child_item_var = item_var
+                    is_loop = item_var is None and (maxocc == 'unbounded' or (maxocc.isdigit() and int(maxocc) > 1))
+                    if is_loop:
+                        child_item_var = name.rstrip('s') if name.endswith('s') else name + "Item"
+                    # Содержимое повторяющегося именованного типа (без тегов самого элемента) генерируется
+                    # один раз для любых имен элементов: оно зависит от развернутого поддерева и переменной
+                    # элемента списка; внутри цикла к ключу при связывании добавляется еще и связанный список
+                    cache_key = None
+                    if node.get('type'):
+                        if child_item_var is None:
+                            cache_key = ('node', node['type'], signatures[id(node)])
+                        else:
+                            cache_key = ('inner', node['type'], child_item_var, signatures[id(node)])
+                    if is_loop:
+                        plan.append(('loop', indent, cache_key, path, None, f'{pad}<{tag}>',
+                                     tuple(ch['name'] for ch in children), child_item_var, name))
+                        stack.append(('close', len(plan) - 1, (f'{pad}</{tag}>', f'{pad}#end'), True))
+                    else:
+                        plan.append(('open', indent, cache_key, path, None, f'{pad}<{tag}>'))
+                        stack.append(('close', len(plan) - 1, (f'{pad}</{tag}>',), False))
+                    for ch in reversed(children):
+                        stack.append(('enter', ch, indent + 2, child_item_var, f"{path}/{ch['name']}"))
+                elif item_var is None:
+                    varname = FileProcessor._to_camel_case(name)
+                    plan.append(('value', name, path, (f'{pad}<{tag}>', f'</{tag}>'),
+                                 f'{pad}<{tag}>${varname}</{tag}>'))
+                else:
+                    plan.append(('item', name, f'{pad}<{tag}>', f'</{tag}>',
+                                 f'{pad}<{tag}>${{{item_var}.{name}}}</{tag}>'))
+        return plan
 
     @staticmethod
-    def _generate_vm_for_node_inner(node, scenario, indent, item_var, list_name_overrides=None):
-        pad = " " * indent
+    def _subtree_signatures(structure):
+        """
+        Отпечатки развернутых поддеревьев для ключей кэша фрагментов: id(узел) -> хэш имен, maxOccurs
+        и отпечатков детей. Одного типа для ключа мало: рекурсивный тип не раскрывается повторно
+        на своем же пути, и поддерево одного и того же типа зависит от того, где стоит элемент.
+        """
+        signatures = {}
+        # Обход в обратном порядке: отпечаток узла считается после отпечатков всех его детей
+        stack = [(structure, False)]
+        while stack:
+            node, expanded = stack.pop()
+            children = node.get('children', [])
+            if not expanded:
+                stack.append((node, True))
+                stack.extend((child, False) for child in children)
+                continue
+            digest = hashlib.sha1()
+            for child in children:
+                digest.update(f"{child['name']}\0{child.get('maxOccurs', '1')}\0{signatures[id(child)]}\n"
+                              .encode('utf-8'))
+            signatures[id(node)] = digest.hexdigest()[:16]
+        return signatures
+
+    @staticmethod
+    def _bind_plan(plan, scenario, list_index, key_matcher, fragment_cache=None, profile=None, resolutions=None,
+                   segments=None):
+        """
+        Проход связывания: заполняет слоты плана значениями сценария и возвращает строки тела шаблона.
+        profile — правила сопоставления по путям элементов;
+        resolutions — словарь, куда записываются найденные эвристикой пути сценария (запись профиля);
+        segments — SegmentTracker: записывает карту сегментов и копирует неизменившиеся узлы прошлого шаблона.
+        """
         lines = []
-        name = node['name']
-        children = node.get('children', [])
-        tag = name
-
-        if children:
-            lines.append(f'{pad}<{tag}>')
-            for ch in children:
-                lines.extend(
-                    FileProcessor._generate_vm_for_node_inner(ch, scenario, indent + 2, item_var, list_name_overrides))
-            lines.append(f'{pad}</{tag}>')
-        else:
-            # Простой элемент внутри foreach
-            found = None
-            if isinstance(scenario, dict):
-                for k, v in scenario.items():
-                    if isinstance(v, list) and v and isinstance(v[0], dict) and name in v[0]:
-                        val = v[0].get(name)
-                        if isinstance(val, (str, int, float, bool)):
-                            found = val
-                            break
-            if found is not None:
-                val = str(found).replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;')
-                lines.append(f'{pad}<{tag}>{val}</{tag}>')
+        binding = None
+        # Открытые узлы: (ключ кэша или None, отступ, первая строка узла)
+        pending = []
+        i = 0
+        end = len(plan)
+        while i < end:
+            op = plan[i]
+            kind = op[0]
+            if kind == 'value':
+                # Простой элемент: пытаемся найти значение в сценарии
+                _, name, path, parts, placeholder_line = op
+                found = MISSING
+                if profile is not None and profile.covers(path):
+                    found = profile.value(path, scenario)
+                if found is MISSING:
+                    # Правила нет или его пути нет в этом сценарии (профиль записан по другому): эвристический поиск
+                    found, source = key_matcher.resolve(name)
+                    if resolutions is not None:
+                        has_value = found is not None and isinstance(found, (str, int, float, bool))
+                        resolutions[path] = format_scenario_path(source) if has_value else None
+                if found is not None and isinstance(found, (str, int, float, bool)):
+                    val = str(found).replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;')
+                    lines.append(parts[0] + val + parts[1])
+                else:
+                    lines.append(placeholder_line)
+            elif kind == 'item':
+                # Простой элемент внутри foreach: сначала берем пример из связанного списка, затем из любого другого
+                _, name, prefix, suffix, placeholder_line = op
+                found = None
+                if binding is not None:
+                    val = binding['item'].get(name)
+                    if isinstance(val, (str, int, float, bool)):
+                        found = val
+                if found is None:
+                    found = list_index['values'].get(name)
+                if found is not None:
+                    val = str(found).replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;')
+                    lines.append(prefix + val + suffix)
+                else:
+                    lines.append(placeholder_line)
+            elif kind == 'close':
+                cache_key, indent, start = pending.pop()
+                body_end = len(lines)
+                if cache_key is not None:
+                    FileProcessor._store_fragment(fragment_cache, cache_key, indent, lines[start:])
+                lines.extend(op[1])
+                if op[2]:
+                    binding = None
+                if segments is not None:
+                    segments.leave(cache_key, indent, (start, body_end), len(lines))
             else:
-                lines.append(f'{pad}<{tag}>${{{item_var}.{name}}}</{tag}>')
+                indent, cache_key, path, close_index, open_line = op[1:6]
+                bound = binding['order'] if binding is not None else None
+                if segments is not None and segments.reuse(i, bound, fragment_cache, lines):
+                    i = close_index + 1
+                    continue
+                node_start = len(lines)
+                if kind == 'loop':
+                    # Список: создаем foreach по связанному списку сценария
+                    child_names, item_var, name = op[6:]
+                    binding = FileProcessor._find_list_binding(child_names, list_index)
+                    list_var = binding['var'] if binding is not None else name + "List"
+                    lines.append(f'{" " * indent}#foreach(${item_var} in ${list_var})')
+                lines.append(open_line)
+                # Поддерево с правилами профиля зависит от пути; при записи профиля нужен каждый путь
+                if cache_key is not None and fragment_cache is not None and resolutions is None and (
+                        cache_key[0] == 'inner' or profile is None or not profile.has_rules_under(path)):
+                    if cache_key[0] == 'inner':
+                        cache_key = cache_key + (binding['order'] if binding is not None else None,)
+                    cached = FileProcessor._cached_fragment(fragment_cache, cache_key, indent)
+                    if cached is not None:
+                        # Из кэша берется только содержимое, теги элемента остаются его собственными
+                        lines.extend(cached)
+                        lines.extend(plan[close_index][1])
+                        if kind == 'loop':
+                            binding = None
+                        if segments is not None:
+                            segments.hit(i, bound, cache_key, node_start, len(lines), len(cached))
+                        i = close_index + 1
+                        continue
+                else:
+                    cache_key = None
+                pending.append((cache_key, indent, len(lines)))
+                if segments is not None:
+                    segments.enter(i, bound, cache_key, node_start)
+            i += 1
         return lines
 
     @staticmethod
-    def _generate_raw_vm(structure, scenario):
+    def _generate_raw_vm(structure, scenario, stats=None, key_match=MODE_FUZZY, profile=None, resolutions=None,
+                         compact=False, as_lines=False, segments=None):
+        """
+        Сырой шаблон текстом или, при as_lines, списком строк; compact — компактный индекс ключей.
+        segments — словарь этапа _stage_segments: связывание ведет карту сегментов ('tracker')
+        и копирует неизменившиеся узлы из прошлого шаблона ('previous').
+        """
         lines = []
         lines.append('<?xml version="1.0" encoding="UTF-8"?>')
         lines.append('<!-- Adaptive generated Velocity template -->')
@@ -301,16 +1226,34 @@ class FileProcessor:
         lines.append('    xmlns:soc1="http://socit.ru/kalin/orders/2.0.0/attachments">')
         lines.append('  <soc:SetRequest>')
 
-        if structure.get('children'):
-            for child in structure['children']:
-                lines.extend(FileProcessor._generate_vm_for_node(child, scenario, indent=4))
-        else:
-            lines.extend(FileProcessor._generate_vm_for_node(structure, scenario, indent=4))
+        # План зависит только от схемы и берется из кэша;
+        # индексы сценария (списки, ключи) и кэш фрагментов живут в пределах одного шаблона
+        plan, plan_cached = FileProcessor._get_plan(structure)
+        list_index = FileProcessor._build_list_index(scenario)
+        key_matcher = FileProcessor._new_key_matcher(scenario, key_match, compact)
+        fragment_cache = FileProcessor._new_fragment_cache()
+        tracker = None
+        if segments is not None:
+            tracker = segments['tracker'] = SegmentTracker(plan, segments['previous'])
+        body = FileProcessor._bind_plan(plan, scenario, list_index, key_matcher, fragment_cache, profile, resolutions,
+                                        tracker)
+        lines.extend(body)
+
+        if stats is not None:
+            stats['hits'] = fragment_cache['hits']
+            stats['misses'] = fragment_cache['misses']
+            stats['distinct_fragments'] = len(fragment_cache['fragments'])
+            stats['lines_from_cache'] = fragment_cache['lines_from_cache']
+            stats['lines_total'] = len(body)
+            stats['plan_cached'] = plan_cached
+            stats['plan_size'] = len(plan)
+            # Каждый узел схемы дает одну инструкцию плана, составные — еще и инструкцию закрытия
+            stats['schema_nodes'] = len(plan) - sum(1 for op in plan if op[0] == 'close')
 
         lines.append('  </soc:SetRequest>')
         lines.append('</soc:AppDataRequest>')
 
-        return "\n".join(lines)
+        return lines if as_lines else "\n".join(lines)
 
     @staticmethod
     def _collect_placeholders(vm_text):
@@ -320,84 +1263,154 @@ class FileProcessor:
         return ph
 
     @staticmethod
-    def _partially_render_vm(raw_vm, scenario, structure):
-        placeholders = FileProcessor._collect_placeholders(raw_vm)
-        filled_vm = raw_vm
+    def _partially_render_vm(raw_vm, scenario, structure, profile=None, stats=None, compact=False):
+        """
+        Подставляет найденные значения в плейсхолдеры шаблона; возвращает (текст, замены).
+        raw_vm может быть списком строк: тогда текст не собирается и вместо него возвращается None.
+        compact — карта значений сценария хранит только ключи, которые нужны плейсхолдерам.
+        """
+        as_lines = isinstance(raw_vm, list)
+        if as_lines:
+            placeholders = set()
+            for start in range(0, len(raw_vm), FileProcessor.WRITE_CHUNK_LINES):
+                chunk = "\n".join(raw_vm[start:start + FileProcessor.WRITE_CHUNK_LINES])
+                placeholders |= FileProcessor._collect_placeholders(chunk)
+        else:
+            placeholders = FileProcessor._collect_placeholders(raw_vm)
+        if stats is not None:
+            stats['placeholders'] = len(placeholders)
+        replacements = FileProcessor._resolve_placeholders(placeholders, scenario, structure, profile, compact)
+
+        # Заменяем ${ph} и $ph за один проход по тексту
+        def substitute(match):
+            return replacements.get(match.group(1) or match.group(2), match.group(0))
+
+        if as_lines:
+            return None, replacements
+        filled_vm = FileProcessor._PLACEHOLDER_RE.sub(substitute, raw_vm) if replacements else raw_vm
+        return filled_vm, replacements
+
+    @staticmethod
+    def _resolve_placeholders(placeholders, scenario, structure, profile=None, compact=False, fixed=None,
+                              by_structure=()):
+        """
+        Значения плейсхолдеров: по профилю, затем по сценарию, затем по именам элементов структуры.
+        fixed — плейсхолдер -> значение (None — значения нет), решенные профилем или сценарием; известные
+        берутся из него без поиска, новые дописываются. Решенные по структуре в него не попадают.
+        by_structure — плейсхолдеры, которых заведомо нет в профиле и сценарии: они ищутся сразу по структуре.
+        """
         replacements = {}
+        if fixed is None:
+            fixed = {}
+
+        wanted = None
+        if compact:
+            wanted = set()
+            for ph in placeholders:
+                if ph in fixed or ph in by_structure:
+                    continue
+                clean_ph = ph.replace('{', '').replace('}', '').lower()
+                wanted.add(clean_ph)
+                wanted.add(clean_ph.split('.')[-1])
 
         # Создаем карту путей для более точного поиска
-        def build_value_map(obj, prefix="", result=None):
-            if result is None:
-                result = {}
-            if isinstance(obj, dict):
-                for k, v in obj.items():
-                    full_key = f"{prefix}.{k}" if prefix else k
-                    if isinstance(v, (dict, list)):
-                        build_value_map(v, full_key, result)
-                    else:
-                        result[full_key.lower()] = v
+        def build_value_map(obj):
+            result = {}
+            if not isinstance(obj, (dict, list)):
+                return result
+            # Стек: (значение, полный путь, ключ словаря или None для элемента списка); порядок записи как у рекурсии
+            stack = [(obj, "", None)]
+            while stack:
+                value, prefix, key = stack.pop()
+                if value is not obj and not isinstance(value, (dict, list)):
+                    if wanted is None or prefix.lower() in wanted:
+                        result[prefix.lower()] = value
+                    if key is not None and (wanted is None or key.lower() in wanted):
                         # Также добавляем вариант без префикса для простых случаев
-                        result[k.lower()] = v
-            elif isinstance(obj, list):
-                for i, item in enumerate(obj):
-                    if isinstance(item, (dict, list)):
-                        build_value_map(item, f"{prefix}[{i}]", result)
-                    else:
-                        list_key = f"{prefix}.{i}" if prefix else str(i)
-                        result[list_key.lower()] = item
+                        result[key.lower()] = value
+                    continue
+                if isinstance(value, dict):
+                    entries = [(v, f"{prefix}.{k}" if prefix else k, k) for k, v in value.items()]
+                else:
+                    entries = [(item, f"{prefix}[{i}]" if isinstance(item, (dict, list))
+                                else (f"{prefix}.{i}" if prefix else str(i)), None)
+                               for i, item in enumerate(value)]
+                stack.extend(reversed(entries))
             return result
 
-        value_map = build_value_map(scenario)
+        # Карта значений строится, только если профиль описывает не все плейсхолдеры
+        value_map = None
+        structure_vals = None
 
         for ph in placeholders:
+            if ph in fixed:
+                if fixed[ph] is not None:
+                    replacements[ph] = fixed[ph]
+                continue
+
             # Обрабатываем разные форматы переменных
             clean_ph = ph.replace('{', '').replace('}', '')
 
-            # Для переменных вида item.field ищем в value_map
-            if '.' in clean_ph:
-                # Это переменная внутри объекта или цикла
-                parts = clean_ph.split('.')
-                search_key = parts[-1].lower()  # берем последнюю часть
+            # Для переменных вида item.field ищем по последней части
+            search_key = clean_ph.rsplit('.', 1)[-1].lower()
+            if ph not in by_structure:
+                if profile is not None:
+                    val = profile.placeholder_value(clean_ph, scenario)
+                    # Пути правила нет в этом сценарии — значение ищется, как без профиля
+                    if val is not None and val is not MISSING:
+                        fixed[ph] = None
+                        if isinstance(val, (str, int, float, bool)):
+                            replacements[ph] = fixed[ph] = FileProcessor._escape_value(val)
+                        continue
 
-                # Пробуем найти значение по полному пути и по последнему ключу
-                val = value_map.get(clean_ph.lower()) or value_map.get(search_key)
-            else:
-                # Простая переменная
-                search_key = clean_ph.lower()
-                val = value_map.get(search_key)
+                if value_map is None:
+                    value_map = build_value_map(scenario)
+
+                if '.' in clean_ph:
+                    # Это переменная внутри объекта или цикла: пробуем полный путь и последний ключ
+                    val = value_map.get(clean_ph.lower()) or value_map.get(search_key)
+                else:
+                    val = value_map.get(search_key)
+
+                if val is not None:
+                    fixed[ph] = None
+                    if isinstance(val, (str, int, float, bool)):
+                        replacements[ph] = fixed[ph] = FileProcessor._escape_value(val)
+                    continue
 
             # Дополнительный поиск по структуре, если в сценарии не найдено
-            if val is None and isinstance(structure, dict):
+            if isinstance(structure, dict):
                 # Ищем в структуре значения по умолчанию или примеры
-                structure_vals = FileProcessor._extract_structure_values(structure)
+                if structure_vals is None:
+                    structure_vals = FileProcessor._extract_structure_values(structure)
                 val = structure_vals.get(search_key)
 
             if val is not None and isinstance(val, (str, int, float, bool)):
-                sval = str(val).replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;')
-                # Заменяем ${ph} и $ph
-                filled_vm = re.sub(r"\$\{" + re.escape(ph) + r"\}", sval, filled_vm)
-                filled_vm = re.sub(r"(?<![\w\$])\$" + re.escape(ph) + r"(?![\w\.])", sval, filled_vm)
-                replacements[ph] = sval
+                replacements[ph] = FileProcessor._escape_value(val)
+        return replacements
 
-        return filled_vm, replacements
+    @staticmethod
+    def _escape_value(value):
+        return str(value).replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;')
 
     @staticmethod
     def _extract_structure_values(structure):
         """Извлекает возможные значения из структуры (имена полей и т.д.)"""
         values = {}
 
-        def extract_from_node(node, path=""):
-            name = node.get('name', '')
-            if name:
-                full_path = f"{path}.{name}" if path else name
-                values[name.lower()] = name  # используем имя поля как значение по умолчанию
-                values[full_path.lower()] = name
-
-            for child in node.get('children', []):
-                extract_from_node(child, f"{path}.{name}" if path else name)
-
         if structure:
-            extract_from_node(structure)
+            stack = [(structure, "")]
+            while stack:
+                node, path = stack.pop()
+                name = node.get('name', '')
+                if name:
+                    full_path = f"{path}.{name}" if path else name
+                    values[name.lower()] = name  # используем имя поля как значение по умолчанию
+                    values[full_path.lower()] = name
+
+                child_path = f"{path}.{name}" if path else name
+                for child in reversed(node.get('children', [])):
+                    stack.append((child, child_path))
 
         return values
 
@@ -407,17 +1420,18 @@ class FileProcessor:
         if not structure:
             return "Пустая структура"
 
-        name = structure.get('name', 'Без имени')
-        children = structure.get('children', [])
-        max_occurs = structure.get('maxOccurs', '1')
-
         summary = []
-        indent = "  " * level
-        node_type = "список" if max_occurs == 'unbounded' or (
-                    max_occurs.isdigit() and int(max_occurs) > 1) else "элемент"
-        summary.append(f"{indent}{name} ({node_type})")
+        stack = [(structure, level)]
+        while stack:
+            node, node_level = stack.pop()
+            name = node.get('name', 'Без имени')
+            max_occurs = node.get('maxOccurs', '1')
+            indent = "  " * node_level
+            node_type = "список" if max_occurs == 'unbounded' or (
+                        max_occurs.isdigit() and int(max_occurs) > 1) else "элемент"
+            summary.append(f"{indent}{name} ({node_type})")
 
-        for child in children:
-            summary.append(FileProcessor._summarize_structure(child, level + 1))
+            for child in reversed(node.get('children', [])):
+                stack.append((child, node_level + 1))
 
-        return "\n".join(summary)
\ No newline at end of file
+        return "\n".join(summary)
@@ -0,0 +1,342 @@
+import json
+import os
+import socket
+import socketserver
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import config
+from logic.file_processor import FileProcessor
+from logic.key_matcher import MODE_FUZZY
+from logic.mapping_profile import MAPPING_AUTO
+from logic.xml_validator import MAX_ERRORS, get_validator
+
+
+def default_address():
+    """Адрес сервиса по умолчанию: Unix сокет, а где его нет — порт на localhost"""
+    if hasattr(socket, 'AF_UNIX'):
+        return {'socket_path': config.SERVICE_SOCKET}
+    return {'port': config.SERVICE_PORT}
+
+
+class _RequestHandler(socketserver.StreamRequestHandler):
+    """Одно соединение: JSON запрос на строку, JSON ответ на строку"""
+
+    def handle(self):
+        service = self.server.service
+        for line in self.rfile:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                request = json.loads(line)
+                response = service.handle_request(request)
+            except Exception as e:
+                response = {'ok': False, 'error': f"Некорректный запрос: {e}"}
+            self.wfile.write(json.dumps(response, ensure_ascii=False).encode('utf-8') + b'\n')
+            self.wfile.flush()
+            if response.get('shutdown'):
+                break
+
+
+class _UnixServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+class _TCPServer(socketserver.ThreadingMixIn, socketserver.TCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class GenerationService:
+    """
+    Долгоживущий сервис генерации шаблонов.
+    Держит разобранные XSD и прочитанные шаблоны в памяти и выполняет запросы в пуле потоков.
+    """
+
+    def __init__(self, socket_path=None, port=None, workers=4):
+        if socket_path is None and port is None:
+            address = default_address()
+            socket_path = address.get('socket_path')
+            port = address.get('port')
+        self.socket_path = socket_path
+        self.port = port
+        self.workers = workers
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="gosmost-worker")
+        self.server = None
+        self.started_at = time.time()
+        self.requests_served = 0
+        self._stats_lock = threading.Lock()
+        # Прочитанные шаблоны для render: путь -> (mtime_ns, текст)
+        self._template_cache = {}
+        self._template_cache_lock = threading.Lock()
+        # Задания в одну папку результатов выполняются по очереди: папка -> блокировка
+        self._output_locks = {}
+        self._output_locks_lock = threading.Lock()
+
+    def start(self):
+        if self.port is not None:
+            self.server = _TCPServer(('127.0.0.1', self.port), _RequestHandler)
+            self.port = self.server.server_address[1]
+        else:
+            self._remove_stale_socket()
+            self.server = _UnixServer(self.socket_path, _RequestHandler)
+        self.server.service = self
+        return self
+
+    def serve_forever(self):
+        if self.server is None:
+            self.start()
+        try:
+            self.server.serve_forever()
+        finally:
+            self.close()
+
+    def close(self):
+        if self.server is not None:
+            self.server.server_close()
+            self.server = None
+            if self.port is None and self.socket_path and os.path.exists(self.socket_path):
+                os.unlink(self.socket_path)
+        self.pool.shutdown(wait=False)
+
+    def _remove_stale_socket(self):
+        if not os.path.exists(self.socket_path):
+            return
+        probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            probe.connect(self.socket_path)
+        except OSError:
+            # Сокет остался от упавшего процесса
+            os.unlink(self.socket_path)
+        else:
+            raise RuntimeError(f"Сервис уже запущен: {self.socket_path}")
+        finally:
+            probe.close()
+
+    def handle_request(self, request):
+        op = request.get('op')
+        params = request.get('params') or {}
+        response = {'id': request.get('id')}
+        try:
+            if op == 'ping':
+                result = 'pong'
+            elif op == 'stats':
+                result = self._op_stats()
+            elif op == 'shutdown':
+                # serve_forever нельзя останавливать из потока обработчика
+                threading.Thread(target=self.server.shutdown, daemon=True).start()
+                response['shutdown'] = True
+                result = 'ok'
+            elif op == 'build':
+                result = self.pool.submit(self._op_build, params).result()
+            elif op == 'batch':
+                result = self._op_batch(params.get('jobs', []))
+            elif op == 'render':
+                result = self.pool.submit(self._op_render, params).result()
+            elif op == 'validate':
+                result = self.pool.submit(self._op_validate, params).result()
+            else:
+                raise ValueError(f"Неизвестная операция: {op}")
+            response['ok'] = True
+            response['result'] = result
+        except Exception as e:
+            response['ok'] = False
+            response['error'] = str(e)
+        with self._stats_lock:
+            self.requests_served += 1
+        return response
+
+    @staticmethod
+    def _output_dir(params):
+        """
+        Папка результатов задания. Без нее шаблоны попали бы в текущую папку сервиса,
+        общую для всех заданий, поэтому такое задание отклоняется.
+        """
+        output_dir = params.get('output_dir')
+        if not output_dir:
+            raise ValueError(f"Не указана папка результатов (output_dir) для {params.get('scenario_path')}")
+        return os.path.normcase(os.path.abspath(output_dir))
+
+    def _output_lock(self, output_dir):
+        with self._output_locks_lock:
+            lock = self._output_locks.get(output_dir)
+            if lock is None:
+                lock = self._output_locks[output_dir] = threading.Lock()
+            return lock
+
+    def _op_build(self, params):
+        # Два задания в одну папку перезаписывали бы файлы и состояние друг друга
+        with self._output_lock(self._output_dir(params)):
+            result = FileProcessor.build_vm_template(params['scenario_path'], params['xsd_path'],
+                                                     params['output_dir'], params.get('key_match', MODE_FUZZY),
+                                                     params.get('mapping', MAPPING_AUTO), params.get('project'))
+        # Полная структура нужна только окну; по сокету отдаем сводку
+        if not params.get('include_structure'):
+            result.pop('structure', None)
+        return result
+
+    def _op_batch(self, jobs):
+        """
+        Пакет заданий: задания с одной папкой результатов идут по очереди в одном потоке пула,
+        разные папки — параллельно. Результаты в порядке заданий.
+        """
+        groups = {}
+        for position, job in enumerate(jobs):
+            groups.setdefault(self._output_dir(job), []).append(position)
+
+        def run_group(positions):
+            return [(position, self._op_build(jobs[position])) for position in positions]
+
+        futures = [self.pool.submit(run_group, positions) for positions in groups.values()]
+        result = [None] * len(jobs)
+        for future in futures:
+            for position, job_result in future.result():
+                result[position] = job_result
+        return result
+
+    def _op_render(self, params):
+        """Частичная подстановка значений сценария в готовый шаблон"""
+        raw_vm = self._load_template(params['template_path'])
+        scenario = FileProcessor._load_maybe_json(params['scenario_path'])
+        structure = FileProcessor._load_structure(params['xsd_path']) if params.get('xsd_path') else None
+        # С известной схемой подстановка берет значения по ее сохраненному профилю
+        profile = FileProcessor._stage_profile(params['xsd_path']) if params.get('xsd_path') else None
+        filled_vm, replacements = FileProcessor._partially_render_vm(raw_vm, scenario, structure, profile)
+
+        result = {'replacements_count': len(replacements)}
+        if params.get('output_path'):
+            Path(params['output_path']).write_text(filled_vm, encoding='utf-8')
+            result['output_path'] = str(Path(params['output_path']).resolve())
+        else:
+            result['text'] = filled_vm
+        return result
+
+    @staticmethod
+    def _op_validate(params):
+        """Проверка готовых XML документов по схеме; скомпилированная схема берется из кэша"""
+        validator = get_validator(FileProcessor._load_structure(params['xsd_path']))
+        max_errors = params.get('max_errors', MAX_ERRORS)
+        return {path: errors for path, errors in validator.iter_validate(params.get('paths', []), max_errors)}
+
+    def _load_template(self, path):
+        key = os.path.abspath(path)
+        mtime = os.stat(key).st_mtime_ns
+        with self._template_cache_lock:
+            cached = self._template_cache.get(key)
+        if cached is not None and cached[0] == mtime:
+            return cached[1]
+        text = Path(key).read_text(encoding='utf-8')
+        with self._template_cache_lock:
+            self._template_cache[key] = (mtime, text)
+        return text
+
+    def _op_stats(self):
+        return {
+            'uptime_sec': round(time.time() - self.started_at, 1),
+            'requests_served': self.requests_served,
+            'workers': self.workers,
+            'cached_schemas': len(FileProcessor._schema_cache),
+            'cached_plans': len(FileProcessor._plan_cache),
+            'cached_templates': len(self._template_cache),
+        }
+
+
+class ServiceClient:
+    """Клиент сервиса генерации: одно соединение на несколько запросов"""
+
+    def __init__(self, socket_path=None, port=None, timeout=None):
+        if socket_path is None and port is None:
+            address = default_address()
+            socket_path = address.get('socket_path')
+            port = address.get('port')
+        self.socket_path = socket_path
+        self.port = port
+        self.timeout = timeout
+        self._sock = None
+        self._file = None
+        self._next_id = 0
+
+    def connect(self):
+        if self._sock is not None:
+            return self
+        if self.port is not None:
+            self._sock = socket.create_connection(('127.0.0.1', self.port), timeout=self.timeout)
+        else:
+            self._sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            self._sock.settimeout(self.timeout)
+            self._sock.connect(self.socket_path)
+        self._file = self._sock.makefile('rwb')
+        return self
+
+    def close(self):
+        if self._sock is not None:
+            self._file.close()
+            self._sock.close()
+            self._sock = None
+            self._file = None
+
+    def __enter__(self):
+        return self.connect()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def call(self, op, **params):
+        self.connect()
+        self._next_id += 1
+        request = {'id': self._next_id, 'op': op, 'params': params}
+        self._file.write(json.dumps(request, ensure_ascii=False).encode('utf-8') + b'\n')
+        self._file.flush()
+        line = self._file.readline()
+        if not line:
+            self.close()
+            raise ConnectionError("Сервис закрыл соединение")
+        response = json.loads(line)
+        if not response.get('ok'):
+            raise RuntimeError(response.get('error', 'Неизвестная ошибка сервиса'))
+        return response.get('result')
+
+    def ping(self):
+        return self.call('ping') == 'pong'
+
+    def build_vm_template(self, scenario_path, xsd_path, output_dir=None, key_match=MODE_FUZZY, mapping=MAPPING_AUTO,
+                          project=None):
+        return self.call('build', scenario_path=os.path.abspath(scenario_path), xsd_path=os.path.abspath(xsd_path),
+                         output_dir=os.path.abspath(output_dir) if output_dir else None, key_match=key_match,
+                         mapping=mapping, project=project)
+
+    def batch(self, jobs):
+        """
+        jobs: список словарей с ключами scenario_path, xsd_path, output_dir и необязательными key_match, mapping, project.
+        Задания с одной папкой результатов сервис выполняет по очереди.
+        """
+        normalized = []
+        for job in jobs:
+            normalized.append({
+                'scenario_path': os.path.abspath(job['scenario_path']),
+                'xsd_path': os.path.abspath(job['xsd_path']),
+                'output_dir': os.path.abspath(job['output_dir']) if job.get('output_dir') else None,
+                'key_match': job.get('key_match', MODE_FUZZY),
+                'mapping': job.get('mapping', MAPPING_AUTO),
+                'project': job.get('project'),
+            })
+        return self.call('batch', jobs=normalized)
+
+    def render(self, template_path, scenario_path, xsd_path=None, output_path=None):
+        return self.call('render', template_path=os.path.abspath(template_path),
+                         scenario_path=os.path.abspath(scenario_path),
+                         xsd_path=os.path.abspath(xsd_path) if xsd_path else None,
+                         output_path=os.path.abspath(output_path) if output_path else None)
+
+    def validate(self, xsd_path, paths, max_errors=MAX_ERRORS):
+        return self.call('validate', xsd_path=os.path.abspath(xsd_path), paths=[os.path.abspath(p) for p in paths],
+                         max_errors=max_errors)
+
+    def stats(self):
+        return self.call('stats')
+
+    def shutdown(self):
+        return self.call('shutdown')
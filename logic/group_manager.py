@@ -1,14 +1,43 @@
 import json
 from PyQt6.QtWidgets import (QWidget, QVBoxLayout, QHBoxLayout, QLabel,
                              QListWidget, QListWidgetItem, QLineEdit,
-                             QPushButton, QGroupBox, QMessageBox)
-from PyQt6.QtCore import Qt
+                             QPushButton, QGroupBox, QMessageBox, QProgressDialog)
+from PyQt6.QtCore import Qt, QThread, pyqtSignal
+
+from logic.project_regenerator import apply_updates, regenerate_records
+
+
+class _RegenerateWorker(QThread):
+    progress = pyqtSignal(int, int, str)
+    # Сводка передается как есть: в ней пары (запись, обновленная копия) для apply_updates
+    completed = pyqtSignal(object)
+
+    def __init__(self, records, workers=4, store=None, parent=None):
+        super().__init__(parent)
+        self.records = records
+        self.workers = workers
+        self.store = store
+
+    def run(self):
+        summary = regenerate_records(self.records, self.workers,
+                                     on_progress=lambda done, total, record, status:
+                                     self.progress.emit(done, total, record.get('file', '')),
+                                     store=self.store)
+        self.completed.emit(summary)
 
 
 class GroupManager:
+    # Проект, в который попадают записи, удаленные из своего проекта
+    NO_GROUP = 'Без проекта'
+
     def __init__(self, main_window):
         self.main_window = main_window
+        # Проект -> упорядоченное множество ID записей (dict сохраняет порядок добавления)
         self.groups = {}
+        # Обратный индекс: ID записи -> проект
+        self.record_groups = {}
+        # Вкладка строится при первом открытии
+        self.groups_list = None
 
     def create_groups_tab(self):
         widget = QWidget()
@@ -41,20 +70,26 @@ class GroupManager:
         btn_remove_group = QPushButton("Удалить проект")
         btn_remove_group.clicked.connect(self.remove_group)
 
+        btn_regenerate_group = QPushButton("Перегенерировать проект")
+        btn_regenerate_group.clicked.connect(self.regenerate_group)
+
         manage_layout.addWidget(self.new_group_name)
         manage_layout.addWidget(btn_add_group)
         manage_layout.addWidget(btn_remove_group)
+        manage_layout.addWidget(btn_regenerate_group)
         manage_group.setLayout(manage_layout)
         layout.addWidget(manage_group)
 
         widget.setLayout(layout)
+
+        self.groups_list.addItems(self.groups.keys())
         return widget
 
     def create_group(self):
         group_name = self.new_group_name.text().strip()
         if group_name:
             if group_name not in self.groups:
-                self.groups[group_name] = []
+                self.groups[group_name] = {}
                 self.groups_list.addItem(group_name)
                 self.main_window.history_manager.update_group_filters()
                 self.new_group_name.clear()
@@ -65,6 +100,15 @@ class GroupManager:
         else:
             QMessageBox.warning(self.main_window, "Ошибка", "Введите название проекта")
 
+    def ensure_group(self, group_name):
+        """Создает проект без диалогов (для импорта); возвращает True, если проект новый"""
+        if not group_name or group_name in self.groups:
+            return False
+        self.groups[group_name] = {}
+        if self.groups_list is not None:
+            self.groups_list.addItem(group_name)
+        return True
+
     def remove_group(self):
         current_item = self.groups_list.currentItem()
         if current_item:
@@ -75,12 +119,15 @@ class GroupManager:
 
             if reply == QMessageBox.StandardButton.Yes:
                 # Удаляем группу
-                del self.groups[group_name]
+                members = self.groups.pop(group_name)
 
                 # Обновляем историю - все файлы из этой группы становятся без группы
-                for item in self.main_window.history_manager.history:
-                    if item['group'] == group_name:
-                        item['group'] = 'Без проекта'
+                records_by_id = self.main_window.history_manager.records_by_id
+                for item_id in members:
+                    self.record_groups.pop(item_id, None)
+                    item = records_by_id.get(item_id)
+                    if item is not None:
+                        item['group'] = self.NO_GROUP
 
                 # Удаляем группу из списка
                 self.groups_list.takeItem(self.groups_list.row(current_item))
@@ -93,36 +140,128 @@ class GroupManager:
         else:
             QMessageBox.warning(self.main_window, "Ошибка", "Выберите проект для удаления")
 
+    def regenerate_group(self):
+        current_item = self.groups_list.currentItem()
+        if not current_item:
+            QMessageBox.warning(self.main_window, "Ошибка", "Выберите проект для перегенерации")
+            return
+
+        group_name = current_item.text()
+        records_by_id = self.main_window.history_manager.records_by_id
+        records = [records_by_id[item_id] for item_id in self.groups.get(group_name, {}) if item_id in records_by_id]
+        if not records:
+            QMessageBox.information(self.main_window, "Информация", f"В проекте '{group_name}' нет файлов")
+            return
+
+        progress_dialog = QProgressDialog(f"Перегенерация проекта '{group_name}'...", None, 0, len(records),
+                                          self.main_window)
+        progress_dialog.setWindowModality(Qt.WindowModality.WindowModal)
+        progress_dialog.setMinimumDuration(0)
+
+        worker = _RegenerateWorker(records, store=self.main_window.output_store(), parent=self.main_window)
+        worker.progress.connect(lambda done, total, name: (
+            progress_dialog.setValue(done),
+            progress_dialog.setLabelText(f"Перегенерация проекта '{group_name}': {done} из {total}\n{name}")))
+        worker.completed.connect(lambda summary: self._on_regenerate_finished(group_name, summary, progress_dialog))
+        # Держим ссылку на поток до завершения
+        self._regenerate_worker = worker
+        worker.start()
+
+    def _on_regenerate_finished(self, group_name, summary, progress_dialog):
+        progress_dialog.close()
+        self._regenerate_worker = None
+        # Записи истории читает окно, поэтому обновляются они здесь, в его потоке, а не в потоке перегенерации
+        apply_updates(summary)
+        self.main_window.history_manager.update_history_table()
+        self.main_window.save_settings()
+
+        current_item = self.groups_list.currentItem()
+        if current_item and current_item.text() == group_name:
+            self.show_group_files(current_item)
+
+        message = (f"Проект '{group_name}': перегенерировано {summary['regenerated']}, "
+                   f"без изменений {summary['skipped']}, с ошибками {summary['failed']}")
+        if summary['errors']:
+            QMessageBox.warning(self.main_window, "Перегенерация завершена",
+                                message + "\n\n" + "\n".join(summary['errors'][:10]))
+        else:
+            QMessageBox.information(self.main_window, "Перегенерация завершена", message)
+
     def show_group_files(self, item):
         group_name = item.text()
         self.group_files_list.clear()
 
-        # Получаем все ID файлов в группе
-        file_ids = self.groups.get(group_name, [])
-
-        # Находим соответствующие записи в истории
-        for file_id in file_ids:
-            history_item = next((item for item in self.main_window.history_manager.history if item['id'] == file_id),
-                                None)
+        # Находим записи проекта через индекс истории
+        records_by_id = self.main_window.history_manager.records_by_id
+        for file_id in self.groups.get(group_name, {}):
+            history_item = records_by_id.get(file_id)
             if history_item:
                 self.group_files_list.addItem(f"{history_item['file']} - {history_item['date']}")
 
+    def add_members(self, group_name, records):
+        """Переносит записи в проект; возвращает множество затронутых проектов"""
+        members = self.groups[group_name]
+        affected = {group_name}
+        for record in records:
+            item_id = record['id']
+            previous = self.record_groups.get(item_id)
+            if previous is not None and previous != group_name:
+                self.groups.get(previous, {}).pop(item_id, None)
+                affected.add(previous)
+            members[item_id] = None
+            self.record_groups[item_id] = group_name
+            affected.add(record['group'])
+            record['group'] = group_name
+        return affected
+
+    def remove_members(self, records):
+        """Убирает записи из их проектов; возвращает множество затронутых проектов"""
+        affected = set()
+        for record in records:
+            item_id = record['id']
+            group_name = self.record_groups.pop(item_id, None)
+            if group_name is not None:
+                self.groups.get(group_name, {}).pop(item_id, None)
+                affected.add(group_name)
+            affected.add(record['group'])
+            record['group'] = self.NO_GROUP
+        return affected
+
+    def index_record(self, record):
+        """Учитывает новую или импортированную запись, если она уже отнесена к существующему проекту"""
+        group_name = record.get('group')
+        if group_name in self.groups:
+            self.groups[group_name][record['id']] = None
+            self.record_groups[record['id']] = group_name
+
     def update_group_filters(self):
         self.main_window.history_manager.update_group_filters()
 
     def save_settings(self):
         return {
-            'groups': self.groups
+            'groups': {group_name: list(members) for group_name, members in self.groups.items()}
         }
 
     def load_settings(self, settings):
-        # Загрузка групп
+        # Загрузка групп; ID преобразуем в int для совместимости
         groups = settings.get('groups', {})
-        self.groups = groups
+        self.groups = {group_name: dict.fromkeys(int(id) for id in ids) for group_name, ids in groups.items()}
 
-        # Преобразуем ID в int для совместимости
-        for group_name in self.groups:
-            self.groups[group_name] = [int(id) for id in self.groups[group_name]]
+        # Обратный индекс строим по полю 'group' записей; старые списки могли содержать запись в нескольких проектах
+        self.record_groups = {}
+        records_by_id = self.main_window.history_manager.records_by_id
+        for group_name, members in self.groups.items():
+            for item_id in list(members):
+                record = records_by_id.get(item_id)
+                if record is None or record.get('group') != group_name:
+                    del members[item_id]
+                else:
+                    self.record_groups[item_id] = group_name
+        for record in records_by_id.values():
+            if record['id'] not in self.record_groups:
+                self.index_record(record)
 
         # Обновляем интерфейс
-        self.groups_list.addItems(self.groups.keys())
\ No newline at end of file
+        if self.groups_list is not None:
+            self.groups_list.clear()
+            self.groups_list.addItems(self.groups.keys())
\ No newline at end of file
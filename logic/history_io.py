@@ -0,0 +1,83 @@
+import json
+
+# Первая строка файла экспорта
+NDJSON_HEADER = {'kind': 'gosmost-history', 'version': 1}
+
+
+def export_ndjson(path, history, groups):
+    """
+    Пишет историю и проекты в NDJSON: заголовок, строки проектов, затем по строке на запись.
+    Записи сериализуются по одной, весь файл в памяти не собирается. Возвращает число записей.
+    """
+    count = 0
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(json.dumps(NDJSON_HEADER) + '\n')
+        for group_name in groups:
+            f.write(json.dumps({'kind': 'project', 'name': group_name}, ensure_ascii=False) + '\n')
+        for record in history:
+            f.write(json.dumps({'kind': 'record', 'record': record}, ensure_ascii=False) + '\n')
+            count += 1
+    return count
+
+
+def iter_ndjson(path):
+    """Читает файл экспорта построчно и отдает строки-объекты после заголовка"""
+    with open(path, encoding='utf-8') as f:
+        header = f.readline()
+        try:
+            header = json.loads(header)
+        except ValueError:
+            header = None
+        if not isinstance(header, dict) or header.get('kind') != NDJSON_HEADER['kind']:
+            raise ValueError("Файл не является экспортом истории ГосМост")
+        if header.get('version', 1) > NDJSON_HEADER['version']:
+            raise ValueError(f"Неподдерживаемая версия экспорта: {header.get('version')}")
+
+        for line_number, line in enumerate(f, start=2):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                yield json.loads(line)
+            except ValueError:
+                raise ValueError(f"Некорректная строка {line_number} в файле экспорта")
+
+
+def _dedupe_keys(record):
+    # Одна и та же запись: тот же ID и путь результата, либо тот же путь и время запуска (повторный импорт)
+    return (('id', record.get('id'), record.get('full_path')),
+            ('run', record.get('full_path'), record.get('date')))
+
+
+def import_ndjson(path, existing_records, next_id, add_record, add_project):
+    """
+    Потоково импортирует историю из NDJSON.
+    existing_records — уже загруженные записи (для дедупликации),
+    next_id() — выдает свободный ID по схеме истории, add_record/add_project — добавляют запись и проект.
+    Импортированные записи всегда получают новые ID; исходный сохраняется в 'imported_id'.
+    Возвращает {'imported', 'duplicates', 'projects'}.
+    """
+    seen = set()
+    for record in existing_records:
+        seen.update(_dedupe_keys(record))
+
+    summary = {'imported': 0, 'duplicates': 0, 'projects': 0}
+    for entry in iter_ndjson(path):
+        kind = entry.get('kind')
+        if kind == 'project':
+            if add_project(entry['name']):
+                summary['projects'] += 1
+        elif kind == 'record':
+            record = entry['record']
+            keys = _dedupe_keys(record)
+            if any(key in seen for key in keys):
+                summary['duplicates'] += 1
+                continue
+            # Повторы внутри самого файла тоже отсеиваем
+            seen.update(keys)
+            record['imported_id'] = record.get('id')
+            record['id'] = next_id()
+            record.setdefault('group', 'Черновик')
+            add_record(record)
+            summary['imported'] += 1
+    return summary
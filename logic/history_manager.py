@@ -2,16 +2,75 @@ import json
 from PyQt6.QtWidgets import (QWidget, QVBoxLayout, QHBoxLayout, QLabel,
                              QTableWidget, QTableWidgetItem, QHeaderView,
                              QComboBox, QLineEdit, QPushButton, QGroupBox,
-                             QMenu, QInputDialog, QMessageBox)
-from PyQt6.QtCore import Qt
+                             QMenu, QInputDialog, QMessageBox, QSplitter,
+                             QAbstractItemView, QFileDialog)
+from PyQt6.QtCore import Qt, QTimer, QThread
+from PyQt6.QtGui import QBrush, QColor
+
+from logic.history_io import export_ndjson, import_ndjson
+from logic.integrity_scanner import IntegrityScanner, STATUS_MISSING, STATUS_CHANGED
+from logic.output_store import OutputStore, materialize_record, output_sources
+from logic import startup_trace
+from ui.template_preview import TemplatePreview
+from ui.diff_view import show_records_diff
+
+
+class _SettingsLoader(QThread):
+    """Разбор сохраненных истории и проектов вне потока окна"""
+
+    def __init__(self, history_json, groups_json, parent=None):
+        super().__init__(parent)
+        self.history_json = history_json
+        self.groups_json = groups_json
+        self.history_settings = {}
+        self.group_settings = {}
+
+    def run(self):
+        self.history_settings = self._parse(self.history_json)
+        self.group_settings = self._parse(self.groups_json)
+
+    @staticmethod
+    def _parse(value):
+        try:
+            parsed = json.loads(value)
+        except (TypeError, ValueError):
+            return {}
+        return parsed if isinstance(parsed, dict) else {}
 
 
 class HistoryManager:
+    # Строк таблицы, добавляемых за один проход цикла событий
+    PAGE_SIZE = 500
+    # Ключи записи для колонок таблицы
+    COLUMN_KEYS = ('file', 'date', 'result', 'group')
+
     def __init__(self, main_window):
         self.main_window = main_window
         self.history = []
+        # Индекс ID -> запись истории, поддерживается при добавлении и загрузке
+        self.records_by_id = {}
+        # Следующий свободный ID: считается при загрузке и сдвигается при добавлении
+        self._next_id = 0
         self.sort_column = 1
         self.sort_order = Qt.SortOrder.DescendingOrder
+        # Ячейки имени файла по ID записи: переживают сортировку, нужны для отметок проверки файлов
+        self.file_items_by_id = {}
+        # Вкладка строится при первом открытии; до этого виджетов нет
+        self.history_table = None
+        self.group_filter = None
+        # Записи, которые еще предстоит добавить в таблицу, и поколение заполнения
+        self._pending_rows = []
+        self._fill_generation = 0
+
+        self.integrity_scanner = IntegrityScanner(main_window)
+        self.integrity_scanner.statuses_changed.connect(self.apply_integrity_statuses)
+        self.integrity_timer = QTimer(main_window)
+        self.integrity_timer.setInterval(self.INTEGRITY_INTERVAL_MS)
+        self.integrity_timer.timeout.connect(self.start_integrity_scan)
+
+    # Период повторной проверки файлов истории
+    INTEGRITY_INTERVAL_MS = 60000
+    INTEGRITY_COLORS = {STATUS_MISSING: QColor(200, 40, 40), STATUS_CHANGED: QColor(200, 130, 0)}
 
     def create_history_tab(self):
         widget = QWidget()
@@ -64,29 +123,116 @@ class HistoryManager:
         self.history_table.setHorizontalHeaderLabels(["Файл", "Дата", "Результат", "Проект"])
         self.history_table.horizontalHeader().setSectionResizeMode(QHeaderView.ResizeMode.Stretch)
 
+        # Выделение нескольких строк для пакетных операций
+        self.history_table.setSelectionBehavior(QAbstractItemView.SelectionBehavior.SelectRows)
+        self.history_table.setSelectionMode(QAbstractItemView.SelectionMode.ExtendedSelection)
+
         # Включаем сортировку по клику на заголовок
         self.history_table.setSortingEnabled(False)
         self.history_table.horizontalHeader().sectionClicked.connect(self.header_clicked)
 
-        layout.addWidget(self.history_table)
+        # Просмотр шаблонов выбранной записи
+        self.history_preview = TemplatePreview()
+        self.history_table.itemSelectionChanged.connect(self.show_selected_preview)
+
+        history_splitter = QSplitter(Qt.Orientation.Vertical)
+        history_splitter.addWidget(self.history_table)
+        history_splitter.addWidget(self.history_preview)
+        history_splitter.setStretchFactor(0, 2)
+        history_splitter.setStretchFactor(1, 1)
+        layout.addWidget(history_splitter)
 
         # Контекстное меню для таблицы
         self.history_table.setContextMenuPolicy(Qt.ContextMenuPolicy.CustomContextMenu)
         self.history_table.customContextMenuRequested.connect(self.show_history_context_menu)
 
         widget.setLayout(layout)
+
+        self._sync_sort_combo()
+        self.update_group_filters()
+        self.update_history_table()
+        startup_trace.mark("вкладка истории построена")
         return widget
 
-    def add_to_history(self, file_item):
+    @staticmethod
+    def create_settings_loader(history_json, groups_json, parent=None):
+        return _SettingsLoader(history_json, groups_json, parent)
+
+    def next_id(self):
+        """Свободный ID: как раньше len(history), но без пересечения с уже выданными"""
+        return self._next_id
+
+    def add_to_history(self, file_item, refresh=True):
         self.history.append(file_item)
-        self.update_history_table()
+        self.records_by_id[file_item['id']] = file_item
+        self._next_id = max(self._next_id, len(self.history), file_item['id'] + 1)
+        self.main_window.group_manager.index_record(file_item)
+        if refresh:
+            self.update_history_table()
+
+    def export_history(self):
+        path, _ = QFileDialog.getSaveFileName(self.main_window, "Экспорт истории", "history.ndjson",
+                                              "NDJSON (*.ndjson);;Все файлы (*)")
+        if not path:
+            return
+        try:
+            count = export_ndjson(path, self.history, self.main_window.group_manager.groups)
+        except OSError as e:
+            QMessageBox.critical(self.main_window, "Ошибка", f"Не удалось экспортировать историю: {e}")
+            return
+        QMessageBox.information(self.main_window, "Успех", f"Экспортировано записей: {count}")
+
+    def import_history(self):
+        path, _ = QFileDialog.getOpenFileName(self.main_window, "Импорт истории", "",
+                                              "NDJSON (*.ndjson);;Все файлы (*)")
+        if not path:
+            return
+        group_manager = self.main_window.group_manager
+        try:
+            summary = import_ndjson(path, self.history, self.next_id,
+                                    lambda record: self.add_to_history(record, refresh=False),
+                                    group_manager.ensure_group)
+        except (OSError, ValueError, KeyError) as e:
+            QMessageBox.critical(self.main_window, "Ошибка", f"Не удалось импортировать историю: {e}")
+        else:
+            QMessageBox.information(self.main_window, "Успех",
+                                    f"Импортировано записей: {summary['imported']}, "
+                                    f"пропущено дубликатов: {summary['duplicates']}, "
+                                    f"новых проектов: {summary['projects']}")
+        finally:
+            # Записи, прочитанные до ошибки, тоже сохраняем
+            self.update_history_table()
+            self.update_group_filters()
+            self.main_window.save_settings()
 
     def update_history_table(self):
+        if self.history_table is None:
+            return
         # Временно отключаем сортировку для обновления данных
         self.history_table.setSortingEnabled(False)
-
-        self.history_table.setRowCount(len(self.history))
-        for row, item in enumerate(self.history):
+        self.history_table.setRowCount(0)
+        self.file_items_by_id = {}
+
+        # Записи сразу упорядочены как после сортировки таблицы, поэтому видимые строки верны
+        # с первой страницы, а остальные страницы добавляются в конец
+        key = self.COLUMN_KEYS[self.sort_column]
+        self._pending_rows = sorted(self.history, key=lambda record: str(record.get(key, '')),
+                                    reverse=self.sort_order == Qt.SortOrder.DescendingOrder)
+        self._pending_rows.reverse()
+        self._fill_generation += 1
+        self._fill_page(self._fill_generation)
+
+        # Новые и перегенерированные записи проверяем сразу, не дожидаясь таймера
+        self.start_integrity_scan()
+
+    def _fill_page(self, generation):
+        # Заполнение, начатое до последнего update_history_table, больше не нужно
+        if generation != self._fill_generation:
+            return
+        first_row = self.history_table.rowCount()
+        page = [self._pending_rows.pop() for _ in range(min(self.PAGE_SIZE, len(self._pending_rows)))]
+        self.history_table.setRowCount(first_row + len(page))
+        for row, item in enumerate(page, start=first_row):
             # Создаем элементы для всех ячеек
             file_item = QTableWidgetItem(item['file'])
             date_item = QTableWidgetItem(item['date'])
@@ -99,26 +245,62 @@ class HistoryManager:
             result_item.setData(Qt.ItemDataRole.UserRole, item['id'])
             group_item.setData(Qt.ItemDataRole.UserRole, item['id'])
 
+            self.file_items_by_id[item['id']] = file_item
+            status = self.integrity_scanner.status(item['id'])
+            if status is not None:
+                self._mark_integrity(file_item, status)
+
             self.history_table.setItem(row, 0, file_item)
             self.history_table.setItem(row, 1, date_item)
             self.history_table.setItem(row, 2, result_item)
             self.history_table.setItem(row, 3, group_item)
 
-        # Включаем сортировку обратно
+        # Применяем фильтры к новым строкам
+        self._apply_filters_from(first_row)
+
+        if self._pending_rows:
+            QTimer.singleShot(0, lambda: self._fill_page(generation))
+            return
+
+        # Включаем сортировку обратно; строки уже стоят в нужном порядке
         self.history_table.setSortingEnabled(True)
+        self.history_table.horizontalHeader().setSortIndicator(self.sort_column, self.sort_order)
+        startup_trace.mark(f"таблица истории заполнена ({len(self.history)} записей)")
 
-        # Применяем текущую сортировку
-        self.apply_current_sorting()
+    def is_filling(self):
+        return bool(self._pending_rows)
 
-        # Применяем фильтры
-        self.apply_filters()
+    def start_integrity_scan(self):
+        self.integrity_scanner.scan(self.history)
+
+    def stop_integrity_scan(self):
+        self.integrity_timer.stop()
+        self.integrity_scanner.stop()
+
+    def apply_integrity_statuses(self, statuses):
+        """Отмечает строки с пропавшими или измененными файлами; колонки и сортировка не меняются"""
+        for item_id, status in statuses.items():
+            file_item = self.file_items_by_id.get(item_id)
+            if file_item is not None:
+                self._mark_integrity(file_item, status)
+
+    def _mark_integrity(self, file_item, status):
+        state, details = status
+        color = self.INTEGRITY_COLORS.get(state)
+        file_item.setForeground(QBrush(color) if color is not None else QBrush())
+        file_item.setToolTip(details)
 
     def apply_filters(self):
-        # Применение фильтров к таблице истории
+        self._apply_filters_from(0)
+
+    def _apply_filters_from(self, first_row):
+        # Применение фильтров к таблице истории (начиная с first_row при постраничном заполнении)
+        if self.history_table is None:
+            return
         group_filter = self.group_filter.currentText()
         search_text = self.search_field.text().lower()
 
-        for row in range(self.history_table.rowCount()):
+        for row in range(first_row, self.history_table.rowCount()):
             should_show = True
 
             # Безопасная проверка фильтра по группе
@@ -172,6 +354,12 @@ class HistoryManager:
 
     def apply_current_sorting(self):
         # Применяем текущую сортировку к таблице
+        if self.history_table is None:
+            return
+        if self.is_filling():
+            # Таблица заполнена не полностью — перезаполняем ее уже в новом порядке
+            self.update_history_table()
+            return
         if self.history_table.rowCount() > 0:
             self.history_table.sortItems(self.sort_column, self.sort_order)
 
@@ -187,7 +375,7 @@ class HistoryManager:
             self.sort_column = logical_index
             self.sort_order = Qt.SortOrder.AscendingOrder
 
-        self.history_table.sortItems(self.sort_column, self.sort_order)
+        self.apply_current_sorting()
         self.history_table.horizontalHeader().setSortIndicator(self.sort_column, self.sort_order)
 
         # Синхронизируем комбобокс
@@ -201,82 +389,120 @@ class HistoryManager:
             self.sort_combo.setCurrentIndex(4 if self.sort_order == Qt.SortOrder.AscendingOrder else 5)
 
     def show_history_context_menu(self, position):
+        count = len(self.selected_ids())
+        suffix = f" ({count})" if count > 1 else ""
         menu = QMenu()
-        add_to_group_action = menu.addAction("Добавить в проект")
-        remove_from_group_action = menu.addAction("Удалить из проекта")
+        add_to_group_action = menu.addAction(f"Добавить в проект{suffix}")
+        remove_from_group_action = menu.addAction(f"Удалить из проекта{suffix}")
+        # Сравнение доступно ровно для двух выделенных записей
+        compare_action = menu.addAction("Сравнить шаблоны") if count == 2 else None
+        materialize_action = menu.addAction("Выгрузить шаблоны из хранилища...") if count == 1 else None
         action = menu.exec(self.history_table.mapToGlobal(position))
 
         if action == add_to_group_action:
             self.add_to_group()
         elif action == remove_from_group_action:
             self.remove_from_group()
-
-    def add_to_group(self):
-        selected_row = self.history_table.currentRow()
-        if selected_row >= 0:
-            # Получаем ID из выбранной строки
-            item = self.history_table.item(selected_row, 0)
+        elif action is not None and action == compare_action:
+            self.compare_selected()
+        elif action is not None and action == materialize_action:
+            self.materialize_selected()
+
+    def materialize_selected(self):
+        records = self._selected_records()
+        if len(records) != 1:
+            return
+        dest_dir = QFileDialog.getExistingDirectory(self.main_window, "Папка для шаблонов")
+        if not dest_dir:
+            return
+        try:
+            paths = materialize_record(records[0], OutputStore(), dest_dir)
+        except (OSError, ValueError) as e:
+            QMessageBox.critical(self.main_window, "Ошибка", f"Не удалось выгрузить шаблоны: {e}")
+            return
+        QMessageBox.information(self.main_window, "Успех", "Шаблоны выгружены:\n" + "\n".join(paths))
+
+    def compare_selected(self):
+        records = self._selected_records()
+        if len(records) != 2:
+            return
+        if show_records_diff(records[0], records[1], self.main_window) is None:
+            QMessageBox.warning(self.main_window, "Ошибка", "У выбранных записей нет шаблонов для сравнения")
+
+    def selected_ids(self):
+        """ID записей во всех выделенных строках, в порядке строк таблицы"""
+        ids = []
+        seen = set()
+        rows = sorted({index.row() for index in self.history_table.selectionModel().selectedRows()})
+        if not rows and self.history_table.currentRow() >= 0:
+            rows = [self.history_table.currentRow()]
+        for row in rows:
+            item = self.history_table.item(row, 0)
             if item is not None:
                 item_id = item.data(Qt.ItemDataRole.UserRole)
+                if item_id not in seen:
+                    seen.add(item_id)
+                    ids.append(item_id)
+        return ids
 
-                # Находим запись в истории по ID
-                history_item = next((item for item in self.history if item['id'] == item_id), None)
+    def _selected_records(self):
+        return [self.records_by_id[item_id] for item_id in self.selected_ids() if item_id in self.records_by_id]
 
-                if history_item:
-                    if not self.main_window.group_manager.groups:
-                        QMessageBox.information(self.main_window, "Информация",
-                                                "Сначала создайте проект во вкладке 'Управление группами'")
-                        return
-
-                    group_name, ok = QInputDialog.getItem(self.main_window, "Добавить в проект",
-                                                          "Выберите проект:",
-                                                          list(self.main_window.group_manager.groups.keys()), 0, False)
-                    if ok and group_name:
-                        # Обновляем группу в истории
-                        history_item['group'] = group_name
+    def _refresh_after_group_change(self, affected_groups):
+        """Одно обновление таблицы, фильтров, списка проекта и настроек на всю пакетную операцию"""
+        group_manager = self.main_window.group_manager
+        self.update_history_table()
+        group_manager.update_group_filters()
+        self.main_window.save_settings()
 
-                        # Добавляем ID в группу
-                        if item_id not in self.main_window.group_manager.groups[group_name]:
-                            self.main_window.group_manager.groups[group_name].append(item_id)
+        # Обновляем список файлов, если затронутый проект выбран
+        current_group_item = group_manager.groups_list.currentItem() if group_manager.groups_list else None
+        if current_group_item and current_group_item.text() in affected_groups:
+            group_manager.show_group_files(current_group_item)
 
-                        self.update_history_table()
-                        self.main_window.group_manager.update_group_filters()
-                        self.main_window.save_settings()
+    def add_to_group(self):
+        records = self._selected_records()
+        if not records:
+            return
 
-                        # Обновляем список файлов, если эта группа выбрана
-                        current_group_item = self.main_window.group_manager.groups_list.currentItem()
-                        if current_group_item and current_group_item.text() == group_name:
-                            self.main_window.group_manager.show_group_files(current_group_item)
+        group_manager = self.main_window.group_manager
+        if not group_manager.groups:
+            QMessageBox.information(self.main_window, "Информация",
+                                    "Сначала создайте проект во вкладке 'Управление группами'")
+            return
 
-    def remove_from_group(self):
-        selected_row = self.history_table.currentRow()
-        if selected_row >= 0:
-            # Получаем ID из выбранной строки
-            item = self.history_table.item(selected_row, 0)
-            if item is not None:
-                item_id = item.data(Qt.ItemDataRole.UserRole)
+        title = "Добавить в проект" if len(records) == 1 else f"Добавить в проект ({len(records)} записей)"
+        group_name, ok = QInputDialog.getItem(self.main_window, title,
+                                              "Выберите проект:",
+                                              list(group_manager.groups.keys()), 0, False)
+        if not ok or not group_name:
+            return
 
-                # Находим запись в истории по ID
-                history_item = next((item for item in self.history if item['id'] == item_id), None)
+        self._refresh_after_group_change(group_manager.add_members(group_name, records))
 
-                if history_item and history_item['group'] != 'Черновик':
-                    # Удаляем из группы
-                    group_name = history_item['group']
-                    if item_id in self.main_window.group_manager.groups[group_name]:
-                        self.main_window.group_manager.groups[group_name].remove(item_id)
+    def remove_from_group(self):
+        records = [item for item in self._selected_records() if item['group'] != 'Черновик']
+        if not records:
+            return
 
-                    # Обновляем историю
-                    history_item['group'] = 'Без проекта'
+        self._refresh_after_group_change(self.main_window.group_manager.remove_members(records))
 
-                    self.update_history_table()
-                    self.main_window.save_settings()
+    def show_selected_preview(self):
+        selected_row = self.history_table.currentRow()
+        item = self.history_table.item(selected_row, 0) if selected_row >= 0 else None
+        if item is None:
+            self.history_preview.clear()
+            return
 
-                    # Обновляем список файлов, если эта группа выбрана
-                    current_group_item = self.main_window.group_manager.groups_list.currentItem()
-                    if current_group_item and current_group_item.text() == group_name:
-                        self.main_window.group_manager.show_group_files(current_group_item)
+        item_id = item.data(Qt.ItemDataRole.UserRole)
+        history_item = self.records_by_id.get(item_id)
+        # Сохраненные в хранилище результаты читаются оттуда: файл в папке мог перезаписать другой запуск
+        outputs = output_sources(history_item) if history_item else {}
+        self.history_preview.set_files(outputs.get('raw_vm'), outputs.get('filled_vm'))
 
     def update_group_filters(self):
+        if self.group_filter is None:
+            return
         current_text = self.group_filter.currentText()
         self.group_filter.clear()
         self.group_filter.addItem("Все проекты")
@@ -303,16 +529,22 @@ class HistoryManager:
         for i, item in enumerate(self.history):
             if 'id' not in item:
                 item['id'] = i
+        self.records_by_id = {item['id']: item for item in self.history}
+        self._next_id = max(len(self.history), max(self.records_by_id, default=-1) + 1)
 
         # Загрузка настроек сортировки
         self.sort_column = settings.get('sort_column', 1)
         sort_order_int = settings.get('sort_order', Qt.SortOrder.DescendingOrder.value)
         self.sort_order = Qt.SortOrder(sort_order_int)
+        self._sync_sort_combo()
 
+    def _sync_sort_combo(self):
+        if self.history_table is None:
+            return
         # Устанавливаем соответствующий индекс в комбобоксе сортировки
         if self.sort_column == 1:  # Дата
             self.sort_combo.setCurrentIndex(0 if self.sort_order == Qt.SortOrder.DescendingOrder else 1)
         elif self.sort_column == 0:  # Имя файла
             self.sort_combo.setCurrentIndex(2 if self.sort_order == Qt.SortOrder.AscendingOrder else 3)
         elif self.sort_column == 3:  # Проекты
-            self.sort_combo.setCurrentIndex(4 if self.sort_order == Qt.SortOrder.AscendingOrder else 5)
\ No newline at end of file
+            self.sort_combo.setCurrentIndex(4 if self.sort_order == Qt.SortOrder.AscendingOrder else 5)
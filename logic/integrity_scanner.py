@@ -0,0 +1,116 @@
+import os
+from PyQt6.QtCore import QThread, pyqtSignal
+
+STATUS_OK = 'ok'
+STATUS_MISSING = 'missing'
+STATUS_CHANGED = 'changed'
+
+
+def record_paths(record):
+    """(путь, ожидаемый отпечаток или None) для входов и результатов записи"""
+    files = record.get('files', {})
+    expected = dict(record.get('fingerprints') or {})
+    expected.update(record.get('output_fingerprints') or {})
+    return [(item['path'], expected.get(item['path'])) for item in files.get('input', []) + files.get('output', [])]
+
+
+class IntegrityScanner(QThread):
+    """
+    Фоновая проверка файлов, на которые ссылается история.
+    Работает пачками с низким приоритетом; наружу отдает только записи, чей статус изменился.
+    """
+
+    # {ID записи: (статус, описание)}
+    statuses_changed = pyqtSignal(dict)
+
+    BATCH_SIZE = 200
+    # Пауза между пачками, чтобы не отнимать диск у интерфейса
+    BATCH_PAUSE_MS = 10
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self._jobs = []
+        # Снимок, запрошенный во время проверки: проверяется сразу после нее. Меняется только в потоке окна
+        self._pending = None
+        # ID записи -> (отпечатки файлов при прошлой проверке, (статус, описание))
+        self._cache = {}
+        self.finished.connect(self._start_pending)
+
+    def scan(self, records):
+        """
+        Запускает проверку снимка записей. Вызов во время работы откладывается до ее конца:
+        несколько таких вызовов дают одну повторную проверку по последнему снимку.
+        Возвращает, началась ли проверка сразу.
+        """
+        jobs = [(record['id'], record_paths(record)) for record in records]
+        if self.isRunning():
+            self._pending = jobs
+            return False
+        self._jobs = jobs
+        self.start(QThread.Priority.LowestPriority)
+        return True
+
+    def stop(self):
+        """Прерывает проверку и отбрасывает отложенную; возвращается после остановки потока"""
+        self._pending = None
+        self.requestInterruption()
+        self.wait()
+
+    def _start_pending(self):
+        # finished прошлого запуска может прийти, когда уже идет следующий: тогда ждем его конца
+        if self._pending is None or self.isRunning():
+            return
+        self._jobs, self._pending = self._pending, None
+        self.start(QThread.Priority.LowestPriority)
+
+    def run(self):
+        changed = {}
+        for index, (record_id, paths) in enumerate(self._jobs):
+            if self.isInterruptionRequested():
+                return
+            current = tuple(self._stat(path) for path, _ in paths)
+            cached = self._cache.get(record_id)
+            # Файлы не трогали с прошлой проверки — статус прежний
+            if cached is None or cached[0] != current:
+                status = self._check(paths, current)
+                self._cache[record_id] = (current, status)
+                if cached is None or cached[1] != status:
+                    changed[record_id] = status
+            if (index + 1) % self.BATCH_SIZE == 0:
+                if changed:
+                    self.statuses_changed.emit(changed)
+                    changed = {}
+                self.msleep(self.BATCH_PAUSE_MS)
+        if changed:
+            self.statuses_changed.emit(changed)
+
+    def status(self, record_id):
+        cached = self._cache.get(record_id)
+        return cached[1] if cached is not None else None
+
+    def forget(self, record_ids):
+        for record_id in record_ids:
+            self._cache.pop(record_id, None)
+
+    @staticmethod
+    def _stat(path):
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    @staticmethod
+    def _check(paths, current):
+        missing = []
+        changed = []
+        for (path, expected), stat in zip(paths, current):
+            if stat is None:
+                missing.append(path)
+            elif expected and (expected.get('mtime_ns'), expected.get('size')) != stat:
+                changed.append(path)
+        if missing:
+            return STATUS_MISSING, "Файлы не найдены:\n" + "\n".join(missing)
+        if changed:
+            return STATUS_CHANGED, "Файлы изменены после генерации:\n" + "\n".join(changed)
+        return STATUS_OK, ""
@@ -0,0 +1,200 @@
+import math
+import re
+
+MODE_FUZZY = 'fuzzy'
+# Прежний порядок поиска _deep_search_for_key: подстроки без нормализации, первый найденный обходом в глубину
+MODE_COMPAT = 'compat'
+MODES = (MODE_FUZZY, MODE_COMPAT)
+
+_SCALARS = (str, int, float, bool)
+
+# Границы слов: lastName, HTTPServer, Номер2Дома
+_LOWER_UPPER = re.compile(r'(?<=[^\W_A-ZА-ЯЁ])(?=[A-ZА-ЯЁ])')
+_ACRONYM = re.compile(r'(?<=[A-ZА-ЯЁ])(?=[A-ZА-ЯЁ][^\W\d_A-ZА-ЯЁ])')
+_SEPARATORS = re.compile(r'[\W_]+')
+
+
+def key_tokens(key):
+    """Слова ключа без регистра: lastName, last_name, Last.Name -> ('last', 'name')"""
+    key = _ACRONYM.sub(' ', _LOWER_UPPER.sub(' ', str(key)))
+    return tuple(token.casefold() for token in _SEPARATORS.split(key) if token)
+
+
+def _trigrams(text):
+    if len(text) < 3:
+        return {text}
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+class KeyMatcher:
+    """
+    Сопоставление имен элементов XSD с ключами сценария.
+    Индекс ключей строится один раз на сценарий; решения кэшируются по имени элемента.
+    В режиме fuzzy ключи сравниваются после нормализации (регистр, camelCase, snake_case, точки):
+    сначала точное совпадение слов, затем лучший по оценке кандидат из индекса слов и триграмм.
+    В режиме compat вызывается прежний поиск compat_search, результаты только кэшируются.
+    compact — для больших сценариев: в индексе остается одна запись на ключ (с одинаковыми словами
+    и нормализованным видом), лучшая по рангу; результаты поиска те же, память ограничена словарем ключей.
+    """
+
+    # Минимальная оценка нечеткого совпадения (доля общей части в более длинном ключе)
+    MIN_SCORE = 0.5
+
+    def __init__(self, scenario, mode=MODE_FUZZY, compat_search=None, compact=False):
+        if mode not in MODES:
+            raise ValueError(f"Неизвестный режим сопоставления ключей: {mode}")
+        if mode == MODE_COMPAT and compat_search is None:
+            raise ValueError("Для режима compat нужна функция прежнего поиска")
+        self.scenario = scenario
+        self.mode = mode
+        self.compat_search = compat_search
+        self.compact = compact
+        self._cache = {}
+        self._entries = None
+
+    def lookup(self, name):
+        """Значение сценария для элемента name или None"""
+        return self.resolve(name)[0]
+
+    def resolve(self, name):
+        """
+        (значение, путь в сценарии) для элемента name; путь — список ключей и индексов.
+        В режиме compat путь неизвестен и всегда None.
+        """
+        cache_key = name.lower() if self.mode == MODE_COMPAT else key_tokens(name)
+        if cache_key in self._cache:
+            return self._cache[cache_key]
+        if self.mode == MODE_COMPAT:
+            resolved = self.compat_search(self.scenario, name), None
+        else:
+            resolved = self._fuzzy_lookup(cache_key)
+        self._cache[cache_key] = resolved
+        return resolved
+
+    def _build_index(self):
+        """
+        Простые значения сценария с их ключами в порядке обхода в глубину.
+        Для списка простых значений берется первый элемент, как и в прежнем поиске.
+        """
+        self._entries = []
+        self._by_canonical = {}
+        self._by_token = {}
+        self._by_trigram = {}
+        # Ключи короче триграммы не попадают в индекс вхождений, их немного — проверяем перебором
+        self._short_entries = []
+        # Порядковый номер значения в обходе (ранг) и, в компактном режиме, запись каждого ключа
+        self._seen = 0
+        self._by_group = {}
+        stack = [(self.scenario, 0, ())]
+        while stack:
+            obj, depth, path = stack.pop()
+            if isinstance(obj, dict):
+                children = []
+                for key, value in obj.items():
+                    if isinstance(value, list) and value and isinstance(value[0], _SCALARS):
+                        self._add_entry(key, value[0], depth, path + (key, 0))
+                    elif isinstance(value, _SCALARS):
+                        self._add_entry(key, value, depth, path + (key,))
+                    elif isinstance(value, (dict, list)):
+                        children.append((value, depth + 1, path + (key,)))
+                stack.extend(reversed(children))
+            elif isinstance(obj, list):
+                stack.extend(reversed([(item, depth + 1, path + (i,)) for i, item in enumerate(obj)
+                                       if isinstance(item, (dict, list))]))
+
+    def _add_entry(self, key, value, depth, path):
+        tokens = key_tokens(key)
+        canonical = ''.join(tokens)
+        if not canonical:
+            return
+        order = self._seen
+        self._seen += 1
+        if self.compact:
+            # Записи одного ключа набирают одинаковую оценку, выигрывает меньший ранг — остальные не нужны
+            group = (canonical, tokens)
+            entry_id = self._by_group.get(group)
+            if entry_id is not None:
+                if self._entries[entry_id][0][0] > depth:
+                    entry = self._entries[entry_id]
+                    self._entries[entry_id] = ((depth, order),) + entry[1:3] + (value, list(path))
+                    current = self._by_canonical[canonical]
+                    if current != entry_id and self._entries[current][0][0] > depth:
+                        self._by_canonical[canonical] = entry_id
+                return
+            self._by_group[group] = len(self._entries)
+        # (ранг по глубине и порядку, слова, нормализованный ключ, значение, путь в сценарии)
+        entry_id = len(self._entries)
+        self._entries.append(((depth, order), frozenset(tokens), canonical, value, list(path)))
+        # Для точного совпадения выбираем ключ ближе к корню, при равенстве — первый в сценарии
+        current = self._by_canonical.get(canonical)
+        if current is None or self._entries[current][0][0] > depth:
+            self._by_canonical[canonical] = entry_id
+        for token in set(tokens):
+            self._by_token.setdefault(token, []).append(entry_id)
+        for gram in _trigrams(canonical):
+            self._by_trigram.setdefault(gram, []).append(entry_id)
+        if len(canonical) <= 4:
+            self._short_entries.append(entry_id)
+
+    @staticmethod
+    def _score(tokens, canonical, entry_tokens, entry_canonical):
+        # Одно имя содержит другое (как прежнее правило подстрок), либо совпадает часть слов в любом порядке
+        score = 0.0
+        if canonical in entry_canonical or entry_canonical in canonical:
+            score = min(len(canonical), len(entry_canonical)) / max(len(canonical), len(entry_canonical))
+        common = len(tokens & entry_tokens)
+        if common:
+            score = max(score, common / len(tokens | entry_tokens))
+        return score
+
+    def _candidates(self, tokens, canonical):
+        """
+        Ключи, которые могут набрать MIN_SCORE, без полного перебора (фильтрация по редким признакам):
+        ключ, содержащий имя, содержит и самую редкую его триграмму; ключ, содержащийся в имени, —
+        это подстрока имени не короче MIN_SCORE его длины; при доле общих слов не меньше MIN_SCORE
+        ключ обязан содержать одно из самых редких слов имени.
+        """
+        candidates = set()
+        if len(canonical) >= 3:
+            rarest = min(_trigrams(canonical), key=lambda gram: len(self._by_trigram.get(gram, ())))
+            candidates.update(self._by_trigram.get(rarest, ()))
+        else:
+            candidates.update(self._short_entries)
+
+        length = len(canonical)
+        for size in range(max(1, math.ceil(length * self.MIN_SCORE)), length):
+            for start in range(length - size + 1):
+                entry_id = self._by_canonical.get(canonical[start:start + size])
+                if entry_id is not None:
+                    candidates.add(entry_id)
+
+        unique = sorted(set(tokens), key=lambda token: len(self._by_token.get(token, ())))
+        for token in unique[:len(unique) - math.ceil(len(unique) * self.MIN_SCORE) + 1]:
+            candidates.update(self._by_token.get(token, ()))
+        return candidates
+
+    def _fuzzy_lookup(self, tokens):
+        if self._entries is None:
+            self._build_index()
+        canonical = ''.join(tokens)
+        if not canonical:
+            return None, None
+
+        # Точное совпадение после нормализации: lastName == last_name == LastName
+        entry_id = self._by_canonical.get(canonical)
+        if entry_id is not None:
+            return self._entries[entry_id][3], self._entries[entry_id][4]
+
+        candidates = self._candidates(tokens, canonical)
+        tokens = frozenset(tokens)
+        best = None
+        for entry_id in candidates:
+            rank, entry_tokens, entry_canonical, value, path = self._entries[entry_id]
+            score = self._score(tokens, canonical, entry_tokens, entry_canonical)
+            if score < self.MIN_SCORE:
+                continue
+            # Выше оценка, затем ключ ближе к корню и раньше в сценарии
+            candidate = (-score, rank)
+            if best is None or candidate < best[0]:
+                best = (candidate, (value, path))
+        return best[1] if best is not None else (None, None)
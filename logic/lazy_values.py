@@ -0,0 +1,239 @@
+import codecs
+import itertools
+import json
+import mmap
+import os
+import re
+import threading
+import weakref
+
+# Строки сценария длиннее этого (в байтах файла) не загружаются в память: вместо них в сценарии маркер,
+# а содержимое читается из файла при записи шаблонов
+LAZY_VALUE_BYTES = 64 * 1024
+# Порция чтения значения при записи
+STREAM_BLOCK_BYTES = 1024 * 1024
+# Самая длинная escape-последовательность JSON, которую нельзя разрезать: суррогатная пара \uXXXX\uXXXX
+_ESCAPE_WINDOW = 12
+
+_CONTROL_BYTES = bytes(range(0x20))
+_HIGH_SURROGATE_RE = re.compile(rb'\\u[dD][89abAB][0-9a-fA-F]{2}')
+_SPACE = b' \t\r\n'
+MARKER_RE = re.compile('\x00lazy:(\\d+)\x00')
+
+# Живые отложенные значения по номеру маркера; значение исчезает вместе со сценарием, который его держит
+_values = weakref.WeakValueDictionary()
+_values_lock = threading.Lock()
+_counter = itertools.count(1)
+
+
+class LazyValue(str):
+    """
+    Длинная строка сценария, оставленная в файле. Как str это маркер '\\x00lazy:N\\x00': он проходит
+    сопоставление, экранирование и подстановку как обычное значение и раскрывается только при записи
+    (write_expanded). path, start, end — файл и байты содержимого строки без кавычек.
+    """
+
+    def __new__(cls, path, start, end, stamp):
+        number = next(_counter)
+        value = super().__new__(cls, f'\x00lazy:{number}\x00')
+        value.number = number
+        value.path = path
+        value.start = start
+        value.end = end
+        value.stamp = stamp
+        with _values_lock:
+            _values[number] = value
+        return value
+
+    @property
+    def size(self):
+        return self.end - self.start
+
+    def describe(self):
+        """Подпись значения для сводок вместо маркера"""
+        return f"<значение из сценария, {self.size / (1024 * 1024):.1f} МБ>"
+
+    def iter_escaped(self, block=STREAM_BLOCK_BYTES):
+        """Содержимое строки порциями: escape-последовательности JSON раскрыты, &, <, > экранированы для XML"""
+        with open(self.path, 'rb') as f:
+            stat = os.fstat(f.fileno())
+            if [stat.st_size, stat.st_mtime_ns] != self.stamp:
+                raise ValueError(f"Сценарий {self.path} изменился во время генерации")
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                decoder = codecs.getincrementaldecoder('utf-8')()
+                position = self.start
+                while position < self.end:
+                    cut = min(position + block, self.end)
+                    if cut < self.end:
+                        cut = _escape_boundary(data, position, cut, self.end)
+                    text = decoder.decode(data[position:cut], final=cut == self.end)
+                    if '\\' in text:
+                        text = json.loads('"' + text + '"')
+                    yield text.replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;')
+                    position = cut
+
+
+def _escape_boundary(data, start, cut, end):
+    """
+    Граница порции не внутри escape-последовательности: перед серией обратных слэшей у конца порции.
+    Суррогатная пара \\uD8xx\\uDCxx тоже не разделяется.
+    """
+    backslash = data.find(b'\\', max(start, cut - _ESCAPE_WINDOW), cut)
+    if backslash == -1:
+        return cut
+    while backslash > start and data[backslash - 1] == 0x5c:
+        backslash -= 1
+    if backslash <= start:
+        return end
+    high = backslash - 6
+    if high >= start and _HIGH_SURROGATE_RE.fullmatch(data[high:backslash]):
+        # Обратный слэш начинает escape, если перед ним четное число обратных слэшей
+        slashes = 0
+        while high - 1 - slashes >= start and data[high - 1 - slashes] == 0x5c:
+            slashes += 1
+        if slashes % 2 == 0:
+            return high if high > start else min(backslash + 6, end)
+    return backslash
+
+
+def _has_control(data, start, end):
+    """Есть ли в байтах управляющие символы (в строке JSON они недопустимы); проверка порциями без regex"""
+    for position in range(start, end, STREAM_BLOCK_BYTES):
+        block = data[position:min(position + STREAM_BLOCK_BYTES, end)]
+        if len(block.translate(None, _CONTROL_BYTES)) != len(block):
+            return True
+    return False
+
+
+def _skip_space(data, position, step):
+    while 0 <= position < len(data) and data[position] in _SPACE:
+        position += step
+    return position
+
+
+def _long_runs(data):
+    """
+    Участки от кавычки до следующей кавычки длиннее LAZY_VALUE_BYTES: (начало, конец) без кавычек.
+    Такой участок целиком накрывает одно из подряд идущих окон в половину порога, поэтому достаточно
+    проверить окна на кавычку (find в C) и только у пустых окон искать границы участка.
+    """
+    half = LAZY_VALUE_BYTES // 2
+    size = len(data)
+    position = 0
+    while position + half <= size:
+        window_end = position + half
+        if data.find(b'"', position, window_end) != -1:
+            position = window_end
+            continue
+        start = data.rfind(b'"', 0, position) + 1
+        end = data.find(b'"', window_end)
+        if end == -1:
+            return
+        if start and end - start >= LAZY_VALUE_BYTES:
+            yield start, end
+        position = end + 1
+
+
+def _string_value_spans(data):
+    """
+    Байты содержимого длинных строк-значений JSON: (начало, конец) без кавычек.
+    Кандидат — длинный участок между кавычками (_long_runs); он принимается, только если это значение
+    (перед кавычкой ':', ',' или '[', после закрывающей — ',', '}' или ']'), внутри нет управляющих символов,
+    экранированных кавычек и '$' (значение с '$' в шаблоне читалось бы как плейсхолдер, оставляем его как есть).
+    """
+    spans = []
+    for start, end in _long_runs(data):
+        before = _skip_space(data, start - 2, -1)
+        after = _skip_space(data, end + 1, 1)
+        if before < 0 or data[before] not in b':,[' or after >= len(data) or data[after] not in b',}]':
+            continue
+        # Кавычка после нечетного числа обратных слэшей экранирована: строка на этом не кончается
+        slashes = 0
+        while data[end - 1 - slashes] == 0x5c:
+            slashes += 1
+        if slashes % 2 or data.find(b'$', start, end) != -1 or _has_control(data, start, end):
+            continue
+        spans.append((start, end))
+    return spans
+
+
+def load_json_lazily(path):
+    """
+    Сценарий JSON, в котором длинные строки заменены на LazyValue. Возвращает None, если длинных строк нет
+    или текст без них не разбирается как JSON: тогда файл загружается обычным способом.
+    """
+    path = os.path.abspath(path)
+    with open(path, 'rb') as f:
+        stat = os.fstat(f.fileno())
+        if stat.st_size <= LAZY_VALUE_BYTES:
+            return None
+        stamp = [stat.st_size, stat.st_mtime_ns]
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            spans = _string_value_spans(data)
+            if not spans:
+                return None
+            pieces = []
+            position = 0
+            for number, (start, end) in enumerate(spans):
+                pieces.append(data[position:start])
+                pieces.append(b'\\u0000lazy:%d\\u0000' % number)
+                position = end
+            pieces.append(data[position:])
+    try:
+        scenario = json.loads(b''.join(pieces).decode('utf-8'))
+    except ValueError:
+        return None
+
+    # Маркеры разбора (номера длинных строк) -> отложенные значения
+    stack = [scenario]
+    while stack:
+        node = stack.pop()
+        items = node.items() if isinstance(node, dict) else enumerate(node)
+        for key, value in items:
+            if isinstance(value, (dict, list)):
+                stack.append(value)
+            elif isinstance(value, str) and value.startswith('\x00lazy:'):
+                match = MARKER_RE.fullmatch(value)
+                if match:
+                    start, end = spans[int(match.group(1))]
+                    node[key] = LazyValue(path, start, end, stamp)
+    return scenario
+
+
+def find_values(texts):
+    """Отложенные значения, маркеры которых встречаются в текстах: номер -> LazyValue"""
+    found = {}
+    for text in texts:
+        if '\x00' not in text:
+            continue
+        for match in MARKER_RE.finditer(text):
+            number = int(match.group(1))
+            if number not in found:
+                with _values_lock:
+                    value = _values.get(number)
+                if value is None:
+                    raise ValueError("Значение сценария для маркера шаблона больше недоступно")
+                found[number] = value
+    return found
+
+
+def write_expanded(f, text, values):
+    """Пишет текст в файл, раскрывая маркеры значений из values (см. find_values) порциями из сценария"""
+    position = 0
+    for match in MARKER_RE.finditer(text):
+        value = values.get(int(match.group(1)))
+        if value is None:
+            continue
+        f.write(text[position:match.start()])
+        for chunk in value.iter_escaped():
+            f.write(chunk)
+        position = match.end()
+    f.write(text[position:] if position else text)
+
+
+def describe_markers(text, values):
+    """Текст с подписями значений вместо маркеров (для сводок результата)"""
+    if not values or '\x00' not in text:
+        return text
+    return MARKER_RE.sub(lambda m: values[int(m.group(1))].describe() if int(m.group(1)) in values
+                         else m.group(0), text)
@@ -0,0 +1,182 @@
+import json
+import os
+import re
+import threading
+from pathlib import Path
+
+import config
+
+# Режимы профиля при генерации
+MAPPING_AUTO = 'auto'        # применить сохраненный профиль схемы, если он есть
+MAPPING_OFF = 'off'          # только эвристики
+MAPPING_CAPTURE = 'capture'  # эвристики, результат сохраняется как профиль схемы
+MAPPING_MODES = (MAPPING_AUTO, MAPPING_OFF, MAPPING_CAPTURE)
+
+PROFILE_VERSION = 1
+
+# Значения нет в сценарии
+MISSING = object()
+
+# Шаг пути: ключ, [индекс] или ["ключ"] для ключей с точками и скобками
+_PATH_STEP = re.compile(r'([^.\[\]"]+)|\[(\d+)\]|\[("(?:[^"\\]|\\.)*")\]')
+_PLAIN_KEY = re.compile(r'[^.\[\]"]+')
+
+
+def parse_scenario_path(path):
+    """'person.docs[0].number' -> ['person', 'docs', 0, 'number']; 'a["b.c"]' -> ['a', 'b.c']"""
+    steps = []
+    for key, index, quoted in _PATH_STEP.findall(path):
+        if quoted:
+            steps.append(json.loads(quoted))
+        else:
+            steps.append(int(index) if index else key)
+    return steps
+
+
+def format_scenario_path(steps):
+    path = ''
+    for step in steps:
+        if isinstance(step, int):
+            path += f'[{step}]'
+        elif not _PLAIN_KEY.fullmatch(str(step)):
+            path += f'[{json.dumps(str(step), ensure_ascii=False)}]'
+        else:
+            path += f'.{step}' if path else str(step)
+    return path
+
+
+def compile_accessor(path):
+    """Функция доступа к значению сценария по пути; MISSING, если пути нет"""
+    steps = parse_scenario_path(path)
+
+    def accessor(scenario):
+        value = scenario
+        for step in steps:
+            try:
+                value = value[step]
+            except (KeyError, IndexError, TypeError):
+                return MISSING
+        return value
+
+    return accessor
+
+
+def _placeholder_name(xsd_path):
+    # Имя переменной, которую генератор ставит вместо значения элемента (см. FileProcessor._to_camel_case)
+    parts = re.split(r'[_\-\s\.]+', xsd_path.rsplit('/', 1)[-1])
+    return parts[0] + ''.join(p.title() for p in parts[1:])
+
+
+class MappingProfile:
+    """
+    Явные правила «путь элемента XSD -> путь в сценарии» для одной схемы.
+    Правило со значением None означает, что у элемента нет значения в сценарии (остается плейсхолдер).
+    Пути компилируются в функции доступа при создании профиля, поиск по сценарию не нужен.
+    """
+
+    def __init__(self, rules, placeholders=None, schema_hash=None):
+        self.rules = dict(rules)
+        self.schema_hash = schema_hash
+        self._accessors = {xsd_path: compile_accessor(path) if path else None
+                           for xsd_path, path in self.rules.items()}
+        # Пути-предки элементов с правилами: узлы, поддерево которых зависит от профиля
+        self._prefixes = set()
+        for xsd_path in self.rules:
+            parts = xsd_path.split('/')
+            for i in range(1, len(parts) + 1):
+                self._prefixes.add('/'.join(parts[:i]))
+
+        # Плейсхолдеры частичной подстановки: явные из профиля, затем выведенные из правил элементов
+        self.placeholders = dict(placeholders or {})
+        # Имя, которое есть и у элемента без значения, профилем не описывается: его плейсхолдер остается прежнему поиску
+        derived = {}
+        unresolved = {_placeholder_name(xsd_path) for xsd_path, path in self.rules.items() if not path}
+        for xsd_path, path in self.rules.items():
+            name = _placeholder_name(xsd_path)
+            if path and name not in unresolved:
+                derived.setdefault(name, path)
+        for name, path in derived.items():
+            self.placeholders.setdefault(name, path)
+        self._placeholder_accessors = {name: compile_accessor(path) for name, path in self.placeholders.items()}
+
+    def covers(self, xsd_path):
+        return xsd_path in self._accessors
+
+    def has_rules_under(self, xsd_path):
+        return xsd_path in self._prefixes
+
+    def value(self, xsd_path, scenario):
+        """
+        Значение элемента по правилу: None, если по правилу значения нет,
+        MISSING, если пути правила нет в этом сценарии (правило записано по другому сценарию)
+        """
+        accessor = self._accessors[xsd_path]
+        return accessor(scenario) if accessor is not None else None
+
+    def placeholder_value(self, name, scenario):
+        """Значение плейсхолдера по профилю; None, если профиль его не описывает, MISSING, если пути нет в сценарии"""
+        accessor = self._placeholder_accessors.get(name)
+        if accessor is None:
+            return None
+        return accessor(scenario)
+
+    def stale_rules(self, scenario):
+        """Пути элементов, правила которых указывают на отсутствующие в сценарии пути"""
+        return [xsd_path for xsd_path, accessor in self._accessors.items()
+                if accessor is not None and accessor(scenario) is MISSING]
+
+    def to_dict(self):
+        return {'version': PROFILE_VERSION, 'schema_hash': self.schema_hash,
+                'rules': self.rules, 'placeholders': self.placeholders}
+
+    @classmethod
+    def from_dict(cls, data):
+        if data.get('version', 1) > PROFILE_VERSION:
+            raise ValueError(f"Неподдерживаемая версия профиля: {data.get('version')}")
+        return cls(data.get('rules', {}), data.get('placeholders'), data.get('schema_hash'))
+
+
+def profile_path(schema_hash, profile_dir=None):
+    return Path(profile_dir or config.PROFILE_DIR) / f"{schema_hash}.json"
+
+
+# Скомпилированные профили: хэш схемы -> (mtime_ns файла профиля, профиль)
+_profile_cache = {}
+_profile_cache_lock = threading.Lock()
+
+
+def load_profile(schema_hash, profile_dir=None):
+    """Профиль схемы или None; компилируется заново, только если файл профиля изменился"""
+    path = profile_path(schema_hash, profile_dir)
+    try:
+        mtime = os.stat(path).st_mtime_ns
+    except OSError:
+        return None
+    key = str(path)
+    with _profile_cache_lock:
+        cached = _profile_cache.get(key)
+    if cached is not None and cached[0] == mtime:
+        return cached[1]
+    with open(path, encoding='utf-8') as f:
+        profile = MappingProfile.from_dict(json.load(f))
+    with _profile_cache_lock:
+        _profile_cache[key] = (mtime, profile)
+    return profile
+
+
+def save_profile(profile, profile_dir=None):
+    path = profile_path(profile.schema_hash, profile_dir)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_suffix('.tmp')
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(profile.to_dict(), f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, path)
+    return path
+
+
+def delete_profile(schema_hash, profile_dir=None):
+    path = profile_path(schema_hash, profile_dir)
+    if path.exists():
+        path.unlink()
+        return True
+    return False
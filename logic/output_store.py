@@ -0,0 +1,202 @@
+import gzip
+import hashlib
+import os
+import shutil
+import struct
+import tempfile
+import time
+from pathlib import Path
+
+import config
+
+# Блок потокового чтения при хэшировании и распаковке
+_CHUNK = 1024 * 1024
+# Файлы моложе этого gc не трогает: временный файл может еще дописываться, а только что положенный
+# или повторно использованный блок — еще не попасть в сохраненную историю
+GC_GRACE_SECONDS = 3600
+
+
+class OutputStore:
+    """
+    Хранилище результатов по содержимому: файл лежит один раз под своим SHA-256 в сжатом виде.
+    Повторные запуски с тем же результатом места не занимают; записи истории ссылаются на хэши.
+    """
+
+    def __init__(self, root=None):
+        self.root = Path(root or config.OUTPUT_STORE_DIR)
+
+    def _blob_path(self, digest):
+        return self.root / digest[:2] / f"{digest[2:]}.gz"
+
+    def exists(self, digest):
+        return self._blob_path(digest).exists()
+
+    def put_file(self, path):
+        """
+        Кладет файл в хранилище и возвращает его хэш.
+        Хэш и сжатие считаются за один проход во временный файл; если такой блок уже есть, он не перезаписывается.
+        """
+        self.root.mkdir(parents=True, exist_ok=True)
+        sha = hashlib.sha256()
+        # В имени временного файла номер процесса: видно, чей это файл, если процесс прервется
+        fd, tmp_path = tempfile.mkstemp(dir=self.root, prefix=f"{os.getpid()}-", suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as raw, gzip.GzipFile(fileobj=raw, mode='wb', mtime=0) as gz, \
+                    open(path, 'rb') as src:
+                for chunk in iter(lambda: src.read(_CHUNK), b''):
+                    sha.update(chunk)
+                    gz.write(chunk)
+            digest = sha.hexdigest()
+            blob = self._blob_path(digest)
+            if blob.exists():
+                os.unlink(tmp_path)
+                try:
+                    # Блок снова нужен: молодой блок gc не удалит, пока запись не сохранена
+                    os.utime(blob)
+                    return digest
+                except FileNotFoundError:
+                    # gc удалил блок между проверкой и отметкой: кладем его заново
+                    return self.put_file(path)
+            # gc может удалить пустой каталог между mkdir и replace — тогда создаем его снова
+            for attempt in range(3):
+                blob.parent.mkdir(exist_ok=True)
+                try:
+                    os.replace(tmp_path, blob)
+                    break
+                except FileNotFoundError:
+                    if attempt == 2 or not os.path.exists(tmp_path):
+                        raise
+            return digest
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            raise
+
+    def open(self, digest):
+        blob = self._blob_path(digest)
+        if not blob.exists():
+            raise FileNotFoundError(f"В хранилище нет файла {digest}")
+        return gzip.open(blob, 'rb')
+
+    def size(self, digest):
+        """Размер файла без сжатия: из последних 4 байт gzip (по модулю 4 ГБ)"""
+        blob = self._blob_path(digest)
+        if not blob.exists():
+            raise FileNotFoundError(f"В хранилище нет файла {digest}")
+        with open(blob, 'rb') as f:
+            f.seek(-4, os.SEEK_END)
+            return struct.unpack('<I', f.read(4))[0]
+
+    def materialize(self, digest, dest_path):
+        """Распаковывает файл из хранилища по пути dest_path"""
+        dest_path = Path(dest_path)
+        dest_path.parent.mkdir(parents=True, exist_ok=True)
+        with self.open(digest) as src, open(dest_path, 'wb') as dst:
+            shutil.copyfileobj(src, dst, _CHUNK)
+        return dest_path
+
+    def iter_digests(self):
+        if not self.root.exists():
+            return
+        for blob in self.root.glob('??/*.gz'):
+            yield blob.parent.name + blob.name[:-3]
+
+    def gc(self, referenced):
+        """
+        Удаляет файлы, на которые не ссылается ни одна запись. Возвращает {'removed', 'freed_bytes', 'kept'}.
+        Файлы моложе GC_GRACE_SECONDS остаются: их может в это же время класть put_file другого процесса.
+        """
+        referenced = set(referenced)
+        summary = {'removed': 0, 'freed_bytes': 0, 'kept': 0}
+        cutoff = time.time() - GC_GRACE_SECONDS
+        for digest in list(self.iter_digests()):
+            blob = self._blob_path(digest)
+            try:
+                stat = blob.stat()
+                if digest in referenced or stat.st_mtime > cutoff:
+                    summary['kept'] += 1
+                    continue
+                blob.unlink()
+            except FileNotFoundError:
+                continue
+            summary['freed_bytes'] += stat.st_size
+            summary['removed'] += 1
+        # Пустые каталоги и недописанные временные файлы прерванных запусков
+        if self.root.exists():
+            for tmp in self.root.glob('*.tmp'):
+                try:
+                    if tmp.stat().st_mtime <= cutoff:
+                        tmp.unlink()
+                except FileNotFoundError:
+                    pass
+            for directory in self.root.iterdir():
+                if directory.is_dir() and not any(directory.iterdir()):
+                    try:
+                        directory.rmdir()
+                    except OSError:
+                        # put_file уже положил сюда новый блок
+                        pass
+        return summary
+
+
+class StoredOutput:
+    """Результат записи истории в хранилище как источник для просмотра и сравнения"""
+
+    def __init__(self, store, digest, name):
+        self.store = store
+        self.digest = digest
+        self.name = name
+
+    def open(self):
+        return self.store.open(self.digest)
+
+    def size(self):
+        return self.store.size(self.digest)
+
+
+def output_sources(record):
+    """
+    Результаты записи по типам: StoredOutput, если файл сохранен в хранилище, иначе путь.
+    Файл в папке результатов мог быть перезаписан следующим запуском, а в хранилище лежит именно этот.
+    """
+    sources = {}
+    store = None
+    for item in record.get('files', {}).get('output', []):
+        if item.get('hash'):
+            store = store or OutputStore()
+            if store.exists(item['hash']):
+                sources[item['type']] = StoredOutput(store, item['hash'], item.get('name', ''))
+                continue
+        sources[item['type']] = item['path']
+    return sources
+
+
+def read_text(source):
+    """Текст результата: путь к файлу или StoredOutput"""
+    if isinstance(source, StoredOutput):
+        with source.open() as f:
+            return f.read().decode('utf-8', errors='replace')
+    return Path(source).read_text(encoding='utf-8', errors='replace')
+
+
+def store_outputs(record, store):
+    """Кладет результаты записи истории в хранилище и сохраняет их хэши в record['files']['output']"""
+    for item in record.get('files', {}).get('output', []):
+        item['hash'] = store.put_file(item['path'])
+
+
+def referenced_digests(history):
+    for record in history:
+        for item in record.get('files', {}).get('output', []):
+            if item.get('hash'):
+                yield item['hash']
+
+
+def materialize_record(record, store, dest_dir):
+    """Выгружает результаты записи из хранилища в dest_dir под исходными именами; возвращает пути"""
+    paths = []
+    for item in record.get('files', {}).get('output', []):
+        if not item.get('hash'):
+            raise ValueError(f"Файл {item.get('name', item['path'])} не сохранен в хранилище")
+        paths.append(str(store.materialize(item['hash'], Path(dest_dir) / item['name'])))
+    return paths
@@ -0,0 +1,163 @@
+import copy
+import os
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from datetime import datetime
+from pathlib import Path
+
+from logic.file_processor import FileProcessor
+from logic.output_store import store_outputs
+
+
+def file_fingerprint(path):
+    """Отпечаток файла для проверки изменений без чтения содержимого"""
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return {'mtime_ns': stat.st_mtime_ns, 'size': stat.st_size}
+
+
+def record_inputs(record):
+    """Пути сценария и XSD, а также папка результатов записи истории"""
+    inputs = {item['type']: item['path'] for item in record.get('files', {}).get('input', [])}
+    outputs = record.get('files', {}).get('output', [])
+    output_dir = str(Path(outputs[0]['path']).parent) if outputs else None
+    return inputs.get('scenario'), inputs.get('xsd'), output_dir
+
+
+def input_fingerprints(record):
+    """Отпечатки входов записи и модулей, подключаемых ее схемой (xs:include/xs:import)"""
+    paths = [item['path'] for item in record.get('files', {}).get('input', [])] + record.get('schema_modules', [])
+    return {path: file_fingerprint(path) for path in paths}
+
+
+def track_schema_modules(record):
+    """Запоминает в записи файлы модулей ее схемы, чтобы их изменение тоже вело к перегенерации"""
+    xsd_path = record_inputs(record)[1]
+    try:
+        graph = FileProcessor._schema_graph(xsd_path) if xsd_path else None
+    except (OSError, RuntimeError, ValueError):
+        graph = None
+    record['schema_modules'] = [module.path for module in graph.modules] if graph is not None else []
+
+
+def output_fingerprints(record):
+    return {item['path']: file_fingerprint(item['path']) for item in record.get('files', {}).get('output', [])}
+
+
+def is_up_to_date(record):
+    """Запись не нужно пересобирать: входы не менялись с прошлого запуска и результаты на месте"""
+    saved = record.get('fingerprints')
+    if not saved or saved != input_fingerprints(record):
+        return False
+    return all(os.path.exists(item['path']) for item in record.get('files', {}).get('output', []))
+
+
+def apply_result(record, result, store=None):
+    """Обновляет запись истории на месте по результату build_vm_template; store — OutputStore или None"""
+    record['date'] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    if not result['success']:
+        record['result'] = f"Ошибка перегенерации: {result['error']}"
+        return
+    record['result'] = f"Успешно сгенерированы ({result['replacements_count']} замен)"
+    record['full_path'] = result['raw_output_path']
+    record['files']['output'] = [
+        {'type': 'raw_vm', 'path': result['raw_output_path'],
+         'name': os.path.basename(result['raw_output_path'])},
+        {'type': 'filled_vm', 'path': result['filled_output_path'],
+         'name': os.path.basename(result['filled_output_path'])}
+    ]
+    track_schema_modules(record)
+    record['fingerprints'] = input_fingerprints(record)
+    record['output_fingerprints'] = output_fingerprints(record)
+    if store is not None:
+        store_outputs(record, store)
+
+
+def regenerate_records(records, workers=4, force=False, on_progress=None, store=None):
+    """
+    Перегенерирует шаблоны записей истории в пуле потоков.
+    Каждая XSD разбирается один раз и дальше берется из общего кэша FileProcessor.
+    Записи с одной папкой результатов перегенерируются по очереди (иначе они перезаписывали бы файлы
+    и состояние друг друга), разные папки — параллельно.
+    Записи с неизменными входами пропускаются, если не указан force.
+    on_progress(готово, всего, запись, статус) вызывается в потоке, вызвавшем regenerate_records;
+    статус: 'ok', 'skipped' или 'failed'.
+    Если передан store, результаты кладутся в хранилище и записи получают их хэши.
+    Сами записи не меняются: обновленные копии возвращаются в сводке, и применить их нужно в потоке,
+    которому принадлежат записи (apply_updates). Возвращает сводку
+    {'total', 'regenerated', 'skipped', 'failed', 'errors', 'updates'}.
+    """
+    summary = {'total': len(records), 'regenerated': 0, 'skipped': 0, 'failed': 0, 'errors': [], 'updates': []}
+    done = 0
+
+    def report(record, status):
+        nonlocal done
+        done += 1
+        summary[status if status != 'ok' else 'regenerated'] += 1
+        if on_progress is not None:
+            on_progress(done, summary['total'], record, status)
+
+    # Папка результатов -> очередь ее записей
+    queues = {}
+    for record in records:
+        if not force and is_up_to_date(record):
+            report(record, 'skipped')
+        else:
+            output_dir = record_inputs(record)[2]
+            key = os.path.normcase(os.path.abspath(output_dir)) if output_dir else None
+            queues.setdefault(key, []).append(record)
+    if not queues:
+        return summary
+
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        # Сначала разбираем каждую из использованных схем по одному разу
+        schemas = {record_inputs(record)[1] for queue in queues.values() for record in queue
+                   if record_inputs(record)[1]}
+        for future in [pool.submit(FileProcessor._load_structure, xsd_path) for xsd_path in schemas]:
+            try:
+                future.result()
+            except Exception:
+                # Ошибка схемы попадет в результат конкретной записи
+                pass
+
+        def submit(queue):
+            record = queue.pop(0)
+            scenario_path, xsd_path, output_dir = record_inputs(record)
+            future = pool.submit(FileProcessor.build_vm_template, scenario_path, xsd_path, output_dir,
+                                 project=record.get('group'))
+            futures[future] = (record, queue)
+
+        # В работе одновременно по одной записи из каждой папки; следующая отправляется, когда готова предыдущая
+        futures = {}
+        for queue in queues.values():
+            submit(queue)
+        while futures:
+            finished, _ = wait(futures, return_when=FIRST_COMPLETED)
+            for future in finished:
+                record, queue = futures.pop(future)
+                if queue:
+                    submit(queue)
+                try:
+                    result = future.result()
+                except Exception as e:
+                    result = {'success': False, 'error': str(e)}
+                updated = copy.deepcopy(record)
+                try:
+                    apply_result(updated, result, store)
+                except OSError as e:
+                    result = {'success': False, 'error': f"не удалось сохранить в хранилище: {e}"}
+                    updated['result'] = f"Ошибка перегенерации: {result['error']}"
+                summary['updates'].append((record, updated))
+                if result['success']:
+                    report(record, 'ok')
+                else:
+                    summary['errors'].append(f"{record.get('file', record['id'])}: {result['error']}")
+                    report(record, 'failed')
+    return summary
+
+
+def apply_updates(summary):
+    """Переносит в записи обновления из сводки regenerate_records; вызывается в потоке, владеющем записями"""
+    for record, updated in summary.pop('updates', []):
+        record.update(updated)
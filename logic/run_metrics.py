@@ -0,0 +1,289 @@
+import json
+import math
+import os
+import threading
+from datetime import datetime
+from pathlib import Path
+
+import config
+
+# Длительности этапов запуска в записи журнала (мс)
+METRIC_KEYS = ('total_ms', 'load_ms', 'generate_ms', 'render_ms', 'write_ms')
+# Разрезы статистики: ключ записи журнала, по которому группируются запуски
+DIMENSIONS = ('schema', 'project', 'day')
+NO_PROJECT = 'Без проекта'
+
+STATE_VERSION = 2
+# Границы корзин гистограммы растут в GROWTH раз: квантили считаются с относительной ошибкой до 2%
+GROWTH = 1.02
+
+_append_lock = threading.Lock()
+
+
+# Пик RSS процесса (VmHWM) сбрасывается записью '5' в clear_refs (Linux)
+_CLEAR_REFS = '/proc/self/clear_refs'
+_STATUS = '/proc/self/status'
+_memory_lock = threading.Lock()
+# Незавершенные замеры памяти и номер последнего начатого
+_active_runs = 0
+_started_runs = 0
+
+
+def _status_kb(field):
+    """Значение поля /proc/self/status в КБ; None там, где /proc нет"""
+    try:
+        with open(_STATUS, encoding='ascii') as f:
+            for line in f:
+                if line.startswith(field):
+                    return int(line.split()[1])
+    except (OSError, ValueError, IndexError):
+        pass
+    return None
+
+
+def _reset_peak():
+    try:
+        with open(_CLEAR_REFS, 'w', encoding='ascii') as f:
+            f.write('5')
+        return True
+    except OSError:
+        return False
+
+
+class RunMemory:
+    """
+    Пиковый размер процесса за время одного запуска. ru_maxrss для этого не годится: он держит пик
+    за всю жизнь процесса, и в сервисе после первого большого запуска одинаков у всех. Здесь пик (VmHWM)
+    сбрасывается через /proc/self/clear_refs в начале замера, если других замеров нет.
+    Пик общий для всех потоков процесса: если запуски шли одновременно, замер помечается memory_shared.
+    Где /proc нет (Windows, macOS), пик не измеряется. tracemalloc не используется: он замедляет
+    каждое выделение памяти и видит только объекты Python.
+    """
+
+    def __init__(self):
+        global _active_runs, _started_runs
+        with _memory_lock:
+            _started_runs += 1
+            self._number = _started_runs
+            self.shared = _active_runs > 0
+            # При одновременных запусках сброс стер бы пик чужого замера
+            self.measured = self.shared or _reset_peak()
+            _active_runs += 1
+        self.start_kb = _status_kb('VmRSS:') if self.measured else None
+        self.result = None
+
+    def stop(self):
+        """Поля записи журнала: peak_memory_kb, start_memory_kb, memory_shared; повторный вызов отдает те же"""
+        global _active_runs
+        if self.result is not None:
+            return self.result
+        with _memory_lock:
+            peak = _status_kb('VmHWM:') if self.measured else None
+            _active_runs -= 1
+            shared = self.shared or _active_runs > 0 or _started_runs != self._number
+        self.result = {'peak_memory_kb': peak, 'start_memory_kb': self.start_kb, 'memory_shared': shared}
+        return self.result
+
+
+def append_run(record, log_path=None):
+    """
+    Дописывает запись запуска строкой JSON в журнал.
+    Строка пишется одним вызовом write в файл, открытый на дозапись, поэтому записи окна,
+    сервиса и командной строки не перемешиваются.
+    """
+    path = Path(log_path or config.METRICS_LOG)
+    line = (json.dumps(record, ensure_ascii=False) + '\n').encode('utf-8')
+    with _append_lock:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            os.write(fd, line)
+        finally:
+            os.close(fd)
+
+
+def make_record(scenario_path, xsd_path, project, timings, success=True, schema_hash=None, **fields):
+    """
+    Запись журнала о запуске; fields — размеры, счетчики и память конкретного запуска.
+    Разрез 'schema' — хэш содержимого схемы (одно имя файла у разных версий схемы не смешивается),
+    имя файла для отчета — в 'schema_name'.
+    """
+    now = datetime.now()
+    record = {
+        'ts': now.isoformat(timespec='seconds'),
+        'day': now.strftime('%Y-%m-%d'),
+        'schema': schema_hash,
+        'schema_name': os.path.basename(xsd_path) if xsd_path else None,
+        'scenario': os.path.basename(scenario_path) if scenario_path else None,
+        'project': project or NO_PROJECT,
+        'success': success,
+        'timings': {key: round(value, 2) for key, value in timings.items()},
+    }
+    record.update(fields)
+    return record
+
+
+def _bucket(value):
+    return math.ceil(math.log(value) / math.log(GROWTH)) if value > 0 else None
+
+
+class _Series:
+    """Гистограмма длительностей одной группы: счетчики по корзинам, максимум и число запусков"""
+    __slots__ = ('count', 'max', 'zeros', 'buckets')
+
+    def __init__(self, count=0, max_value=0.0, zeros=0, buckets=None):
+        self.count = count
+        self.max = max_value
+        self.zeros = zeros
+        self.buckets = buckets or {}
+
+    def add(self, value):
+        self.count += 1
+        self.max = max(self.max, value)
+        bucket = _bucket(value)
+        if bucket is None:
+            self.zeros += 1
+        else:
+            self.buckets[bucket] = self.buckets.get(bucket, 0) + 1
+
+    def quantile(self, q):
+        rank = q * self.count
+        seen = self.zeros
+        if seen >= rank:
+            return 0.0
+        for bucket in sorted(self.buckets):
+            seen += self.buckets[bucket]
+            if seen >= rank:
+                return min(GROWTH ** bucket, self.max)
+        return self.max
+
+    def to_dict(self):
+        return {'count': self.count, 'max': self.max, 'zeros': self.zeros,
+                'buckets': {str(bucket): count for bucket, count in self.buckets.items()}}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data['count'], data['max'], data.get('zeros', 0),
+                   {int(bucket): count for bucket, count in data['buckets'].items()})
+
+
+class MetricsAggregator:
+    """
+    Статистика журнала запусков по схемам, проектам и дням.
+    Состояние (позиция в журнале и гистограммы групп) сохраняется рядом с журналом,
+    поэтому update дочитывает только новые строки. Если журнал стал короче позиции
+    (удален или заменен), статистика строится заново.
+    """
+
+    def __init__(self, log_path=None, state_path=None):
+        self.log_path = Path(log_path or config.METRICS_LOG)
+        self.state_path = Path(state_path) if state_path else self.log_path.with_name(
+            self.log_path.name + '.state.json')
+        self.offset = 0
+        # Разрез -> ключ группы -> метрика -> _Series
+        self.groups = {dimension: {} for dimension in DIMENSIONS}
+        # Хэш схемы -> имя файла из последнего запуска (для отчета)
+        self.schema_names = {}
+        self._load_state()
+
+    def _load_state(self):
+        try:
+            with open(self.state_path, encoding='utf-8') as f:
+                data = json.load(f)
+            if data.get('version') != STATE_VERSION:
+                return
+            groups = {dimension: {key: {metric: _Series.from_dict(series) for metric, series in metrics.items()}
+                                  for key, metrics in data['groups'].get(dimension, {}).items()}
+                      for dimension in DIMENSIONS}
+        except (OSError, ValueError, KeyError, TypeError):
+            return
+        self.offset = data.get('offset', 0)
+        self.groups = groups
+        self.schema_names = data.get('schema_names', {})
+
+    def _reset(self):
+        self.offset = 0
+        self.groups = {dimension: {} for dimension in DIMENSIONS}
+        self.schema_names = {}
+
+    def update(self):
+        """Дочитывает журнал с сохраненной позиции; возвращает число учтенных запусков"""
+        try:
+            size = os.path.getsize(self.log_path)
+        except OSError:
+            size = 0
+        if size < self.offset:
+            self._reset()
+        if size == self.offset:
+            return 0
+
+        added = 0
+        with open(self.log_path, 'rb') as f:
+            f.seek(self.offset)
+            data = f.read(size - self.offset)
+        # Последняя строка может дописываться прямо сейчас: берем только завершенные
+        end = data.rfind(b'\n') + 1
+        for line in data[:end].splitlines():
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            if isinstance(record, dict) and record.get('success'):
+                self.add(record)
+                added += 1
+        self.offset += end
+        self.save()
+        return added
+
+    def add(self, record):
+        timings = record.get('timings') or {}
+        # В записях до хэшей схем 'schema' — имя файла, и имени отдельно нет
+        if record.get('schema') and record.get('schema_name'):
+            self.schema_names[record['schema']] = record['schema_name']
+        for dimension in DIMENSIONS:
+            key = record.get(dimension)
+            if dimension == 'project' and not key:
+                key = NO_PROJECT
+            if key is None:
+                continue
+            metrics = self.groups[dimension].setdefault(str(key), {})
+            for metric in METRIC_KEYS:
+                value = timings.get(metric)
+                if isinstance(value, (int, float)):
+                    series = metrics.get(metric)
+                    if series is None:
+                        series = metrics[metric] = _Series()
+                    series.add(float(value))
+
+    def save(self):
+        data = {'version': STATE_VERSION, 'offset': self.offset, 'schema_names': self.schema_names,
+                'groups': {dimension: {key: {metric: series.to_dict() for metric, series in metrics.items()}
+                                       for key, metrics in groups.items()}
+                           for dimension, groups in self.groups.items()}}
+        tmp_path = self.state_path.with_suffix('.tmp')
+        try:
+            self.state_path.parent.mkdir(parents=True, exist_ok=True)
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(data, f)
+            os.replace(tmp_path, self.state_path)
+        except OSError:
+            # Без сохраненного состояния следующий запуск просто перечитает журнал
+            pass
+
+    def label(self, dimension, key):
+        """Подпись группы в отчете: схема — имя файла и начало хэша содержимого"""
+        if dimension == 'schema' and key in self.schema_names:
+            return f"{self.schema_names[key]} [{key[:8]}]"
+        return key
+
+    def report(self, dimension='schema', metric='total_ms'):
+        """Строки отчета: (подпись группы, запусков, p50, p95, максимум), по подписи группы"""
+        rows = []
+        for key, metrics in self.groups[dimension].items():
+            series = metrics.get(metric)
+            if series is None or not series.count:
+                continue
+            rows.append((self.label(dimension, key), series.count, series.quantile(0.5), series.quantile(0.95),
+                         series.max))
+        rows.sort()
+        return rows
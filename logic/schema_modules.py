@@ -0,0 +1,206 @@
+import hashlib
+import json
+import os
+import re
+import threading
+import xml.etree.ElementTree as ET
+from concurrent.futures import ThreadPoolExecutor
+
+import config
+
+XSD_NS = "http://www.w3.org/2001/XMLSchema"
+NS = {'xsd': XSD_NS, 'xs': XSD_NS}
+
+# Потоков для чтения независимых модулей одного уровня графа (разбор XML все равно идет под GIL)
+PARSE_WORKERS = 4
+
+_URL_RE = re.compile(r'^[A-Za-z][A-Za-z0-9+.-]*://')
+
+
+def parse_schema_root(xsd_text):
+    """Корневой элемент схемы; мусор перед <xs:schema> (BOM, комментарии выгрузки) отбрасывается"""
+    try:
+        return ET.fromstring(xsd_text.encode('utf-8'))
+    except Exception:
+        # попытаемся найти начало тега <xs: or <xsd:
+        m = re.search(r"<(xsd:|xs:)?schema", xsd_text)
+        if m:
+            return ET.fromstring(xsd_text[m.start():].encode('utf-8'))
+        raise
+
+
+class SchemaModule:
+    """Разобранный файл схемы: именованные типы, глобальные элементы и ссылки xs:include/xs:import"""
+    __slots__ = ('path', 'sha256', 'mtime_ns', 'size', 'root', 'complex_types', 'simple_types', 'elements',
+                 'references')
+
+    def __init__(self, path, data, stat):
+        self.path = path
+        self.sha256 = hashlib.sha256(data).hexdigest()
+        self.mtime_ns = stat.st_mtime_ns
+        self.size = stat.st_size
+        self.root = parse_schema_root(data.decode('utf-8'))
+        self.complex_types = {ct.get('name'): ct for ct in self.root.findall('.//xsd:complexType', NS)
+                              if ct.get('name')}
+        self.simple_types = {st.get('name'): st for st in self.root.findall('.//xsd:simpleType', NS)
+                             if st.get('name')}
+        self.elements = {el.get('name'): el for el in self.root.findall('xsd:element', NS) if el.get('name')}
+        # (schemaLocation, namespace); у include пространство имен не указывается
+        self.references = [(ref.get('schemaLocation'), ref.get('namespace'))
+                           for ref in self.root
+                           if ref.tag in (f'{{{XSD_NS}}}include', f'{{{XSD_NS}}}import')]
+
+
+class SchemaGraph:
+    """Схема вместе со всеми модулями, которые она подключает (напрямую или через другие модули)"""
+
+    def __init__(self, root, modules, missing):
+        self.root = root
+        # Подключенные модули в порядке обхода в ширину: при совпадении имен типов побеждает ближний
+        self.modules = modules
+        # Ссылки, для которых не нашлось локального файла: (модуль, schemaLocation, namespace)
+        self.missing = missing
+
+    @property
+    def digest(self):
+        """Хэш содержимого схемы; для схемы без подключений совпадает с хэшем ее файла"""
+        if not self.modules:
+            return self.root.sha256
+        combined = hashlib.sha256(self.root.sha256.encode('ascii'))
+        for module in self.modules:
+            combined.update(module.sha256.encode('ascii'))
+        return combined.hexdigest()
+
+    def stamps(self):
+        """Отметки (путь, mtime_ns, размер) всех файлов графа для проверки изменений"""
+        return tuple((module.path, module.mtime_ns, module.size) for module in (self.root, *self.modules))
+
+
+def stamps_unchanged(stamps):
+    for path, mtime_ns, size in stamps:
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return False
+        if stat.st_mtime_ns != mtime_ns or stat.st_size != size:
+            return False
+    return True
+
+
+# Разобранные модули: путь -> SchemaModule. Общий для всех схем, которые их подключают
+_modules = {}
+_modules_lock = threading.Lock()
+
+# Каталог: schemaLocation или пространство имен -> путь к локальной копии (относительно папки каталога)
+_catalog = {'mtime_ns': None, 'entries': {}}
+_catalog_lock = threading.Lock()
+
+
+def load_module(path):
+    """
+    Модуль схемы по абсолютному пути. Файл перечитывается, только если изменились его mtime или размер,
+    и разбирается заново, только если изменилось содержимое (sha256).
+    """
+    stat = os.stat(path)
+    with _modules_lock:
+        cached = _modules.get(path)
+    if cached is not None and cached.mtime_ns == stat.st_mtime_ns and cached.size == stat.st_size:
+        return cached
+    with open(path, 'rb') as f:
+        data = f.read()
+    if cached is not None and cached.sha256 == hashlib.sha256(data).hexdigest():
+        cached.mtime_ns, cached.size = stat.st_mtime_ns, stat.st_size
+        return cached
+    module = SchemaModule(path, data, stat)
+    with _modules_lock:
+        _modules[path] = module
+    return module
+
+
+def clear_module_cache():
+    with _modules_lock:
+        _modules.clear()
+
+
+def _catalog_entries():
+    path = config.SCHEMA_CATALOG
+    try:
+        mtime_ns = os.stat(path).st_mtime_ns
+    except OSError:
+        return {}
+    with _catalog_lock:
+        if _catalog['mtime_ns'] == mtime_ns:
+            return _catalog['entries']
+    try:
+        with open(path, encoding='utf-8') as f:
+            entries = json.load(f)
+    except (OSError, ValueError):
+        entries = {}
+    if not isinstance(entries, dict):
+        entries = {}
+    with _catalog_lock:
+        _catalog['mtime_ns'] = mtime_ns
+        _catalog['entries'] = entries
+    return entries
+
+
+def resolve_reference(location, namespace, base_dir):
+    """
+    Локальный файл подключаемого модуля или None.
+    Порядок: путь относительно подключающей схемы, каталог по schemaLocation, каталог по пространству имен,
+    файл с тем же именем в папке каталога.
+    """
+    if location and not _URL_RE.match(location):
+        candidate = os.path.normpath(os.path.join(base_dir, location))
+        if os.path.isfile(candidate):
+            return candidate
+    catalog_dir = os.path.dirname(config.SCHEMA_CATALOG)
+    entries = _catalog_entries()
+    for key in (location, namespace):
+        if key and key in entries:
+            candidate = os.path.normpath(os.path.join(catalog_dir, os.path.expanduser(entries[key])))
+            if os.path.isfile(candidate):
+                return candidate
+    if location:
+        candidate = os.path.join(catalog_dir, location.rstrip('/').rsplit('/', 1)[-1])
+        if os.path.isfile(candidate):
+            return candidate
+    return None
+
+
+def load_schema_graph(xsd_path):
+    """
+    Загружает схему и все подключаемые ею модули обходом в ширину; неизменившиеся модули берутся из кэша.
+    Модули одного уровня не зависят друг от друга и читаются в пуле потоков, но из-за GIL параллельно идут
+    только чтение файлов и sha256 — разбор XML в ElementTree держит GIL. Пул создается, только когда
+    на уровне больше одного модуля: у схемы без подключений или с цепочкой include потоков нет.
+    """
+    root = load_module(os.path.abspath(xsd_path))
+    modules = []
+    missing = []
+    seen = {root.path}
+    frontier = [root]
+    pool = None
+    try:
+        while frontier:
+            paths = []
+            for module in frontier:
+                base_dir = os.path.dirname(module.path)
+                for location, namespace in module.references:
+                    path = resolve_reference(location, namespace, base_dir)
+                    if path is None:
+                        missing.append((module.path, location, namespace))
+                    elif path not in seen:
+                        seen.add(path)
+                        paths.append(path)
+            if len(paths) > 1:
+                if pool is None:
+                    pool = ThreadPoolExecutor(max_workers=PARSE_WORKERS, thread_name_prefix="gosmost-xsd")
+                frontier = list(pool.map(load_module, paths))
+            else:
+                frontier = [load_module(path) for path in paths]
+            modules.extend(frontier)
+    finally:
+        if pool is not None:
+            pool.shutdown()
+    return SchemaGraph(root, modules, missing)
@@ -0,0 +1,321 @@
+import hashlib
+import json
+import os
+import threading
+from pathlib import Path
+
+import config
+
+# Версия формата состояния; состояние другой версии игнорируется и шаблон собирается целиком
+STATE_VERSION = 2
+
+# Строки шаблона до и после тела (заголовок с конвертом и его закрытие, см. FileProcessor._generate_raw_vm)
+HEADER_LINES = 6
+FOOTER_LINES = 2
+
+# Разметки планов: id плана -> (план, разметка); план хранится рядом, поэтому id не переиспользуется
+_layouts = {}
+_layouts_lock = threading.Lock()
+LAYOUT_CACHE_SIZE = 32
+
+
+def _digest(data):
+    return hashlib.blake2b(data, digest_size=12).hexdigest()
+
+
+def _op_bytes(op):
+    # Индекс закрытия в открывающих инструкциях зависит от положения узла в плане, а не от его содержимого
+    if op[0] in ('open', 'loop'):
+        op = op[:4] + op[5:]
+    return repr(op).encode('utf-8')
+
+
+def plan_layout(plan):
+    """
+    Разметка плана генерации для сравнения с прошлым запуском: для открывающих инструкций (узлов с детьми)
+    подпись поддерева и ключ узла 'путь#номер вхождения'. Подпись складывается из инструкций поддерева,
+    поэтому узлы с одинаковой подписью дают одинаковые строки при одинаковом сценарии и связывании.
+    Возвращает (подписи, ключи, подпись всего плана).
+    """
+    key = id(plan)
+    with _layouts_lock:
+        cached = _layouts.get(key)
+    if cached is not None and cached[0] is plan:
+        return cached[1]
+
+    signatures = [None] * len(plan)
+    keys = [None] * len(plan)
+    occurrences = {}
+    # Стек открытых узлов: (индекс инструкции, части подписи)
+    stack = []
+    top_parts = []
+    for index, op in enumerate(plan):
+        kind = op[0]
+        if kind in ('open', 'loop'):
+            path = op[3]
+            number = occurrences.get(path, 0)
+            occurrences[path] = number + 1
+            keys[index] = f"{path}#{number}"
+            stack.append((index, [_op_bytes(op)]))
+        elif kind == 'close':
+            open_index, parts = stack.pop()
+            parts.append(_op_bytes(op))
+            signature = _digest(b'|'.join(parts))
+            signatures[open_index] = signature
+            (stack[-1][1] if stack else top_parts).append(signature.encode('ascii'))
+        else:
+            (stack[-1][1] if stack else top_parts).append(_op_bytes(op))
+    layout = (signatures, keys, _digest(b'|'.join(top_parts)))
+    with _layouts_lock:
+        _layouts[key] = (plan, layout)
+        while len(_layouts) > LAYOUT_CACHE_SIZE:
+            del _layouts[next(iter(_layouts))]
+    return layout
+
+
+class SegmentTracker:
+    """
+    Карта сегментов тела шаблона для _bind_plan: какие строки дал каждый узел с детьми
+    и как узлы пользовались кэшем фрагментов. С картой прошлого запуска (previous) неизменившиеся узлы
+    не связываются заново, а копируются из прошлого шаблона.
+
+    Запись узла: [ключ, подпись, связанный список, начало, конец, первое событие, конец событий, конец записей].
+    События кэша фрагментов в порядке выполнения:
+      ['hit', ключ кэша, хэш фрагмента, строк], ['miss', ключ кэша],
+      ['store', ключ кэша, хэш фрагмента, начало, конец, отступ].
+    Хэш фрагмента — подпись узла, связанный список и хэши фрагментов, взятых внутри узла из кэша:
+    этого достаточно, чтобы фрагмент совпал, при том же сценарии.
+    """
+
+    def __init__(self, plan, previous=None):
+        self.signatures, self.keys, self.plan_digest = plan_layout(plan)
+        self.previous = previous
+        self.records = []
+        self.events = []
+        # Ключ кэша фрагментов -> хэш фрагмента в текущем запуске
+        self.digests = {}
+        # Скопированные диапазоны: (начало в прошлом теле, конец, начало в новом теле)
+        self.reused = []
+        self.reused_nodes = 0
+        self._open = []
+
+    def reuse(self, index, binding, fragment_cache, lines):
+        """Копирует строки узла из прошлого шаблона, если они не изменились бы; возвращает True при успехе"""
+        previous = self.previous
+        if previous is None:
+            return False
+        record_index = previous.index.get(self.keys[index])
+        if record_index is None:
+            return False
+        record = previous.records[record_index]
+        if record[1] != self.signatures[index] or record[2] != binding:
+            return False
+        events = previous.events[record[5]:record[6]]
+        # Узел собрался бы так же, только если кэш фрагментов отвечает ему так же, как в прошлый раз
+        overlay = {}
+        for event in events:
+            cache_key = tuple(event[1])
+            current = overlay[cache_key] if cache_key in overlay else self.digests.get(cache_key)
+            if event[0] == 'hit':
+                if current != event[2]:
+                    return False
+            elif event[0] == 'miss':
+                if current is not None:
+                    return False
+            else:
+                overlay[cache_key] = event[2]
+
+        old_lines = previous.lines
+        start = len(lines)
+        lines.extend(old_lines[record[3]:record[4]])
+        shift = start - record[3]
+        event_shift = len(self.events) - record[5]
+        record_shift = len(self.records) - record_index
+        for event in events:
+            cache_key = tuple(event[1])
+            if event[0] == 'hit':
+                fragment_cache['hits'] += 1
+                fragment_cache['lines_from_cache'] += event[3]
+                self.events.append(event)
+            elif event[0] == 'miss':
+                fragment_cache['misses'] += 1
+                self.events.append(event)
+            else:
+                _, _, digest, begin, end, indent = event
+                fragment_cache['fragments'][cache_key] = [line[indent:] for line in old_lines[begin:end]]
+                self.digests[cache_key] = digest
+                self.events.append(['store', event[1], digest, begin + shift, end + shift, indent])
+        for old in previous.records[record_index:record[7]]:
+            self.records.append([old[0], old[1], old[2], old[3] + shift, old[4] + shift,
+                                 old[5] + event_shift, old[6] + event_shift, old[7] + record_shift])
+        self.reused.append((record[3], record[4], start))
+        self.reused_nodes += 1
+        return True
+
+    def hit(self, index, binding, cache_key, start, end, lines_count):
+        """Содержимое узла (lines_count строк) взято из кэша фрагментов; узел занял строки start..end"""
+        event_index = len(self.events)
+        self.events.append(['hit', list(cache_key), self.digests.get(cache_key), lines_count])
+        self.records.append([self.keys[index], self.signatures[index], binding, start, end,
+                             event_index, event_index + 1, len(self.records) + 1])
+
+    def enter(self, index, binding, cache_key, start):
+        """Узел связывается заново; cache_key — ключ кэша фрагментов, если узел сохраняется в кэш"""
+        if cache_key is not None:
+            self.events.append(['miss', list(cache_key)])
+        self._open.append(len(self.records))
+        self.records.append([self.keys[index], self.signatures[index], binding, start, None,
+                             len(self.events) - (cache_key is not None), None, None])
+
+    def leave(self, cache_key, indent, body, end):
+        """Узел закрыт на строке end; body — (начало, конец) его содержимого, которое сохраняется в кэш"""
+        record_index = self._open.pop()
+        record = self.records[record_index]
+        if cache_key is not None:
+            hits = [event[2] or '' for event in self.events[record[5]:] if event[0] == 'hit']
+            digest = _digest('|'.join([record[1], repr(record[2])] + hits).encode('utf-8'))
+            self.digests[cache_key] = digest
+            self.events.append(['store', list(cache_key), digest, body[0], body[1], indent])
+        record[4] = end
+        record[6] = len(self.events)
+        record[7] = len(self.records)
+
+
+class PreviousOutput:
+    """Прошлый запуск для той же папки результатов: карта сегментов и строки обоих шаблонов"""
+
+    def __init__(self, state, raw_lines, filled_lines):
+        self.state = state
+        self.records = state['records']
+        self.events = state['events']
+        self.index = {record[0]: position for position, record in enumerate(self.records)}
+        self.raw_lines = raw_lines
+        self.filled_lines = filled_lines
+        self.lines = raw_lines[HEADER_LINES:len(raw_lines) - FOOTER_LINES]
+        # Строки заполненного шаблона совпадают со строками сырого, если ни одна замена не добавила перевод строки
+        filled_body = filled_lines[HEADER_LINES:len(filled_lines) - FOOTER_LINES]
+        self.filled_body = filled_body if len(filled_body) == len(self.lines) else None
+
+
+def state_path(output_dir):
+    digest = hashlib.sha1(os.path.abspath(str(output_dir)).encode('utf-8')).hexdigest()
+    return Path(config.INCREMENTAL_DIR) / f"{digest}.json"
+
+
+def file_stamp(path):
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return [stat.st_size, stat.st_mtime_ns]
+
+
+def load_state(output_dir):
+    """Состояние прошлого запуска для папки результатов или None"""
+    try:
+        with open(state_path(output_dir), encoding='utf-8') as f:
+            state = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if not isinstance(state, dict) or state.get('version') != STATE_VERSION:
+        return None
+    return state
+
+
+def scenario_digest(path, state=None):
+    """
+    sha256 сценария и отметка (размер, mtime_ns) его файла.
+    Если отметка совпадает с сохраненной в state, файл не перечитывается.
+    """
+    stamp = file_stamp(path)
+    if state is not None and stamp is not None and state.get('scenario_stamp') == stamp:
+        return state['context']['scenario'], stamp
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest(), stamp
+
+
+def load_previous(state, context, raw_path, filled_path):
+    """
+    PreviousOutput по состоянию прошлого запуска или None, если его нет, оно получено с другими входами
+    (context) или шаблоны в папке с тех пор меняли.
+    """
+    if state is None or state.get('context') != context:
+        return None
+    if state.get('raw_stamp') != file_stamp(raw_path) or state.get('filled_stamp') != file_stamp(filled_path):
+        return None
+    try:
+        raw_lines = Path(raw_path).read_text(encoding='utf-8').split('\n')
+        filled_lines = Path(filled_path).read_text(encoding='utf-8').split('\n')
+    except (OSError, UnicodeDecodeError):
+        return None
+    # Значение сценария с переводом строки сдвигает строки файла относительно карты сегментов
+    if len(raw_lines) != state.get('body_lines', -1) + HEADER_LINES + FOOTER_LINES:
+        return None
+    return PreviousOutput(state, raw_lines, filled_lines)
+
+
+def save_state(output_dir, state):
+    """Сохраняет состояние атомарно; без него следующий запуск просто соберет шаблон целиком"""
+    path = state_path(output_dir)
+    tmp_path = path.with_suffix('.tmp')
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # dumps кодирует целиком в C, dump в файл — по частям и заметно медленнее
+        data = json.dumps(dict(state, version=STATE_VERSION), ensure_ascii=False, separators=(',', ':'))
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    except OSError:
+        pass
+
+
+def drop_state(output_dir):
+    """Удаляет состояние папки: следующий запуск соберет шаблон целиком"""
+    try:
+        os.remove(state_path(output_dir))
+    except OSError:
+        pass
+
+
+def splice_write(path, old_lines, new_lines):
+    """
+    Записывает текст "\\n".join(new_lines) поверх файла с текстом "\\n".join(old_lines), меняя только
+    отличающуюся середину: общие начало и конец остаются на диске. Если длина середины изменилась,
+    дописывается и конец файла. Возвращает число записанных байт.
+    """
+    limit = min(len(old_lines), len(new_lines))
+    prefix = 0
+    while prefix < limit and old_lines[prefix] == new_lines[prefix]:
+        prefix += 1
+    if prefix == len(old_lines) == len(new_lines):
+        return 0
+    suffix = 0
+    while suffix < limit - prefix and old_lines[-1 - suffix] == new_lines[-1 - suffix]:
+        suffix += 1
+
+    old_bytes = '\n'.join(old_lines).encode('utf-8')
+    new_bytes = '\n'.join(new_lines).encode('utf-8')
+    # Общее начало — строки prefix и перевод строки за ними, если после них текст есть в обоих файлах.
+    # Если старый файл целиком совпал с началом нового, перевода строки в нем нет: он войдет в середину
+    head = len('\n'.join(new_lines[:prefix]).encode('utf-8'))
+    if prefix and prefix < len(old_lines) and prefix < len(new_lines):
+        head += 1
+    # Общий конец — строки suffix и перевод строки перед ними, если середина непуста в обоих файлах;
+    # иначе этот перевод строки уже учтен в начале или принадлежит середине другого файла
+    tail = len('\n'.join(new_lines[len(new_lines) - suffix:]).encode('utf-8')) if suffix else 0
+    if suffix and len(old_lines) - suffix > prefix and len(new_lines) - suffix > prefix:
+        tail += 1
+    old_middle = old_bytes[head:len(old_bytes) - tail]
+    new_middle = new_bytes[head:len(new_bytes) - tail]
+    with open(path, 'r+b') as f:
+        f.seek(head)
+        if len(old_middle) == len(new_middle):
+            f.write(new_middle)
+            return len(new_middle)
+        rest = new_bytes[head:]
+        f.write(rest)
+        f.truncate()
+        return len(rest)
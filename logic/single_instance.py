@@ -0,0 +1,101 @@
+import json
+import os
+
+from PyQt6.QtCore import QObject, pyqtSignal
+from PyQt6.QtNetwork import QLocalServer, QLocalSocket
+
+import config
+
+# Ожидание ответа запущенного окна; зависшее окно не должно держать новый запуск
+CONNECT_TIMEOUT_MS = 500
+REPLY_TIMEOUT_MS = 2000
+ACK = b'ok\n'
+
+
+def _absolute_args(args):
+    """Относительные пути аргументов превращаются в абсолютные: у окна своя текущая папка"""
+    return [os.path.abspath(arg) if os.path.exists(arg) else arg for arg in args]
+
+
+def forward_to_running(args, name=None):
+    """
+    Передает аргументы запуска уже открытому окну.
+    Возвращает True, если окно приняло их и новый процесс можно завершать.
+    Использует только QtCore и QtNetwork, поэтому не тянет загрузку виджетов.
+    """
+    socket = QLocalSocket()
+    socket.connectToServer(name or config.INSTANCE_NAME)
+    if not socket.waitForConnected(CONNECT_TIMEOUT_MS):
+        return False
+    socket.write(json.dumps({'args': _absolute_args(args)}, ensure_ascii=False).encode('utf-8') + b'\n')
+    delivered = socket.waitForBytesWritten(REPLY_TIMEOUT_MS)
+    while delivered and socket.bytesAvailable() < len(ACK):
+        if not socket.waitForReadyRead(REPLY_TIMEOUT_MS):
+            delivered = False
+    delivered = delivered and bytes(socket.readAll()).startswith(ACK)
+    socket.disconnectFromServer()
+    return delivered
+
+
+def is_running(name=None):
+    """Открыто ли окно приложения (на сокете экземпляра кто-то слушает)"""
+    socket = QLocalSocket()
+    socket.connectToServer(name or config.INSTANCE_NAME)
+    running = socket.waitForConnected(CONNECT_TIMEOUT_MS)
+    socket.abort()
+    return running
+
+
+class InstanceServer(QObject):
+    """
+    Сокет единственного экземпляра окна: принимает аргументы последующих запусков.
+    Каждое сообщение — строка JSON {'args': [...]}, на которую отвечаем ACK.
+    """
+    arguments_received = pyqtSignal(list)
+
+    def __init__(self, name=None, parent=None):
+        super().__init__(parent)
+        self.name = name or config.INSTANCE_NAME
+        self.server = QLocalServer(self)
+        self.server.newConnection.connect(self._accept)
+        self._buffers = {}
+
+    def listen(self):
+        """
+        Начинает слушать сокет экземпляра. Сокет, оставшийся от аварийно завершенного окна,
+        удаляется, если на нем никто не отвечает. Возвращает False, если окно уже открыто.
+        """
+        if self.server.listen(self.name):
+            return True
+        if is_running(self.name):
+            return False
+        QLocalServer.removeServer(self.name)
+        return self.server.listen(self.name)
+
+    def close(self):
+        self.server.close()
+
+    def _accept(self):
+        while self.server.hasPendingConnections():
+            connection = self.server.nextPendingConnection()
+            self._buffers[connection] = b''
+            connection.readyRead.connect(lambda connection=connection: self._read(connection))
+            connection.disconnected.connect(lambda connection=connection: self._drop(connection))
+
+    def _drop(self, connection):
+        self._buffers.pop(connection, None)
+        connection.deleteLater()
+
+    def _read(self, connection):
+        data = self._buffers.get(connection, b'') + bytes(connection.readAll())
+        *lines, rest = data.split(b'\n')
+        self._buffers[connection] = rest
+        for line in lines:
+            try:
+                message = json.loads(line)
+                args = [str(arg) for arg in message.get('args', [])]
+            except (ValueError, AttributeError, TypeError):
+                continue
+            connection.write(ACK)
+            connection.flush()
+            self.arguments_received.emit(args)
@@ -0,0 +1,20 @@
+import os
+import sys
+import time
+
+# Отсчет от импорта модуля: main.py импортирует его первым
+_START = time.perf_counter()
+
+# Включает вывод отметок в stderr: GOSMOST_STARTUP_TRACE=1 python main.py
+ENV_VAR = 'GOSMOST_STARTUP_TRACE'
+
+marks = []
+
+
+def mark(label):
+    """Отметка этапа запуска: (название, мс от старта процесса)"""
+    elapsed = (time.perf_counter() - _START) * 1000
+    marks.append((label, elapsed))
+    if os.environ.get(ENV_VAR):
+        print(f"[startup] {elapsed:9.1f} ms  {label}", file=sys.stderr, flush=True)
+    return elapsed
@@ -0,0 +1,304 @@
+import re
+from pathlib import Path
+
+MODE_LINES = 'lines'
+MODE_STRUCTURE = 'structure'
+
+# Открывающий, закрывающий или самозакрывающийся тег шаблона
+_TAG_RE = re.compile(r'<(/?)([\w:.\-]+)[^<>]*?(/?)>')
+# Предел числа правок, которое ищет один встречный поиск Майерса: время растет как квадрат этого числа.
+# Дальше участок разбивается по строкам, которые встречаются в обеих половинах по одному разу
+MAX_EDIT_COST = 1000
+
+
+class DiffCancelled(Exception):
+    """Сравнение прервано через cancelled()"""
+
+
+def _intern(a, b):
+    """Заменяет строки числами: сравнение целых быстрее сравнения длинных строк"""
+    ids = {}
+    a = [ids.setdefault(item, len(ids)) for item in a]
+    b = [ids.setdefault(item, len(ids)) for item in b]
+    return a, b
+
+
+def _anchor(a, alo, ahi, b, blo, bhi):
+    """
+    Точка разбиения без поиска кратчайшего пути: средний из якорей — строк, которые встречаются
+    в обеих частях ровно по одному разу и идут в одном порядке (наибольшая возрастающая подпоследовательность).
+    Возвращает (x, y) с a[x] == b[y] или None, если якорей нет.
+    """
+    counts = {}
+    for i in range(alo, ahi):
+        item = a[i]
+        counts[item] = -1 if item in counts else i
+    positions = {}
+    for j in range(blo, bhi):
+        item = b[j]
+        if counts.get(item, -1) >= 0:
+            positions[item] = -1 if item in positions else j
+    pairs = sorted((counts[item], j) for item, j in positions.items() if j >= 0)
+    if not pairs:
+        return None
+    # Наибольшая возрастающая по y подпоследовательность пар (x, y) — терпеливая сортировка
+    tails = []
+    tail_pairs = []
+    previous = [None] * len(pairs)
+    for index, (_, y) in enumerate(pairs):
+        lo, hi = 0, len(tails)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if tails[mid] < y:
+                lo = mid + 1
+            else:
+                hi = mid
+        previous[index] = tail_pairs[lo - 1] if lo else None
+        if lo == len(tails):
+            tails.append(y)
+            tail_pairs.append(index)
+        else:
+            tails[lo] = y
+            tail_pairs[lo] = index
+    chain = []
+    index = tail_pairs[-1]
+    while index is not None:
+        chain.append(index)
+        index = previous[index]
+    return pairs[chain[len(chain) // 2]]
+
+
+def _bisect(a, alo, ahi, b, blo, bhi, cancelled, report):
+    """
+    Средняя «змея» алгоритма Майерса в линейной памяти: встречный поиск с начала и с конца.
+    Возвращает точку разбиения (x, y) на кратчайшем пути правок или None, если общих элементов нет.
+    Если путь длиннее MAX_EDIT_COST правок, разбивает участок по якорю (_anchor) и отмечает в report
+    'approximate': результат — корректный, но не обязательно кратчайший список правок. После этого
+    остальные участки тоже сначала разбиваются по якорям, а поиск Майерса остается для участков без них.
+    """
+    if report.get('approximate'):
+        split = _anchor(a, alo, ahi, b, blo, bhi)
+        if split is not None:
+            return split
+    n = ahi - alo
+    m = bhi - blo
+    max_d = (n + m + 1) // 2
+    v_offset = max_d
+    v_length = 2 * max_d + 2
+    v1 = [-1] * v_length
+    v2 = [-1] * v_length
+    v1[v_offset + 1] = 0
+    v2[v_offset + 1] = 0
+    delta = n - m
+    # При нечетной разнице длин пути встречаются на прямом проходе, при четной — на обратном
+    front = delta % 2 != 0
+    k1start = k1end = k2start = k2end = 0
+    for d in range(max_d):
+        if cancelled is not None and cancelled():
+            raise DiffCancelled()
+        if d > MAX_EDIT_COST:
+            report['approximate'] = True
+            return _anchor(a, alo, ahi, b, blo, bhi)
+        for k1 in range(-d + k1start, d + 1 - k1end, 2):
+            k1_offset = v_offset + k1
+            if k1 == -d or (k1 != d and v1[k1_offset - 1] < v1[k1_offset + 1]):
+                x1 = v1[k1_offset + 1]
+            else:
+                x1 = v1[k1_offset - 1] + 1
+            y1 = x1 - k1
+            while x1 < n and y1 < m and a[alo + x1] == b[blo + y1]:
+                x1 += 1
+                y1 += 1
+            v1[k1_offset] = x1
+            if x1 > n:
+                k1end += 2
+            elif y1 > m:
+                k1start += 2
+            elif front:
+                k2_offset = v_offset + delta - k1
+                if 0 <= k2_offset < v_length and v2[k2_offset] != -1 and x1 >= n - v2[k2_offset]:
+                    return alo + x1, blo + y1
+
+        for k2 in range(-d + k2start, d + 1 - k2end, 2):
+            k2_offset = v_offset + k2
+            if k2 == -d or (k2 != d and v2[k2_offset - 1] < v2[k2_offset + 1]):
+                x2 = v2[k2_offset + 1]
+            else:
+                x2 = v2[k2_offset - 1] + 1
+            y2 = x2 - k2
+            while x2 < n and y2 < m and a[ahi - x2 - 1] == b[bhi - y2 - 1]:
+                x2 += 1
+                y2 += 1
+            v2[k2_offset] = x2
+            if x2 > n:
+                k2end += 2
+            elif y2 > m:
+                k2start += 2
+            elif not front:
+                k1_offset = v_offset + delta - k2
+                if 0 <= k1_offset < v_length and v1[k1_offset] != -1:
+                    x1 = v1[k1_offset]
+                    y1 = x1 - (k1_offset - v_offset)
+                    if x1 >= n - x2:
+                        return alo + x1, blo + y1
+    return None
+
+
+def matching_blocks(a, b, cancelled=None, report=None):
+    """
+    Совпадающие участки двух последовательностей: список (i, j, длина) по возрастанию.
+    Кратчайший сценарий правок по Майерсу, память O(N + M); рекурсия заменена явным стеком.
+    cancelled() — проверяется по ходу поиска, при True поднимается DiffCancelled;
+    report — словарь, куда записывается 'approximate', если правок больше MAX_EDIT_COST.
+    """
+    a, b = _intern(a, b)
+    if report is None:
+        report = {}
+    blocks = []
+    stack = [(0, len(a), 0, len(b))]
+    while stack:
+        alo, ahi, blo, bhi = stack.pop()
+        # Общие начало и конец отсекаем сразу — для похожих шаблонов это почти весь текст
+        start = 0
+        while alo + start < ahi and blo + start < bhi and a[alo + start] == b[blo + start]:
+            start += 1
+        if start:
+            blocks.append((alo, blo, start))
+            alo += start
+            blo += start
+        end = 0
+        while alo < ahi - end and blo < bhi - end and a[ahi - end - 1] == b[bhi - end - 1]:
+            end += 1
+        if end:
+            blocks.append((ahi - end, bhi - end, end))
+            ahi -= end
+            bhi -= end
+        if alo == ahi or blo == bhi:
+            continue
+        split = _bisect(a, alo, ahi, b, blo, bhi, cancelled, report)
+        if split is None:
+            continue
+        x, y = split
+        stack.append((x, ahi, y, bhi))
+        stack.append((alo, x, blo, y))
+
+    blocks.sort()
+    # Склеиваем соседние участки
+    merged = []
+    for i, j, size in blocks:
+        if merged and merged[-1][0] + merged[-1][2] == i and merged[-1][1] + merged[-1][2] == j:
+            merged[-1] = (merged[-1][0], merged[-1][1], merged[-1][2] + size)
+        else:
+            merged.append((i, j, size))
+    return merged
+
+
+def opcodes(a, b, cancelled=None, report=None):
+    """Операции в формате difflib: ('equal' | 'replace' | 'delete' | 'insert', i1, i2, j1, j2)"""
+    result = []
+    i = j = 0
+    for bi, bj, size in matching_blocks(a, b, cancelled, report) + [(len(a), len(b), 0)]:
+        if i < bi and j < bj:
+            result.append(('replace', i, bi, j, bj))
+        elif i < bi:
+            result.append(('delete', i, bi, j, j))
+        elif j < bj:
+            result.append(('insert', i, i, j, bj))
+        if size:
+            result.append(('equal', bi, bi + size, bj, bj + size))
+        i, j = bi + size, bj + size
+    return result
+
+
+def structure_items(text):
+    """
+    Шаблон как последовательность элементов: (путь элемента, текст, номер строки).
+    Теги разбираются регулярным выражением, поэтому директивы Velocity между ними не мешают.
+    """
+    items = []
+    names = []
+    # Пути хранятся стеком готовых строк, чтобы не собирать путь заново на каждом теге
+    paths = ['']
+    position = 0
+    line = 1
+
+    def add_text(raw):
+        value = raw.strip()
+        if value:
+            # Номер строки, где начинается само значение, а не отступ перед ним
+            lead = len(raw) - len(raw.lstrip())
+            items.append((paths[-1], value, line + raw.count('\n', 0, lead)))
+
+    for match in _TAG_RE.finditer(text):
+        raw = text[position:match.start()]
+        if raw:
+            add_text(raw)
+            line += raw.count('\n')
+        position = match.end()
+        closing, name, self_closing = match.groups()
+        if closing:
+            # Закрываем до ближайшего одноименного тега; лишние закрывающие теги игнорируем
+            if name in names:
+                while names and names.pop() != name:
+                    paths.pop()
+                paths.pop()
+            continue
+        path = f"{paths[-1]}/{name}" if names else name
+        items.append((path, '', line))
+        if not self_closing:
+            names.append(name)
+            paths.append(path)
+    add_text(text[position:])
+    return items
+
+
+class TemplateDiff:
+    """
+    Сравнение двух шаблонов построчно или по путям XML элементов.
+    left/right — элементы для отображения, ops — операции difflib-формата над ними.
+    approximate — файлы различаются больше чем на MAX_EDIT_COST правок в одном участке,
+    и список правок найден по якорным строкам, а не кратчайший.
+    cancelled() — функция без аргументов; когда она возвращает True, сравнение прерывается DiffCancelled.
+    """
+
+    def __init__(self, left_text, right_text, mode=MODE_LINES, cancelled=None):
+        self.mode = mode
+        report = {}
+        if mode == MODE_STRUCTURE:
+            left_items = structure_items(left_text)
+            right_items = structure_items(right_text)
+            self.left = [self._format_item(item) for item in left_items]
+            self.right = [self._format_item(item) for item in right_items]
+            self.left_lines = [item[2] for item in left_items]
+            self.right_lines = [item[2] for item in right_items]
+            # Строка «путь = значение» однозначно задает элемент и хэшируется один раз
+            self.ops = opcodes(self.left, self.right, cancelled, report)
+        else:
+            self.left = left_text.splitlines()
+            self.right = right_text.splitlines()
+            self.left_lines = None
+            self.right_lines = None
+            self.ops = opcodes(self.left, self.right, cancelled, report)
+        self.approximate = report.get('approximate', False)
+
+    @staticmethod
+    def _format_item(item):
+        path, value, _ = item
+        return f"{path} = {value}" if value else path
+
+    def line_number(self, side, index):
+        """Номер строки исходного файла для элемента index"""
+        lines = self.left_lines if side == 0 else self.right_lines
+        return lines[index] if lines is not None else index + 1
+
+    def summary(self):
+        counts = {'equal': 0, 'replace': 0, 'delete': 0, 'insert': 0}
+        for tag, i1, i2, j1, j2 in self.ops:
+            counts[tag] += max(i2 - i1, j2 - j1)
+        return counts
+
+    @classmethod
+    def from_files(cls, left_path, right_path, mode=MODE_LINES, cancelled=None):
+        left = Path(left_path).read_text(encoding='utf-8', errors='replace')
+        right = Path(right_path).read_text(encoding='utf-8', errors='replace')
+        return cls(left, right, mode, cancelled)
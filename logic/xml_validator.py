@@ -0,0 +1,488 @@
+import re
+import threading
+import xml.etree.ElementTree as ET
+
+# Конверт, в который генератор помещает детей корневого элемента схемы (см. FileProcessor._generate_raw_vm)
+ENVELOPE = ('AppDataRequest', 'SetRequest')
+
+# Ошибок на документ, после которых проверка документа прекращается
+MAX_ERRORS = 100
+
+# Лексические формы встроенных типов XSD; остальные встроенные типы проверяются только фасетами
+_BUILTIN_PATTERNS = {
+    'integer': r'[+-]?\d+',
+    'int': r'[+-]?\d+',
+    'long': r'[+-]?\d+',
+    'short': r'[+-]?\d+',
+    'byte': r'[+-]?\d+',
+    'nonNegativeInteger': r'\+?\d+|-0+',
+    'positiveInteger': r'\+?0*[1-9]\d*',
+    'decimal': r'[+-]?(\d+(\.\d*)?|\.\d+)',
+    'boolean': r'true|false|1|0',
+    'date': r'-?\d{4,}-\d{2}-\d{2}(Z|[+-]\d{2}:\d{2})?',
+    'dateTime': r'-?\d{4,}-\d{2}-\d{2}T\d{2}:\d{2}:\d{2}(\.\d+)?(Z|[+-]\d{2}:\d{2})?',
+    'time': r'\d{2}:\d{2}:\d{2}(\.\d+)?(Z|[+-]\d{2}:\d{2})?',
+    'gYear': r'-?\d{4,}(Z|[+-]\d{2}:\d{2})?',
+}
+# Пробелы по краям значения не нарушают тип (whiteSpace collapse у всех типов, кроме строковых)
+_STRING_TYPES = {'string', 'normalizedString', 'anyURI'}
+_COLLAPSE = re.compile(r'\s+')
+
+# Классы XSD, которых нет в re: заменяем на близкие эквиваленты
+_XSD_REGEX_CLASSES = (('\\i', '[A-Za-z_:]'), ('\\c', '[\\w.:-]'), ('\\p{L}', '[^\\W\\d_]'), ('\\p{Nd}', '\\d'))
+
+
+def _occurs(node):
+    """(minOccurs, maxOccurs) узла структуры или частицы; None — unbounded"""
+    max_occurs = node.get('maxOccurs') or '1'
+    return int(node.get('minOccurs') or 1), None if max_occurs == 'unbounded' else int(max_occurs)
+
+
+class _Checker:
+    """Скомпилированная проверка одного элемента схемы"""
+    __slots__ = ('name', 'min_occurs', 'max_occurs', 'content', 'open', 'by_name', 'simple', 'base_re',
+                 'collapse', 'enumeration', 'patterns', 'length', 'min_length', 'max_length')
+
+    def __init__(self, node):
+        self.name = node.get('name')
+        self.min_occurs, self.max_occurs = _occurs(node)
+        # Модель содержимого (_Particle); None — у элемента нет детей
+        self.content = None
+        # Открытое содержимое: порядок детей не проверяется, проверяются только известные дети
+        self.open = False
+        # Имя ребенка -> проверка (для открытого содержимого и сообщений о нарушении порядка)
+        self.by_name = {}
+        facets = node.get('facets')
+        # Элемент без детей и без фасетов — нераскрытый или нетипизированный: содержимое не проверяется
+        self.simple = facets is not None
+        facets = facets or {}
+        base = facets.get('base')
+        pattern = _BUILTIN_PATTERNS.get(base)
+        self.base_re = re.compile(pattern) if pattern else None
+        self.collapse = base not in _STRING_TYPES
+        self.enumeration = frozenset(facets['enumeration']) if facets.get('enumeration') else None
+        self.patterns = []
+        for pattern in facets.get('pattern', ()):
+            compiled = _compile_xsd_pattern(pattern)
+            if compiled is not None:
+                self.patterns.append((pattern, compiled))
+        self.length = facets.get('length')
+        self.min_length = facets.get('minLength')
+        self.max_length = facets.get('maxLength')
+
+    def check_text(self, text):
+        """Сообщения о нарушениях фасетов для текста простого элемента"""
+        value = _COLLAPSE.sub(' ', text).strip() if self.collapse else text
+        errors = []
+        if self.base_re is not None and not self.base_re.fullmatch(value):
+            errors.append(f"значение '{value}' не соответствует типу")
+        if self.enumeration is not None and value not in self.enumeration:
+            errors.append(f"значение '{value}' не входит в перечисление")
+        for source, compiled in self.patterns:
+            if not compiled.fullmatch(value):
+                errors.append(f"значение '{value}' не соответствует шаблону {source}")
+        if self.length is not None and len(value) != self.length:
+            errors.append(f"длина {len(value)} вместо {self.length}")
+        if self.min_length is not None and len(value) < self.min_length:
+            errors.append(f"длина {len(value)} меньше {self.min_length}")
+        if self.max_length is not None and len(value) > self.max_length:
+            errors.append(f"длина {len(value)} больше {self.max_length}")
+        return errors
+
+
+def _compile_xsd_pattern(pattern):
+    """Шаблон фасета pattern (в XSD он привязан к значению целиком); None, если re его не понимает"""
+    for xsd_class, replacement in _XSD_REGEX_CLASSES:
+        pattern = pattern.replace(xsd_class, replacement)
+    try:
+        return re.compile(pattern)
+    except re.error:
+        return None
+
+
+class _Particle:
+    """
+    Частица модели содержимого: элемент (kind 'element', checker) или группа sequence/choice/all.
+    first — имена элементов, с которых может начинаться частица; emptiable — допускает ли она пустое содержимое.
+    """
+    __slots__ = ('kind', 'min_occurs', 'max_occurs', 'items', 'checker', 'first', 'emptiable', 'label')
+
+    def __init__(self, kind, occurs, checker=None):
+        self.kind = kind
+        self.min_occurs, self.max_occurs = occurs
+        self.items = []
+        self.checker = checker
+        if checker is not None:
+            self.first = frozenset((checker.name,))
+            self.emptiable = self.min_occurs == 0
+            self.label = checker.name
+
+    def finish(self):
+        """Считает first, emptiable и подпись группы по уже готовым частицам items"""
+        items = self.items
+        names = []
+        for item in items:
+            names.extend(name for name in item.label.split('|') if name not in names)
+            if self.kind == 'sequence' and not item.emptiable:
+                break
+        self.first = frozenset(names)
+        self.label = '|'.join(names)
+        if self.kind == 'choice':
+            self.emptiable = self.min_occurs == 0 or any(item.emptiable for item in items)
+        else:
+            self.emptiable = self.min_occurs == 0 or all(item.emptiable for item in items)
+
+
+def _compile_content(node, checker, leaves):
+    """
+    Модель содержимого элемента: node['content'] из FileProcessor._build_structure, а без нее —
+    последовательность children. leaves — частицы детей в порядке children + extra_children.
+    """
+    model = node.get('content')
+    if model is None:
+        model = {'kind': 'sequence', 'items': range(len(node.get('children', ())))}
+    elif model['kind'] == 'open':
+        checker.open = True
+        return None
+    root = _Particle(model['kind'], _occurs(model))
+    order = []
+    stack = [(model, root)]
+    while stack:
+        spec, particle = stack.pop()
+        order.append(particle)
+        for item in spec['items']:
+            if isinstance(item, int):
+                particle.items.append(leaves[item])
+            else:
+                group = _Particle(item['kind'], _occurs(item))
+                particle.items.append(group)
+                stack.append((item, group))
+    # Группы в обратном порядке обхода: вложенные готовы раньше содержащих
+    for particle in reversed(order):
+        particle.finish()
+    return root
+
+
+def compile_schema(structure):
+    """Компилирует разобранную структуру (FileProcessor._parse_xsd) в дерево проверок; обход с явным стеком"""
+    root = _Checker(structure)
+    stack = [(structure, root)]
+    while stack:
+        node, checker = stack.pop()
+        children = node.get('children', []) + node.get('extra_children', [])
+        leaves = []
+        for child in children:
+            child_checker = _Checker(child)
+            leaves.append(_Particle('element', (child_checker.min_occurs, child_checker.max_occurs), child_checker))
+            checker.by_name.setdefault(child_checker.name, child_checker)
+            stack.append((child, child_checker))
+        if children or node.get('content') is not None:
+            checker.content = _compile_content(node, checker, leaves)
+    return root
+
+
+# Скомпилированные схемы: id структуры -> (структура, проверки)
+_compiled = {}
+_compiled_lock = threading.Lock()
+COMPILED_CACHE_SIZE = 32
+
+
+def get_validator(structure):
+    """SchemaValidator для структуры; проверки компилируются один раз на разобранную структуру"""
+    key = id(structure)
+    with _compiled_lock:
+        cached = _compiled.get(key)
+    if cached is not None and cached[0] is structure:
+        return cached[1]
+    validator = SchemaValidator(structure)
+    with _compiled_lock:
+        _compiled[key] = (structure, validator)
+        while len(_compiled) > COMPILED_CACHE_SIZE:
+            del _compiled[next(iter(_compiled))]
+    return validator
+
+
+class _Frame:
+    """Открытый элемент документа при потоковой проверке"""
+    __slots__ = ('checker', 'path', 'cursor', 'seen')
+
+    def __init__(self, checker, path):
+        self.checker = checker
+        self.path = path
+        # Позиция в модели содержимого: частицы от корня модели до текущего элемента
+        self.cursor = [_Position(checker.content, 0)] if checker.content is not None else []
+        # Имя ребенка -> число вхождений (для индексов в путях ошибок)
+        self.seen = {}
+
+
+class _Position:
+    """Частица на пути к текущему элементу: число начатых повторов и место внутри текущего повтора"""
+    __slots__ = ('particle', 'count', 'index', 'used')
+
+    def __init__(self, particle, count):
+        self.particle = particle
+        self.count = count
+        # sequence: номер текущей частицы; all: номера уже встреченных
+        self.index = -1
+        self.used = set()
+
+
+class SchemaValidator:
+    """
+    Потоковая проверка XML документов по скомпилированной схеме:
+    порядок, выбор и число вхождений детей по модели содержимого (sequence, choice, all, extension),
+    обязательные дети, фасеты простых значений.
+    Документ читается iterparse, разобранные элементы сразу освобождаются.
+    Ошибки — словари {'path': путь элемента, 'message': описание}.
+    """
+
+    def __init__(self, structure):
+        self.structure = structure
+        self.root = compile_schema(structure)
+
+    def validate(self, source, max_errors=MAX_ERRORS):
+        """Проверяет документ (путь или файловый объект); возвращает список ошибок"""
+        errors = []
+        stack = []
+        # Глубина открытых элементов, содержимое которых не проверяется (лишние и нераскрытые)
+        skipped = 0
+        root_found = False
+        try:
+            for event, elem in ET.iterparse(source, events=('start', 'end')):
+                name = elem.tag.rsplit('}', 1)[-1]
+                if event == 'end':
+                    if skipped:
+                        skipped -= 1
+                    elif stack:
+                        self._leave(stack.pop(), elem, errors)
+                    elem.clear()
+                elif skipped:
+                    skipped += 1
+                elif stack:
+                    frame = stack[-1]
+                    child = self._enter_child(frame, name, errors)
+                    if child is None:
+                        skipped = 1
+                        continue
+                    index = frame.seen.get(name, 0) + 1
+                    frame.seen[name] = index
+                    path = f"{frame.path}/{name}" + (f"[{index}]" if index > 1 or child.max_occurs != 1 else '')
+                    stack.append(_Frame(child, path))
+                elif root_found:
+                    # Элементы конверта после корня схемы не проверяются
+                    skipped = 1
+                elif name == self.root.name or name == ENVELOPE[-1]:
+                    # Внутренний элемент конверта содержит детей корня схемы, как в сгенерированном шаблоне
+                    root_found = True
+                    stack.append(_Frame(self.root, self.root.name))
+                elif name not in ENVELOPE:
+                    errors.append({'path': name, 'message': f"корневой элемент не {self.root.name}"})
+                    return errors
+                if len(errors) >= max_errors:
+                    errors.append({'path': '', 'message': f"проверка остановлена после {max_errors} ошибок"})
+                    return errors
+        except ET.ParseError as e:
+            errors.append({'path': stack[-1].path if stack else '', 'message': f"документ не разобран: {e}"})
+            return errors
+        if not root_found:
+            errors.append({'path': '', 'message': f"в документе нет элемента {self.root.name}"})
+        return errors
+
+    @staticmethod
+    def _enter_child(frame, name, errors):
+        """Продвигает позицию в модели содержимого; возвращает проверку ребенка или None"""
+        checker = frame.checker
+        if checker.open:
+            return checker.by_name.get(name)
+        if checker.content is None:
+            if checker.simple:
+                errors.append({'path': frame.path, 'message': f"у простого элемента недопустимый дочерний {name}"})
+            return None
+        cursor = frame.cursor
+        position = cursor[-1]
+        particle = position.particle
+        if particle.checker is not None:
+            # Частые случаи без поиска по уровням: повтор текущего элемента и следующий элемент sequence
+            if particle.checker.name == name:
+                if particle.max_occurs is None or position.count < particle.max_occurs:
+                    position.count += 1
+                    return particle.checker
+            elif position.count >= particle.min_occurs and len(cursor) > 1:
+                parent = cursor[-2]
+                following = parent.index + 1
+                if parent.particle.kind == 'sequence' and following < len(parent.particle.items):
+                    item = parent.particle.items[following]
+                    if item.checker is not None and item.checker.name == name:
+                        parent.index = following
+                        position.particle = item
+                        position.count = 1
+                        return item.checker
+        # Самая глубокая частица, которая может продолжиться этим элементом; пропуск обязательных частиц —
+        # только если иначе никак и элемент не просто лишний повтор текущего
+        level, target = SchemaValidator._find_level(cursor, name, False)
+        if target is None:
+            position = cursor[-1]
+            if position.particle.checker is not None and position.particle.checker.name == name:
+                return SchemaValidator._unexpected(frame, name, errors)
+            level, target = SchemaValidator._find_level(cursor, name, True)
+            if target is None:
+                return SchemaValidator._unexpected(frame, name, errors)
+
+        while len(cursor) > level + 1:
+            SchemaValidator._finish(frame, cursor.pop(), errors)
+        position = cursor[-1]
+        particle = position.particle
+        if target < 0:
+            # Следующий повтор частицы
+            SchemaValidator._finish_iteration(frame, position, errors)
+            position.count += 1
+            position.index = -1
+            position.used = set()
+            if particle.checker is not None:
+                return particle.checker
+            target = SchemaValidator._next_item(position, name, True)
+        while True:
+            SchemaValidator._check_skipped(frame, position, target, errors)
+            if particle.kind == 'all':
+                position.used.add(target)
+            else:
+                position.index = target
+            particle = particle.items[target]
+            position = _Position(particle, 1)
+            cursor.append(position)
+            if particle.checker is not None:
+                return particle.checker
+            target = SchemaValidator._next_item(position, name, True)
+
+    @staticmethod
+    def _find_level(cursor, name, skip_required):
+        """(уровень курсора, продолжение _next_item) для самой глубокой частицы, принимающей name"""
+        for level in range(len(cursor) - 1, -1, -1):
+            target = SchemaValidator._next_item(cursor[level], name, skip_required)
+            if target is not None:
+                return level, target
+        return None, None
+
+    @staticmethod
+    def _next_item(position, name, skip_required):
+        """
+        Как частица продолжится элементом name: номер вложенной частицы в текущем повторе,
+        -1 — новым повтором, None — никак. С skip_required обязательные частицы sequence могут пропускаться
+        (о них сообщает _check_skipped), чтобы проверка продолжалась после ошибки.
+        """
+        particle = position.particle
+        if particle.checker is None:
+            items = particle.items
+            if particle.kind == 'sequence':
+                candidates = range(position.index + 1, len(items))
+            elif particle.kind == 'choice':
+                # Ветвь выбирается один раз за повтор
+                candidates = range(len(items)) if position.index < 0 else ()
+            else:
+                candidates = (index for index in range(len(items)) if index not in position.used)
+            for index in candidates:
+                if name in items[index].first:
+                    # Корень модели до первого элемента еще не начал повтор
+                    position.count = position.count or 1
+                    return index
+                if not skip_required and particle.kind == 'sequence' and not items[index].emptiable:
+                    break
+        if position.count and name in particle.first and (particle.max_occurs is None
+                                                          or position.count < particle.max_occurs):
+            if skip_required or particle.checker is not None or not SchemaValidator._required_left(position):
+                return -1
+        return None
+
+    @staticmethod
+    def _required_left(position):
+        """Остались ли в текущем повторе группы обязательные частицы"""
+        particle = position.particle
+        if particle.kind == 'sequence':
+            return any(not item.emptiable for item in particle.items[position.index + 1:])
+        if particle.kind == 'all':
+            return any(not item.emptiable for index, item in enumerate(particle.items) if index not in position.used)
+        return position.index < 0 and not particle.emptiable
+
+    @staticmethod
+    def _unexpected(frame, name, errors):
+        """Элемент, которым модель продолжиться не может; возвращает его проверку, чтобы проверить содержимое"""
+        position = frame.cursor[-1]
+        checker = position.particle.checker
+        if checker is not None and checker.name == name:
+            position.count += 1
+            errors.append({'path': f"{frame.path}/{name}[{frame.seen.get(name, 0) + 1}]",
+                           'message': f"вхождений больше {checker.max_occurs}"})
+            return checker
+        checker = frame.checker.by_name.get(name)
+        if checker is None:
+            errors.append({'path': frame.path, 'message': f"неизвестный дочерний элемент {name}"})
+        else:
+            errors.append({'path': frame.path, 'message': f"элемент {name} нарушает порядок или выбор элементов"})
+        return checker
+
+    @staticmethod
+    def _check_skipped(frame, position, target, errors):
+        """Сообщает об обязательных частицах sequence между текущей и target, которые не встретились"""
+        particle = position.particle
+        if particle.kind != 'sequence':
+            return
+        for index in range(position.index + 1, target):
+            SchemaValidator._report_missing(frame, particle.items[index], errors)
+
+    @staticmethod
+    def _finish_iteration(frame, position, errors):
+        """Сообщает об обязательных частицах, которых не было до конца текущего повтора"""
+        particle = position.particle
+        if not position.count or particle.checker is not None:
+            return
+        if particle.kind == 'sequence':
+            SchemaValidator._check_skipped(frame, position, len(particle.items), errors)
+        elif particle.kind == 'all':
+            for index, item in enumerate(particle.items):
+                if index not in position.used:
+                    SchemaValidator._report_missing(frame, item, errors)
+
+    @staticmethod
+    def _finish(frame, position, errors):
+        """Частица закончилась: недостающее в последнем повторе и недостающие повторы"""
+        particle = position.particle
+        SchemaValidator._finish_iteration(frame, position, errors)
+        if position.count == 0:
+            SchemaValidator._report_missing(frame, particle, errors)
+        elif position.count < particle.min_occurs:
+            if particle.checker is not None:
+                errors.append({'path': frame.path, 'message': f"нет обязательного элемента {particle.label}"})
+            else:
+                errors.append({'path': frame.path,
+                               'message': f"повторов группы {particle.label} меньше {particle.min_occurs}"})
+
+    @staticmethod
+    def _report_missing(frame, particle, errors):
+        """Сообщает о непустой частице, которой нет в документе: об элементе, выборе или обязательных частях группы"""
+        stack = [particle]
+        while stack:
+            particle = stack.pop()
+            if particle.emptiable:
+                continue
+            if particle.checker is not None or particle.kind == 'choice':
+                errors.append({'path': frame.path, 'message': f"нет обязательного элемента {particle.label}"})
+            else:
+                stack.extend(reversed(particle.items))
+
+    @staticmethod
+    def _leave(frame, elem, errors):
+        checker = frame.checker
+        if frame.cursor:
+            while frame.cursor:
+                SchemaValidator._finish(frame, frame.cursor.pop(), errors)
+        elif checker.simple:
+            for message in checker.check_text(elem.text or ''):
+                errors.append({'path': frame.path, 'message': message})
+
+    def iter_validate(self, sources, max_errors=MAX_ERRORS):
+        """Проверяет документы по очереди; отдает (документ, ошибки)"""
+        for source in sources:
+            try:
+                yield source, self.validate(source, max_errors)
+            except OSError as e:
+                yield source, [{'path': '', 'message': f"файл не прочитан: {e}"}]
@@ -1,9 +1,36 @@
 import sys
-from PyQt6.QtWidgets import QApplication
-from ui.main_window import MainWindow
+
+from logic import startup_trace
+import config
+
 
 if __name__ == '__main__':
+    # Подкоманду проверяем по списку из config: cli тянет за собой всю логику генерации
+    if len(sys.argv) > 1 and sys.argv[1] in config.CLI_COMMANDS:
+        import cli
+        sys.exit(cli.main(sys.argv[1:]))
+
+    # Окно уже открыто: отдаем ему файлы запуска, не загружая виджеты
+    from logic.single_instance import InstanceServer, forward_to_running
+    if forward_to_running(sys.argv[1:]):
+        startup_trace.mark("аргументы переданы открытому окну")
+        sys.exit(0)
+
+    from PyQt6.QtWidgets import QApplication
+    from PyQt6.QtCore import QTimer
+    from ui.main_window import MainWindow
+    startup_trace.mark("модули загружены")
+
     app = QApplication(sys.argv)
+    instance = InstanceServer()
+    if not instance.listen():
+        # Окно открылось одновременно с нами: передаем аргументы ему, историю пишет оно
+        sys.exit(0 if forward_to_running(sys.argv[1:]) else 1)
     window = MainWindow()
+    instance.arguments_received.connect(window.open_paths)
+    startup_trace.mark("окно создано")
     window.show()
-    sys.exit(app.exec())
\ No newline at end of file
+    window.open_paths(sys.argv[1:])
+    # Срабатывает после обработки первой отрисовки окна
+    QTimer.singleShot(0, lambda: startup_trace.mark("первая отрисовка"))
+    sys.exit(app.exec())
@@ -0,0 +1,62 @@
+import asyncio
+import os
+import threading
+import time
+import unittest
+from unittest import mock
+
+from logic.async_processor import AsyncFileProcessor
+from logic.file_processor import FileProcessor
+
+
+class OutputDirTest(unittest.TestCase):
+    def setUp(self):
+        self.active = {}
+        self.overlaps = []
+        self.lock = threading.Lock()
+
+    def fake_steps(self, scenario_path, xsd_path, output_dir, *args):
+        # Этап занимает поток пула: одновременные задания в одну папку видны как пересечение
+        key = os.path.normcase(os.path.abspath(output_dir))
+
+        def work():
+            with self.lock:
+                self.active[key] = self.active.get(key, 0) + 1
+                if self.active[key] > 1:
+                    self.overlaps.append(key)
+            time.sleep(0.02)
+            with self.lock:
+                self.active[key] -= 1
+
+        yield 'io', work, ()
+        yield 'cpu', work, ()
+        return {'output_dir': output_dir, 'scenario_path': scenario_path}
+
+    def run_jobs(self, jobs):
+        async def collect():
+            async with AsyncFileProcessor(max_concurrency=8, io_workers=8, cpu_workers=8) as processor:
+                return [result async for _, result in processor.iter_build_vm_templates(jobs)]
+
+        with mock.patch.object(FileProcessor, '_build_steps', self.fake_steps):
+            return asyncio.run(collect())
+
+    def test_same_directory_runs_in_order(self):
+        # Разное написание одной папки — одна очередь
+        jobs = [{'scenario_path': f's{i}', 'xsd_path': 'x', 'output_dir': path}
+                for i, path in enumerate(['out', './out', os.path.abspath('out'), 'out/../out'])]
+        self.assertEqual(len(self.run_jobs(jobs)), 4)
+        self.assertEqual(self.overlaps, [])
+
+    def test_different_directories_run_together(self):
+        jobs = [{'scenario_path': f's{i}', 'xsd_path': 'x', 'output_dir': f'out{i}'} for i in range(4)]
+        started = time.perf_counter()
+        self.assertEqual(len(self.run_jobs(jobs)), 4)
+        self.assertLess(time.perf_counter() - started, 4 * 0.04)
+
+    def test_output_dir_required(self):
+        with self.assertRaises(ValueError):
+            self.run_jobs([{'scenario_path': 's', 'xsd_path': 'x'}])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,18 @@
+import argparse
+import unittest
+
+import config
+from cli import COMMANDS, build_parser
+
+
+class CommandsTest(unittest.TestCase):
+    def test_commands_match_parser(self):
+        # main.py решает по config.CLI_COMMANDS, запускать ли окно: список должен совпадать с подкомандами cli
+        parser = build_parser()
+        subparsers = next(action for action in parser._actions if isinstance(action, argparse._SubParsersAction))
+        self.assertEqual(set(subparsers.choices), set(config.CLI_COMMANDS))
+        self.assertIs(COMMANDS, config.CLI_COMMANDS)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,74 @@
+import os
+import tempfile
+import unittest
+
+from logic.execution_strategy import (COMPACT_INDEX_SCALARS, INDEX_COMPACT, INDEX_FULL, OUTPUT_MEMORY, OUTPUT_STREAM,
+                                      STREAM_OUTPUT_NODES, choose_strategy, estimate_scenario, estimate_schema_file)
+
+SCHEMA_HEAD = '<xs:schema xmlns:xs="http://www.w3.org/2001/XMLSchema">\n'
+SCHEMA_TAIL = '</xs:schema>\n'
+
+
+def elements(prefix, count, list_every=0):
+    lines = []
+    for i in range(count):
+        occurs = ' maxOccurs="unbounded"' if list_every and i % list_every == 0 else ''
+        lines.append(f'  <xs:element name="{prefix}{i}" type="xs:string"{occurs}/>\n')
+    return ''.join(lines)
+
+
+class ChooseStrategyTest(unittest.TestCase):
+    def decide(self, scenario_keys, schema_nodes):
+        return choose_strategy({'scenario_keys': scenario_keys, 'schema_nodes': schema_nodes})
+
+    def test_thresholds(self):
+        self.assertEqual(self.decide(COMPACT_INDEX_SCALARS, STREAM_OUTPUT_NODES),
+                         {'index': INDEX_FULL, 'output': OUTPUT_MEMORY, 'workers': 1})
+        self.assertEqual(self.decide(COMPACT_INDEX_SCALARS + 1, STREAM_OUTPUT_NODES),
+                         {'index': INDEX_COMPACT, 'output': OUTPUT_MEMORY, 'workers': 1})
+        self.assertEqual(self.decide(0, STREAM_OUTPUT_NODES + 1),
+                         {'index': INDEX_FULL, 'output': OUTPUT_STREAM, 'workers': 2})
+
+
+class EstimateTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+
+    def write(self, name, text):
+        path = os.path.join(self.tmp.name, name)
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(text)
+        return path
+
+    def test_schema_estimate_counts_included_modules(self):
+        # Модули ссылаются друг на друга: каждый файл считается один раз
+        part = self.write('part.xsd', SCHEMA_HEAD + '  <xs:include schemaLocation="main.xsd"/>\n'
+                          + '  <xs:complexType name="Part"><xs:sequence>\n' + elements('p', 3, list_every=3)
+                          + '  </xs:sequence></xs:complexType>\n' + SCHEMA_TAIL)
+        main = self.write('main.xsd', SCHEMA_HEAD + '  <xs:include schemaLocation="part.xsd"/>\n'
+                          + elements('m', 2) + SCHEMA_TAIL)
+        estimates = estimate_schema_file(main)
+        self.assertEqual(estimates['schema_nodes'], 5)
+        self.assertEqual(estimates['complex_types'], 1)
+        self.assertEqual(estimates['schema_lists'], 1)
+        self.assertEqual(estimates['xsd_bytes'], os.path.getsize(main) + os.path.getsize(part))
+        self.assertFalse(estimates['schema_cached'])
+
+    def test_decision_from_estimates(self):
+        # Больше половины элементов в подключенном модуле: без него оценка не перешла бы порог
+        half = STREAM_OUTPUT_NODES // 2 + 1
+        self.write('part.xsd', SCHEMA_HEAD + elements('p', half) + SCHEMA_TAIL)
+        main = self.write('main.xsd', SCHEMA_HEAD + '  <xs:include schemaLocation="part.xsd"/>\n'
+                          + elements('m', half) + SCHEMA_TAIL)
+        scenario = self.write('scenario.json', '{"a": "1", "b": [{"c": "2"}]}')
+        estimates = estimate_scenario(scenario)
+        self.assertEqual((estimates['scenario_keys'], estimates['scenario_lists']), (3, 1))
+        estimates.update(estimate_schema_file(main))
+        self.assertEqual(choose_strategy(estimates)['output'], OUTPUT_STREAM)
+        estimates.update(estimate_schema_file(os.path.join(self.tmp.name, 'part.xsd')))
+        self.assertEqual(choose_strategy(estimates)['output'], OUTPUT_MEMORY)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,98 @@
+import re
+import unittest
+
+from logic.file_processor import FileProcessor
+
+ORDER_SCHEMA = """<?xml version="1.0" encoding="UTF-8"?>
+<xs:schema xmlns:xs="http://www.w3.org/2001/XMLSchema">
+  <xs:element name="Order">
+    <xs:complexType>
+      <xs:sequence>
+        <xs:element name="number" type="xs:string"/>
+        <xs:element name="item" maxOccurs="unbounded">
+          <xs:complexType>
+            <xs:sequence>
+              <xs:element name="code" type="xs:string"/>
+            </xs:sequence>
+          </xs:complexType>
+        </xs:element>
+      </xs:sequence>
+    </xs:complexType>
+  </xs:element>
+</xs:schema>
+"""
+
+# T и A ссылаются друг на друга: x:T раскрывается в x/y(z, av), а w:A — в w/z(y, tv)
+RECURSIVE_SCHEMA = """<?xml version="1.0" encoding="UTF-8"?>
+<xs:schema xmlns:xs="http://www.w3.org/2001/XMLSchema" xmlns:t="urn:t" targetNamespace="urn:t">
+  <xs:complexType name="T">
+    <xs:sequence>
+      <xs:element name="y" type="t:A"/>
+      <xs:element name="tv" type="xs:string"/>
+    </xs:sequence>
+  </xs:complexType>
+  <xs:complexType name="A">
+    <xs:sequence>
+      <xs:element name="z" type="t:T"/>
+      <xs:element name="av" type="xs:string"/>
+    </xs:sequence>
+  </xs:complexType>
+  <xs:element name="TreeSetRequest">
+    <xs:complexType>
+      <xs:sequence>
+        <xs:element name="x" type="t:T"/>
+        <xs:element name="w" type="t:A"/>
+      </xs:sequence>
+    </xs:complexType>
+  </xs:element>
+</xs:schema>
+"""
+
+
+def body_tags(vm_text):
+    """Открывающие теги тела шаблона по порядку, без конверта AppDataRequest/SetRequest."""
+    return [tag for tag in re.findall(r"<([A-Za-z_][\w.-]*)>", vm_text) if ':' not in tag]
+
+
+class StructureTest(unittest.TestCase):
+    def test_sequence_children_listed_once(self):
+        structure = FileProcessor._parse_xsd(ORDER_SCHEMA)
+        self.assertEqual([child['name'] for child in structure['children']], ['number', 'item'])
+        self.assertEqual([child['name'] for child in structure['children'][1]['children']], ['code'])
+
+    def test_template_contains_each_element_once(self):
+        # Раньше xsd: и xs: находили одних и тех же детей дважды, и шаблон повторял каждый элемент:
+        # number, item, code, code, number, item, code, code
+        structure = FileProcessor._parse_xsd(ORDER_SCHEMA)
+        vm_text = FileProcessor._generate_raw_vm(structure, {'number': '1', 'item': [{'code': 'a'}]})
+        self.assertEqual(body_tags(vm_text), ['number', 'item', 'code'])
+        self.assertEqual(vm_text.count('#foreach'), 1)
+
+
+
+class FragmentCacheTest(unittest.TestCase):
+    def bind(self, structure, scenario, fragment_cache):
+        plan = FileProcessor._compile_plan(structure)
+        return FileProcessor._bind_plan(plan, scenario, FileProcessor._build_list_index(scenario),
+                                        FileProcessor._new_key_matcher(scenario), fragment_cache)
+
+    def test_recursive_type_expanded_per_path(self):
+        # Поддерево A под x/y обрезано (T уже на пути), под w — нет: кэш не должен подставлять одно вместо другого
+        structure = FileProcessor._parse_xsd(RECURSIVE_SCHEMA)
+        scenario = {'av': '1', 'tv': '2'}
+        cached = self.bind(structure, scenario, FileProcessor._new_fragment_cache())
+        self.assertEqual(cached, self.bind(structure, scenario, None))
+        self.assertEqual([line.strip() for line in cached[cached.index('    <w>'):]],
+                         ['<w>', '<z>', '<y>$y</y>', '<tv>2</tv>', '</z>', '<av>1</av>', '</w>'])
+
+    def test_repeated_type_still_cached(self):
+        structure = FileProcessor._parse_xsd(RECURSIVE_SCHEMA)
+        # Два одинаково развернутых вхождения T делят один фрагмент
+        structure['children'].append(dict(structure['children'][0], name='x2'))
+        fragment_cache = FileProcessor._new_fragment_cache()
+        self.bind(structure, {}, fragment_cache)
+        self.assertEqual(fragment_cache['hits'], 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
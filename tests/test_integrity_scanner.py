@@ -0,0 +1,61 @@
+import os
+import sys
+import tempfile
+import time
+import unittest
+
+os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+
+from PyQt6.QtWidgets import QApplication
+
+from logic.integrity_scanner import IntegrityScanner, STATUS_MISSING, STATUS_OK
+
+
+def record(record_id, path):
+    return {'id': record_id, 'files': {'input': [{'path': path}], 'output': []}}
+
+
+class IntegrityScannerTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.app = QApplication.instance() or QApplication(sys.argv)
+
+    def setUp(self):
+        self.scanner = IntegrityScanner()
+        # Пачка из одной записи и пауза после нее: проверка идет достаточно долго, чтобы успеть запросить новую
+        self.scanner.BATCH_SIZE = 1
+        self.scanner.BATCH_PAUSE_MS = 50
+        self.addCleanup(self.scanner.stop)
+        fd, self.path = tempfile.mkstemp()
+        os.close(fd)
+        self.addCleanup(os.remove, self.path)
+
+    def wait_idle(self, timeout=5):
+        deadline = time.monotonic() + timeout
+        while (self.scanner.isRunning() or self.scanner._pending is not None) and time.monotonic() < deadline:
+            self.app.processEvents()
+            time.sleep(0.01)
+        self.app.processEvents()
+
+    def test_scan_during_scan_runs_after_it(self):
+        first = [record(i, self.path) for i in range(3)]
+        self.assertTrue(self.scanner.scan(first))
+        # Две просьбы во время работы — одна повторная проверка по последнему снимку
+        self.assertFalse(self.scanner.scan(first + [record('late', self.path)]))
+        self.assertFalse(self.scanner.scan(first + [record('latest', self.path + '.missing')]))
+        self.wait_idle()
+        self.assertEqual(self.scanner.status(2), (STATUS_OK, ""))
+        self.assertIsNone(self.scanner.status('late'))
+        self.assertEqual(self.scanner.status('latest')[0], STATUS_MISSING)
+
+    def test_stop_drops_pending_scan(self):
+        self.scanner.scan([record(i, self.path) for i in range(3)])
+        self.scanner.scan([record('late', self.path)])
+        self.scanner.stop()
+        self.wait_idle()
+        self.assertIsNone(self.scanner.status('late'))
+        self.assertFalse(self.scanner.isRunning())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,42 @@
+import os
+import tempfile
+import unittest
+
+from logic.segment_map import splice_write
+
+
+class SpliceWriteTest(unittest.TestCase):
+    def splice(self, old_lines, new_lines):
+        fd, path = tempfile.mkstemp()
+        self.addCleanup(os.remove, path)
+        with os.fdopen(fd, 'wb') as f:
+            f.write('\n'.join(old_lines).encode('utf-8'))
+        written = splice_write(path, old_lines, new_lines)
+        with open(path, 'rb') as f:
+            self.assertEqual(f.read(), '\n'.join(new_lines).encode('utf-8'))
+        return written
+
+    def test_append(self):
+        # Старый файл — начало нового: перевод строки перед дописанным текстом пишется, а не пропускается
+        self.assertEqual(self.splice(['a'], ['a', 'a']), 2)
+        self.splice(['a', 'жж'], ['a', 'жж', '', 'b'])
+
+    def test_truncate(self):
+        self.assertEqual(self.splice(['a', 'b'], ['a']), 0)
+        self.splice(['a', 'b', 'c'], ['a'])
+        self.splice(['a', 'b'], [])
+
+    def test_empty_old(self):
+        self.splice([], ['a', 'b'])
+        self.splice([''], ['', 'a'])
+
+    def test_middle(self):
+        self.splice(['a', 'c'], ['a', 'b', 'c'])
+        self.splice(['a', 'b', 'c'], ['a', 'c'])
+        self.splice(['c'], ['b', 'c'])
+        self.assertEqual(self.splice(['a', 'b', 'c'], ['a', 'x', 'c']), 1)
+        self.assertEqual(self.splice(['a', 'b'], ['a', 'b']), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,26 @@
+import os
+import sys
+import unittest
+
+os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+
+from PyQt6.QtWidgets import QApplication
+
+from ui.structure_tree import StructureTreeView
+
+
+class StructureTreeViewTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.app = QApplication.instance() or QApplication(sys.argv)
+
+    def test_root_expanded(self):
+        view = StructureTreeView()
+        view.set_structure({'name': 'Root', 'children': [{'name': 'child', 'children': []}]})
+        root = view._tree_model.index(0, 0)
+        self.assertTrue(root.isValid())
+        self.assertTrue(view.tree.isExpanded(root))
+
+
+if __name__ == '__main__':
+    unittest.main()
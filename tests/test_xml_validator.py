@@ -0,0 +1,104 @@
+import io
+import unittest
+
+from logic.file_processor import FileProcessor
+from logic.xml_validator import SchemaValidator
+
+SCHEMA = """<?xml version="1.0" encoding="UTF-8"?>
+<xs:schema xmlns:xs="http://www.w3.org/2001/XMLSchema" xmlns:obj="urn:obj" targetNamespace="urn:obj">
+  <xs:complexType name="Base">
+    <xs:sequence>
+      <xs:element name="id" type="xs:integer"/>
+    </xs:sequence>
+  </xs:complexType>
+  <xs:complexType name="Ext">
+    <xs:complexContent>
+      <xs:extension base="obj:Base">
+        <xs:sequence>
+          <xs:element name="title" type="xs:string"/>
+        </xs:sequence>
+      </xs:extension>
+    </xs:complexContent>
+  </xs:complexType>
+  <xs:complexType name="Contacts">
+    <xs:all>
+      <xs:element name="phone" type="xs:string"/>
+      <xs:element name="email" type="xs:string" minOccurs="0"/>
+    </xs:all>
+  </xs:complexType>
+  <xs:element name="PersonSetRequest">
+    <xs:complexType>
+      <xs:sequence>
+        <xs:element name="name" type="xs:string"/>
+        <xs:choice>
+          <xs:element name="inn" type="xs:string"/>
+          <xs:element name="snils" type="xs:string"/>
+        </xs:choice>
+        <xs:element name="obj" type="obj:Ext" maxOccurs="unbounded"/>
+        <xs:element name="contacts" type="obj:Contacts" minOccurs="0"/>
+        <xs:element name="extra" minOccurs="0">
+          <xs:complexType>
+            <xs:sequence>
+              <xs:element name="note" type="xs:string"/>
+              <xs:any processContents="lax" minOccurs="0" maxOccurs="unbounded"/>
+            </xs:sequence>
+          </xs:complexType>
+        </xs:element>
+      </xs:sequence>
+    </xs:complexType>
+  </xs:element>
+</xs:schema>
+"""
+
+
+class ContentModelTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.validator = SchemaValidator(FileProcessor._parse_xsd(SCHEMA))
+
+    def errors(self, body):
+        document = f"<PersonSetRequest>{body}</PersonSetRequest>".encode('utf-8')
+        return [(error['path'], error['message']) for error in self.validator.validate(io.BytesIO(document))]
+
+    def test_choice_accepts_either_branch(self):
+        for person_id in ('<inn>7700000000</inn>', '<snils>11223344595</snils>'):
+            self.assertEqual(self.errors(f"<name>A</name>{person_id}<obj><id>1</id><title>T</title></obj>"), [])
+
+    def test_choice_requires_one_branch(self):
+        self.assertEqual(self.errors("<name>A</name><obj><id>1</id><title>T</title></obj>"),
+                         [('PersonSetRequest', "нет обязательного элемента inn|snils")])
+
+    def test_choice_rejects_both_branches(self):
+        errors = self.errors("<name>A</name><inn>1</inn><snils>2</snils><obj><id>1</id><title>T</title></obj>")
+        self.assertEqual(errors, [('PersonSetRequest', "элемент snils нарушает порядок или выбор элементов")])
+
+    def test_extension_includes_base_particle(self):
+        self.assertEqual(self.errors("<name>A</name><inn>1</inn>"
+                                     "<obj><id>1</id><title>T</title></obj><obj><id>2</id><title>U</title></obj>"), [])
+
+    def test_extension_requires_base_children_first(self):
+        self.assertEqual(self.errors("<name>A</name><inn>1</inn><obj><title>T</title></obj>"),
+                         [('PersonSetRequest/obj[1]', "нет обязательного элемента id")])
+        errors = self.errors("<name>A</name><inn>1</inn><obj><id>x</id><title>T</title></obj>")
+        self.assertEqual(errors, [('PersonSetRequest/obj[1]/id', "значение 'x' не соответствует типу")])
+
+    def test_all_accepts_any_order(self):
+        body = "<name>A</name><inn>1</inn><obj><id>1</id><title>T</title></obj>"
+        self.assertEqual(self.errors(body + "<contacts><email>e</email><phone>p</phone></contacts>"), [])
+        self.assertEqual(self.errors(body + "<contacts><email>e</email></contacts>"),
+                         [('PersonSetRequest/contacts', "нет обязательного элемента phone")])
+
+    def test_wildcard_is_open_content(self):
+        body = "<name>A</name><inn>1</inn><obj><id>1</id><title>T</title></obj>"
+        self.assertEqual(self.errors(body + "<extra><custom>1</custom><note>n</note></extra>"), [])
+
+    def test_template_children_unchanged(self):
+        # Ветви choice и дети базового типа нужны только проверке: в шаблон они не попадают
+        structure = FileProcessor._parse_xsd(SCHEMA)
+        self.assertEqual([child['name'] for child in structure['children']],
+                         ['name', 'obj', 'contacts', 'extra'])
+        self.assertEqual([child['name'] for child in structure['children'][1]['children']], ['title'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,309 @@
+import os
+from bisect import bisect_right
+from PyQt6.QtWidgets import (QDialog, QVBoxLayout, QHBoxLayout, QLabel, QComboBox,
+                             QCheckBox, QPushButton, QTableView, QHeaderView, QAbstractItemView)
+from PyQt6.QtCore import Qt, QAbstractTableModel, QModelIndex, QThread, pyqtSignal
+from PyQt6.QtGui import QColor, QFont
+
+from logic.output_store import output_sources, read_text
+from logic.template_diff import DiffCancelled, TemplateDiff, MODE_LINES, MODE_STRUCTURE
+
+
+class DiffTableModel(QAbstractTableModel):
+    """
+    Построчное представление результата сравнения «слева / справа».
+    Строки таблицы не создаются заранее: номер строки переводится в участок diff бинарным поиском,
+    поэтому вид запрашивает и раскладывает только видимые строки.
+    """
+
+    HEADERS = ["№", "Было", "№", "Стало"]
+    # Строк контекста вокруг изменения в режиме «только изменения»
+    CONTEXT = 3
+    COLORS = {
+        'delete': QColor(255, 215, 215),
+        'insert': QColor(215, 245, 215),
+        'replace': QColor(255, 240, 200),
+        'fold': QColor(225, 225, 225),
+    }
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.diff = None
+        # Участки: (тег, начало слева, начало справа, строк слева, строк справа, строк в таблице)
+        self.segments = []
+        self.starts = []
+        self.row_count = 0
+
+    def set_diff(self, diff, changes_only=False):
+        self.beginResetModel()
+        self.diff = diff
+        self.segments = []
+        if diff is not None:
+            self._build_segments(changes_only)
+        self.starts = []
+        self.row_count = 0
+        for segment in self.segments:
+            self.starts.append(self.row_count)
+            self.row_count += segment[5]
+        self.endResetModel()
+
+    def _build_segments(self, changes_only):
+        ops = self.diff.ops
+        for index, (tag, i1, i2, j1, j2) in enumerate(ops):
+            n1, n2 = i2 - i1, j2 - j1
+            if tag != 'equal':
+                self.segments.append((tag, i1, j1, n1, n2, max(n1, n2)))
+                continue
+            head = self.CONTEXT if index > 0 else 0
+            tail = self.CONTEXT if index < len(ops) - 1 else 0
+            if not changes_only or n1 <= head + tail + 1:
+                self.segments.append((tag, i1, j1, n1, n2, n1))
+                continue
+            if head:
+                self.segments.append((tag, i1, j1, head, head, head))
+            self.segments.append(('fold', i1 + head, j1 + head, n1 - head - tail, n2 - head - tail, 1))
+            if tail:
+                self.segments.append((tag, i2 - tail, j2 - tail, tail, tail, tail))
+
+    def _locate(self, row):
+        index = bisect_right(self.starts, row) - 1
+        return self.segments[index], row - self.starts[index]
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else self.row_count
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.HEADERS)
+
+    def headerData(self, section, orientation, role=Qt.ItemDataRole.DisplayRole):
+        if orientation == Qt.Orientation.Horizontal and role == Qt.ItemDataRole.DisplayRole:
+            return self.HEADERS[section]
+        return None
+
+    def data(self, index, role=Qt.ItemDataRole.DisplayRole):
+        if not index.isValid():
+            return None
+        (tag, i, j, n1, n2, _), offset = self._locate(index.row())
+        side = 0 if index.column() < 2 else 1
+        if role == Qt.ItemDataRole.BackgroundRole:
+            if tag == 'fold':
+                return self.COLORS['fold']
+            if tag == 'replace' or (tag == 'delete' and side == 0) or (tag == 'insert' and side == 1):
+                return self.COLORS[tag]
+            return None
+        if role != Qt.ItemDataRole.DisplayRole:
+            return None
+
+        if tag == 'fold':
+            return f"… без изменений: {n1}" if index.column() == 1 else None
+        position, count, items = (i, n1, self.diff.left) if side == 0 else (j, n2, self.diff.right)
+        if offset >= count:
+            return None
+        if index.column() % 2 == 0:
+            return str(self.diff.line_number(side, position + offset))
+        return items[position + offset]
+
+    def next_change(self, row):
+        """Первая строка следующего изменения после row или -1"""
+        index = bisect_right(self.starts, row) if row >= 0 else 0
+        for segment_index in range(index, len(self.segments)):
+            if self.segments[segment_index][0] not in ('equal', 'fold'):
+                return self.starts[segment_index]
+        return -1
+
+
+# Прерванные сравнения, которые еще не завершились: поток нельзя удалять, пока он работает
+_detached_workers = set()
+
+
+class _DiffWorker(QThread):
+    """Сравнение больших шаблонов не должно останавливать окно"""
+
+    finished_diff = pyqtSignal(object, str)
+
+    def __init__(self, left_path, right_path, mode, parent=None):
+        super().__init__(parent)
+        self.left_path = left_path
+        self.right_path = right_path
+        self.mode = mode
+        self._cancelled = False
+
+    def cancel(self):
+        """Прерывает сравнение и отвязывает поток от окна: он завершится сам, результат не придет"""
+        self._cancelled = True
+        self.finished_diff.disconnect()
+        self.setParent(None)
+        _detached_workers.add(self)
+        self.finished.connect(self._release)
+        if self.isFinished():
+            self._release()
+
+    def _release(self):
+        _detached_workers.discard(self)
+        self.deleteLater()
+
+    def run(self):
+        try:
+            diff = TemplateDiff(read_text(self.left_path), read_text(self.right_path), self.mode,
+                                lambda: self._cancelled)
+        except DiffCancelled:
+            return
+        except (OSError, ValueError) as e:
+            self.finished_diff.emit(None, str(e))
+        else:
+            self.finished_diff.emit(diff, "")
+
+
+class DiffDialog(QDialog):
+    """
+    Сравнение шаблонов двух запусков или двух произвольных файлов.
+    sources: {название: (слева, справа)} — пути или StoredOutput, например, сырой и заполненный шаблон.
+    """
+
+    MODES = [("Построчно", MODE_LINES), ("По структуре XML", MODE_STRUCTURE)]
+
+    def __init__(self, sources, left_title="", right_title="", parent=None):
+        super().__init__(parent)
+        self.sources = sources
+        self._worker = None
+        self.setWindowTitle("Сравнение шаблонов")
+        self.setAttribute(Qt.WidgetAttribute.WA_DeleteOnClose)
+        self.resize(1100, 700)
+
+        layout = QVBoxLayout()
+        if left_title or right_title:
+            titles = QLabel(f"Было: {left_title}\nСтало: {right_title}")
+            titles.setTextInteractionFlags(Qt.TextInteractionFlag.TextSelectableByMouse)
+            layout.addWidget(titles)
+
+        controls = QHBoxLayout()
+        self.source_combo = QComboBox()
+        self.source_combo.addItems(list(sources))
+        self.source_combo.setVisible(len(sources) > 1)
+        self.source_combo.currentIndexChanged.connect(self.compare)
+        controls.addWidget(self.source_combo)
+
+        self.mode_combo = QComboBox()
+        for title, _ in self.MODES:
+            self.mode_combo.addItem(title)
+        self.mode_combo.currentIndexChanged.connect(self.compare)
+        controls.addWidget(self.mode_combo)
+
+        self.changes_only = QCheckBox("Только изменения")
+        self.changes_only.setChecked(True)
+        self.changes_only.toggled.connect(self._rebuild_model)
+        controls.addWidget(self.changes_only)
+
+        self.next_button = QPushButton("Следующее изменение")
+        self.next_button.clicked.connect(self.jump_to_next_change)
+        controls.addWidget(self.next_button)
+        controls.addStretch()
+        layout.addLayout(controls)
+
+        self.summary_label = QLabel()
+        layout.addWidget(self.summary_label)
+
+        self.model = DiffTableModel(self)
+        self.view = QTableView()
+        self.view.setModel(self.model)
+        self.view.setFont(QFont("Consolas", 9))
+        self.view.setWordWrap(False)
+        self.view.setSelectionBehavior(QAbstractItemView.SelectionBehavior.SelectRows)
+        self.view.verticalHeader().setVisible(False)
+        # Фиксированные размеры: ни строки, ни колонки не измеряются по содержимому всей таблицы
+        self.view.verticalHeader().setSectionResizeMode(QHeaderView.ResizeMode.Fixed)
+        self.view.verticalHeader().setDefaultSectionSize(self.view.fontMetrics().height() + 4)
+        header = self.view.horizontalHeader()
+        for column in (0, 2):
+            header.setSectionResizeMode(column, QHeaderView.ResizeMode.Fixed)
+            header.resizeSection(column, 60)
+        for column in (1, 3):
+            header.setSectionResizeMode(column, QHeaderView.ResizeMode.Stretch)
+        layout.addWidget(self.view)
+
+        self.setLayout(layout)
+        self.diff = None
+        self.compare()
+
+    def compare(self):
+        if self._worker is not None:
+            # Текущее сравнение устарело: прерываем его и сразу начинаем новое
+            self._worker.cancel()
+        left_path, right_path = self.sources[self.source_combo.currentText()]
+        mode = self.MODES[self.mode_combo.currentIndex()][1]
+        self.summary_label.setText("Сравнение...")
+        self._worker = _DiffWorker(left_path, right_path, mode, parent=self)
+        self._worker.finished_diff.connect(self._on_compared)
+        self._worker.start()
+
+    def _on_compared(self, diff, error):
+        self._worker.wait()
+        self._worker = None
+
+        self.diff = diff
+        if diff is None:
+            self.summary_label.setText(f"Не удалось сравнить файлы: {error}")
+        else:
+            counts = diff.summary()
+            if counts['replace'] or counts['delete'] or counts['insert']:
+                text = (f"Изменено: {counts['replace']}, удалено: {counts['delete']}, "
+                        f"добавлено: {counts['insert']}, без изменений: {counts['equal']}")
+                if diff.approximate:
+                    text += "\nФайлы различаются слишком сильно: правки найдены по совпадающим строкам, " \
+                            "список может быть не самым коротким"
+                self.summary_label.setText(text)
+            else:
+                self.summary_label.setText("Шаблоны совпадают")
+        self._rebuild_model()
+
+    def _rebuild_model(self):
+        self.model.set_diff(self.diff, self.changes_only.isChecked())
+        self.jump_to_next_change()
+
+    def jump_to_next_change(self):
+        if self.diff is None:
+            return
+        row = self.model.next_change(self.view.currentIndex().row())
+        if row < 0:
+            # По кругу — к первому изменению
+            row = self.model.next_change(-1)
+        if row >= 0:
+            index = self.model.index(row, 1)
+            self.view.setCurrentIndex(index)
+            self.view.scrollTo(index, QAbstractItemView.ScrollHint.PositionAtCenter)
+
+    def done(self, result):
+        # Окно закрывается сразу, не дожидаясь сравнения
+        if self._worker is not None:
+            self._worker.cancel()
+            self._worker = None
+        super().done(result)
+
+
+def record_outputs(record):
+    """Результаты записи: из хранилища, если они там сохранены, иначе файлы в папке результатов"""
+    return output_sources(record)
+
+
+def show_records_diff(left_record, right_record, parent=None):
+    """Сравнение шаблонов двух записей истории; слева — более ранний запуск"""
+    if left_record.get('date', '') > right_record.get('date', ''):
+        left_record, right_record = right_record, left_record
+    left, right = record_outputs(left_record), record_outputs(right_record)
+    sources = {}
+    for output_type, title in (('raw_vm', 'template_raw.vm'), ('filled_vm', 'template_generated.vm')):
+        if left.get(output_type) and right.get(output_type):
+            sources[title] = (left[output_type], right[output_type])
+    if not sources:
+        return None
+    dialog = DiffDialog(sources,
+                        f"{left_record.get('file', '')} ({left_record.get('date', '')})",
+                        f"{right_record.get('file', '')} ({right_record.get('date', '')})", parent)
+    dialog.show()
+    return dialog
+
+
+def show_files_diff(left_path, right_path, parent=None):
+    dialog = DiffDialog({os.path.basename(right_path): (left_path, right_path)}, left_path, right_path, parent)
+    dialog.show()
+    return dialog
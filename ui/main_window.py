@@ -4,15 +4,24 @@ from datetime import datetime
 from PyQt6.QtWidgets import (QMainWindow, QWidget, QVBoxLayout, QHBoxLayout,
                              QPushButton, QLabel, QFileDialog, QTabWidget,
                              QGroupBox, QMessageBox, QStyleFactory,
-                             QTextEdit, QSplitter)
+                             QSplitter)
 from PyQt6.QtCore import Qt, QSettings
 from PyQt6.QtGui import QActionGroup, QAction, QFont
 
 import config
 from logic.file_processor import FileProcessor
+from logic.execution_strategy import INDEX_COMPACT, OUTPUT_STREAM
 from ui.palettes import HighContrastDarkPalette, HighContrastLightPalette
+from ui.structure_tree import StructureTreeView
+from ui.template_preview import TemplatePreview
+from ui.diff_view import show_files_diff
+from ui.metrics_view import MetricsView
 from logic.history_manager import HistoryManager
 from logic.group_manager import GroupManager
+from logic.project_regenerator import input_fingerprints, output_fingerprints, track_schema_modules
+from logic.output_store import OutputStore, store_outputs, referenced_digests
+from logic.xml_validator import get_validator
+from logic import startup_trace
 
 
 class MainWindow(QMainWindow):
@@ -27,6 +36,8 @@ class MainWindow(QMainWindow):
         # Инициализация менеджеров
         self.history_manager = HistoryManager(self)
         self.group_manager = GroupManager(self)
+        # Разбор сохраненной истории в фоне; None, когда история уже загружена
+        self._settings_loader = None
 
         self.initUI()
         self.load_settings()
@@ -43,19 +54,27 @@ class MainWindow(QMainWindow):
         self.processing_tab = self.create_processing_tab()
         central_widget.addTab(self.processing_tab, "Создать шаблон")
 
-        # Вкладка истории
-        history_tab = self.history_manager.create_history_tab()
-        central_widget.addTab(history_tab, "История обработки")
-
-        # Вкладка проектов
-        groups_tab = self.group_manager.create_groups_tab()
-        central_widget.addTab(groups_tab, "Управлять проектами")
+        # Вкладки истории, проектов и статистики строятся при первом открытии
+        self._deferred_tabs = {}
+        self._add_deferred_tab(central_widget, "История обработки", self.history_manager.create_history_tab)
+        self._add_deferred_tab(central_widget, "Управлять проектами", self.group_manager.create_groups_tab)
+        self._add_deferred_tab(central_widget, "Статистика", MetricsView)
+        central_widget.currentChanged.connect(self._build_deferred_tab)
 
         # Меню
         self.create_menu()
 
-        # Применяем начальные стили
-        self.apply_styles()
+    def _add_deferred_tab(self, tabs, title, factory):
+        placeholder = QWidget()
+        placeholder_layout = QVBoxLayout()
+        placeholder_layout.setContentsMargins(0, 0, 0, 0)
+        placeholder.setLayout(placeholder_layout)
+        self._deferred_tabs[tabs.addTab(placeholder, title)] = factory
+
+    def _build_deferred_tab(self, index):
+        factory = self._deferred_tabs.pop(index, None)
+        if factory is not None:
+            self.centralWidget().widget(index).layout().addWidget(factory())
 
     def create_processing_tab(self):
         widget = QWidget()
@@ -124,13 +143,29 @@ class MainWindow(QMainWindow):
         # Группа для результата
         result_group = QGroupBox("Результат генерации")
         result_layout = QVBoxLayout()
+        result_splitter = QSplitter(Qt.Orientation.Horizontal)
 
+        summary_widget = QWidget()
+        summary_layout = QVBoxLayout()
+        summary_layout.setContentsMargins(0, 0, 0, 0)
 
         self.result_info = QLabel("Пусто")
         self.result_info.setWordWrap(True)
         self.result_info.setStyleSheet("font-size: 11pt)")
-        result_layout.addWidget(self.result_info)
+        summary_layout.addWidget(self.result_info)
+
+        # Структура схемы: дерево с ленивой подгрузкой вместо текста в метке
+        self.structure_view = StructureTreeView()
+        self.structure_view.setVisible(False)
+        summary_layout.addWidget(self.structure_view, 1)
+        summary_widget.setLayout(summary_layout)
+        result_splitter.addWidget(summary_widget)
 
+        # Просмотр сгенерированных шаблонов
+        self.template_preview = TemplatePreview()
+        result_splitter.addWidget(self.template_preview)
+
+        result_layout.addWidget(result_splitter)
         result_group.setLayout(result_layout)
         layout.addWidget(result_group)
         layout.setStretch(2, 1)
@@ -141,6 +176,36 @@ class MainWindow(QMainWindow):
     def create_menu(self):
         menubar = self.menuBar()
 
+        # Перенос истории между рабочими местами
+        file_menu = menubar.addMenu('Файл')
+        export_action = QAction('Экспорт истории...', self)
+        export_action.triggered.connect(self.history_manager.export_history)
+        file_menu.addAction(export_action)
+
+        import_action = QAction('Импорт истории...', self)
+        import_action.triggered.connect(self.history_manager.import_history)
+        file_menu.addAction(import_action)
+
+        file_menu.addSeparator()
+        # Результаты по содержимому: одинаковые шаблоны разных запусков хранятся один раз
+        self.output_store_action = QAction('Хранить шаблоны в хранилище', self)
+        self.output_store_action.setCheckable(True)
+        self.output_store_action.toggled.connect(lambda checked: self.save_settings())
+        file_menu.addAction(self.output_store_action)
+
+        gc_action = QAction('Очистить хранилище шаблонов', self)
+        gc_action.triggered.connect(self.collect_output_store)
+        file_menu.addAction(gc_action)
+
+        file_menu.addSeparator()
+        compare_action = QAction('Сравнить файлы...', self)
+        compare_action.triggered.connect(self.compare_files)
+        file_menu.addAction(compare_action)
+
+        validate_action = QAction('Проверить XML по схеме...', self)
+        validate_action.triggered.connect(self.validate_documents)
+        file_menu.addAction(validate_action)
+
         # Меню режимов контрастности
         contrast_menu = menubar.addMenu('Режим контрастности')
 
@@ -167,27 +232,104 @@ class MainWindow(QMainWindow):
         self.contrast_action_group.addAction(self.light_contrast_action)
         self.contrast_action_group.setExclusive(True)
 
+    def output_store(self):
+        """Хранилище результатов, если оно включено, иначе None"""
+        return OutputStore() if self.output_store_action.isChecked() else None
+
+    def collect_output_store(self):
+        try:
+            summary = OutputStore().gc(referenced_digests(self.history_manager.history))
+        except OSError as e:
+            QMessageBox.critical(self, "Ошибка", f"Не удалось очистить хранилище: {e}")
+            return
+        QMessageBox.information(self, "Успех",
+                                f"Удалено файлов: {summary['removed']} "
+                                f"({summary['freed_bytes'] / (1024 * 1024):.1f} МБ), "
+                                f"осталось: {summary['kept']}")
+
+    def compare_files(self):
+        file_filter = "VM templates (*.vm);;Все файлы (*)"
+        left_path, _ = QFileDialog.getOpenFileName(self, "Первый файл для сравнения", "", file_filter)
+        if not left_path:
+            return
+        right_path, _ = QFileDialog.getOpenFileName(self, "Второй файл для сравнения",
+                                                    os.path.dirname(left_path), file_filter)
+        if right_path:
+            show_files_diff(left_path, right_path, self)
+
+    def validate_documents(self):
+        xsd_path = self.xsd_file
+        if not xsd_path:
+            xsd_path, _ = QFileDialog.getOpenFileName(self, "Схема для проверки", "", "XSD files (*.xsd)")
+            if not xsd_path:
+                return
+        paths, _ = QFileDialog.getOpenFileNames(self, "XML документы для проверки", self.output_dir or "",
+                                                "XML files (*.xml);;Все файлы (*)")
+        if not paths:
+            return
+        try:
+            validator = get_validator(FileProcessor._load_structure(xsd_path))
+        except (OSError, RuntimeError) as e:
+            QMessageBox.critical(self, "Ошибка", f"Не удалось загрузить схему: {e}")
+            return
+
+        invalid = 0
+        lines = []
+        for path, errors in validator.iter_validate(paths):
+            if errors:
+                invalid += 1
+                lines.extend(f"{os.path.basename(path)}: {error['path']}: {error['message']}" for error in errors)
+        message = f"Проверено документов: {len(paths)}, с ошибками: {invalid}"
+        if lines:
+            QMessageBox.warning(self, "Проверка по схеме", message + "\n\n" + "\n".join(lines[:20]))
+        else:
+            QMessageBox.information(self, "Проверка по схеме", message)
+
     def choose_file(self, file_type):
         file_filter = "Все файлы (*);;JSON files (*.json);;Text files (*.txt)" if file_type in ['scenario',
                                                                                                 'service'] else "XSD files (*.xsd);;Text files (*.txt);;Все файлы (*)"
         filepath, _ = QFileDialog.getOpenFileName(self, f"Выберите {file_type} файл", "", file_filter)
 
         if filepath:
-            if file_type == 'scenario':
-                self.scenario_file = filepath
-                self.scenario_label.setText(f"Файл сценария: {os.path.basename(filepath)}")
-            elif file_type == 'service':
-                self.service_file = filepath
-                self.service_label.setText(f"Файл схемы услуги: {os.path.basename(filepath)}")
-            elif file_type == 'xsd':
-                self.xsd_file = filepath
-                self.xsd_label.setText(f"XSD схема: {os.path.basename(filepath)}")
+            self.set_input_file(file_type, filepath)
+
+    def set_input_file(self, file_type, filepath):
+        if file_type == 'scenario':
+            self.scenario_file = filepath
+            self.scenario_label.setText(f"Файл сценария: {os.path.basename(filepath)}")
+        elif file_type == 'service':
+            self.service_file = filepath
+            self.service_label.setText(f"Файл схемы услуги: {os.path.basename(filepath)}")
+        elif file_type == 'xsd':
+            self.xsd_file = filepath
+            self.xsd_label.setText(f"XSD схема: {os.path.basename(filepath)}")
 
     def choose_output_dir(self):
         dir_path = QFileDialog.getExistingDirectory(self, "Выберите директорию для сохранения")
         if dir_path:
-            self.output_dir = dir_path
-            self.output_label.setText(f"Директория для сохранения: {dir_path}")
+            self.set_output_dir(dir_path)
+
+    def set_output_dir(self, dir_path):
+        self.output_dir = dir_path
+        self.output_label.setText(f"Директория для сохранения: {dir_path}")
+
+    def open_paths(self, paths):
+        """
+        Файлы из командной строки или от повторного запуска приложения:
+        .xsd — схема, папка — директория результатов, остальные файлы — сценарий.
+        Окно поднимается поверх остальных на вкладке генерации.
+        """
+        for path in paths:
+            if os.path.isdir(path):
+                self.set_output_dir(path)
+            elif os.path.isfile(path):
+                self.set_input_file('xsd' if path.lower().endswith('.xsd') else 'scenario', path)
+        if self.isMinimized():
+            self.showNormal()
+        if paths:
+            self.centralWidget().setCurrentWidget(self.processing_tab)
+        self.raise_()
+        self.activateWindow()
 
     def clear_files(self):
         self.scenario_file = None
@@ -197,6 +339,9 @@ class MainWindow(QMainWindow):
         self.xsd_label.setText("XSD схема: не выбрана")
         self.output_label.setText("Директория для сохранения: не выбрана (по умолчанию: текущая папка)")
         self.result_info.setText("Пусто")
+        self.structure_view.clear()
+        self.structure_view.setVisible(False)
+        self.template_preview.clear()
 
     def generate_vm_template(self):
         if not all([self.scenario_file, self.xsd_file]):
@@ -209,16 +354,39 @@ class MainWindow(QMainWindow):
             if output_path and not os.path.exists(output_path):
                 os.makedirs(output_path, exist_ok=True)
 
-            # Генерация VM шаблонов
+            # Генерация VM шаблонов; новые записи попадают в проект-черновик
+            group = 'Черновик'
             result = FileProcessor.build_vm_template(
                 self.scenario_file,
                 self.xsd_file,
-                output_path
+                output_path,
+                project=group
             )
 
             if result['success']:
                 raw_path = result['raw_output_path']
                 filled_path = result['filled_output_path']
+                cache_stats = result.get('fragment_cache', {})
+                mapping = result.get('mapping_profile', {})
+                mapping_text = (f"по профилю схемы ({mapping.get('rules', 0)} правил)" if mapping.get('applied')
+                                else "эвристиками (профиля схемы нет)")
+                if mapping.get('stale_rules'):
+                    mapping_text += (f"; путей {mapping['stale_rules']} правил нет в сценарии, "
+                                     f"для них значения найдены эвристикой")
+                decision = result.get('strategy', {}).get('decision', {})
+                strategy_text = (f"{'потоковая запись' if decision.get('output') == OUTPUT_STREAM else 'в памяти'}, "
+                                 f"{'компактные' if decision.get('index') == INDEX_COMPACT else 'полные'} индексы, "
+                                 f"потоков: {decision.get('workers', 1)}")
+                incremental = result.get('incremental', {})
+                if incremental.get('mode') == 'incremental':
+                    incremental_text = (f"пересобраны только изменившиеся узлы (из прошлого шаблона "
+                                        f"{incremental.get('reused_lines', 0)} строк, "
+                                        f"записано {incremental.get('bytes_written', 0)} байт)")
+                else:
+                    incremental_text = "шаблон собран целиком"
+                lazy = result.get('lazy_values', {})
+                lazy_text = (f"Длинные значения сценария записаны потоком из файла: {lazy['count']} "
+                             f"({lazy['bytes'] / (1024 * 1024):.1f} МБ)<br>" if lazy.get('count') else "")
 
                 info_text = (
                     f"<b>VM шаблоны успешно сгенерированы!</b><br>"
@@ -226,7 +394,16 @@ class MainWindow(QMainWindow):
                     f"template_raw.vm: <a href='file:///{raw_path}'>{raw_path}</a><br>"
                     f"template_generated.vm: <a href='file:///{filled_path}'>{filled_path}</a><br>"
                     f"Выполнено замен: {result['replacements_count']}<br>"
-                    f"Структура: {result['structure_summary']}"
+                    f"Из кэша фрагментов: {cache_stats.get('lines_from_cache', 0)} "
+                    f"из {cache_stats.get('lines_total', 0)} строк "
+                    f"(попаданий: {cache_stats.get('hits', 0)}, промахов: {cache_stats.get('misses', 0)})<br>"
+                    f"План генерации: {'из кэша' if cache_stats.get('plan_cached') else 'построен'} "
+                    f"({cache_stats.get('plan_size', 0)} инструкций)<br>"
+                    f"Сопоставление элементов: {mapping_text}<br>"
+                    f"Стратегия выполнения: {strategy_text}<br>"
+                    f"Повторная генерация: {incremental_text}<br>"
+                    f"{lazy_text}"
+                    f"Структура:"
                 )
 
                 self.result_info.setTextFormat(Qt.TextFormat.RichText)
@@ -235,6 +412,12 @@ class MainWindow(QMainWindow):
                 )
                 self.result_info.setOpenExternalLinks(True)
                 self.result_info.setText(info_text)
+                self.structure_view.set_structure(result.get('structure'))
+                self.structure_view.setVisible(True)
+                self.template_preview.set_files(raw_path, filled_path)
+
+                # ID новой записи выдается по уже загруженной истории
+                self.ensure_history_loaded()
 
                 # Создаем строку с файлами для отображения в таблице
                 files_list = [
@@ -262,9 +445,19 @@ class MainWindow(QMainWindow):
                     'full_path': result['raw_output_path'],
                     'date': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
                     'result': f"Успешно сгенерированы ({result['replacements_count']} замен)",
-                    'group': 'Черновик',
-                    'id': len(self.history_manager.history)
+                    'group': group,
+                    'id': self.history_manager.next_id()
                 }
+                # Отпечатки входов позволяют пропускать неизмененные записи при перегенерации проекта
+                track_schema_modules(history_item)
+                history_item['fingerprints'] = input_fingerprints(history_item)
+                history_item['output_fingerprints'] = output_fingerprints(history_item)
+                store = self.output_store()
+                if store is not None:
+                    try:
+                        store_outputs(history_item, store)
+                    except OSError as e:
+                        QMessageBox.warning(self, "Ошибка", f"Не удалось сохранить шаблоны в хранилище: {e}")
                 self.history_manager.add_to_history(history_item)
                 self.save_settings()
 
@@ -275,6 +468,7 @@ class MainWindow(QMainWindow):
             else:
                 error_msg = f"Ошибка при генерации VM шаблонов: {result['error']}"
                 self.result_info.setText(error_msg)
+                self.structure_view.setVisible(False)
 
                 QMessageBox.critical(self, "Ошибка", error_msg)
 
@@ -342,12 +536,12 @@ class MainWindow(QMainWindow):
                 border: 1px solid yellow;
                 font-weight: bold;
             }
-            QListWidget {
+            QListWidget, QTreeView {
                 background-color: black;
                 color: yellow;
                 border: 1px solid yellow;
             }
-            QListWidget::item:selected {
+            QListWidget::item:selected, QTreeView::item:selected {
                 background-color: yellow;
                 color: black;
             }
@@ -357,7 +551,7 @@ class MainWindow(QMainWindow):
                 border: 1px solid yellow;
                 padding: 2px;
             }
-            QTextEdit {
+            QTextEdit, QPlainTextEdit {
                 background-color: black;
                 color: yellow;
                 border: 1px solid yellow;
@@ -442,12 +636,12 @@ class MainWindow(QMainWindow):
                 border: 1px solid black;
                 font-weight: bold;
             }
-            QListWidget {
+            QListWidget, QTreeView {
                 background-color: white;
                 color: black;
                 border: 1px solid black;
             }
-            QListWidget::item:selected {
+            QListWidget::item:selected, QTreeView::item:selected {
                 background-color: black;
                 color: white;
             }
@@ -457,7 +651,7 @@ class MainWindow(QMainWindow):
                 border: 1px solid black;
                 padding: 2px;
             }
-            QTextEdit {
+            QTextEdit, QPlainTextEdit {
                 background-color: white;
                 color: black;
                 border: 1px solid black;
@@ -498,7 +692,10 @@ class MainWindow(QMainWindow):
             app.setStyle(QStyleFactory.create("Fusion"))
 
     def save_settings(self):
+        # Пока история не загружена, сохранение перезаписало бы ее пустой
+        self.ensure_history_loaded()
         self.settings.setValue("contrast_mode", self.contrast_mode)
+        self.settings.setValue("use_output_store", self.output_store_action.isChecked())
 
         # Сохраняем настройки из менеджеров
         history_settings = self.history_manager.save_settings()
@@ -520,25 +717,49 @@ class MainWindow(QMainWindow):
         else:
             self.normal_mode_action.setChecked(True)
 
+        self.output_store_action.blockSignals(True)
+        self.output_store_action.setChecked(self.settings.value("use_output_store", False, type=bool))
+        self.output_store_action.blockSignals(False)
+
+        # Применяем стили после загрузки настроек
+        self.apply_styles()
+
+        # История и проекты разбираются в фоне, окно показывается не дожидаясь их
+        self._settings_loader = self.history_manager.create_settings_loader(
+            self.settings.value("history", "{}"), self.settings.value("groups", "{}"), self)
+        self._settings_loader.finished.connect(self.ensure_history_loaded)
+        self._settings_loader.start()
+
+    def ensure_history_loaded(self):
+        """Дожидается фоновой загрузки истории; вызывается перед любым изменением истории"""
+        loader = self._settings_loader
+        if loader is None:
+            return
+        self._settings_loader = None
+        loader.wait()
+
         # Загрузка настроек истории
-        history_json = self.settings.value("history", "{}")
         try:
-            history_settings = json.loads(history_json)
-            self.history_manager.load_settings(history_settings)
-        except:
+            self.history_manager.load_settings(loader.history_settings)
+        except (KeyError, TypeError, ValueError):
             pass
 
         # Загрузка настроек групп
-        groups_json = self.settings.value("groups", "{}")
         try:
-            group_settings = json.loads(groups_json)
-            self.group_manager.load_settings(group_settings)
-        except:
+            self.group_manager.load_settings(loader.group_settings)
+        except (KeyError, TypeError, ValueError):
             pass
+        startup_trace.mark(f"история загружена ({len(self.history_manager.history)} записей)")
 
-        # Обновляем интерфейс
+        # Обновляем интерфейс (если вкладки уже открыты); заполнение таблицы запускает и проверку файлов,
+        # а без таблицы отметкам проверки негде показываться — она начнется при построении вкладки
         self.history_manager.update_history_table()
         self.history_manager.update_group_filters()
 
-        # Применяем стили после загрузки настроек
-        self.apply_styles()
\ No newline at end of file
+        # Дальше проверка файлов истории периодически повторяется в фоне
+        self.history_manager.integrity_timer.start()
+
+    def closeEvent(self, event):
+        self.ensure_history_loaded()
+        self.history_manager.stop_integrity_scan()
+        super().closeEvent(event)
\ No newline at end of file
@@ -0,0 +1,78 @@
+from PyQt6.QtWidgets import (QWidget, QVBoxLayout, QHBoxLayout, QLabel, QComboBox, QPushButton,
+                             QTableWidget, QTableWidgetItem, QHeaderView, QAbstractItemView)
+from PyQt6.QtCore import Qt
+
+from logic.run_metrics import MetricsAggregator
+
+# Подписи разрезов и этапов для выпадающих списков: (ключ, подпись)
+DIMENSION_TITLES = (('schema', "По схемам"), ('project', "По проектам"), ('day', "По дням"))
+METRIC_TITLES = (('total_ms', "Весь запуск"), ('load_ms', "Загрузка входов"), ('generate_ms', "Генерация"),
+                 ('render_ms', "Подстановка значений"), ('write_ms', "Запись результатов"))
+
+
+class MetricsView(QWidget):
+    """
+    Статистика запусков генерации из журнала метрик: p50/p95/максимум длительности по группам.
+    При обновлении агрегатор дочитывает только строки, появившиеся в журнале с прошлого раза.
+    """
+
+    HEADERS = ["Группа", "Запусков", "p50, мс", "p95, мс", "Макс., мс"]
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.aggregator = MetricsAggregator()
+
+        layout = QVBoxLayout()
+        controls = QHBoxLayout()
+        self.dimension_combo = QComboBox()
+        for key, title in DIMENSION_TITLES:
+            self.dimension_combo.addItem(title, key)
+        self.metric_combo = QComboBox()
+        for key, title in METRIC_TITLES:
+            self.metric_combo.addItem(title, key)
+        refresh_btn = QPushButton("Обновить")
+        controls.addWidget(QLabel("Разрез:"))
+        controls.addWidget(self.dimension_combo)
+        controls.addWidget(QLabel("Этап:"))
+        controls.addWidget(self.metric_combo)
+        controls.addStretch()
+        controls.addWidget(refresh_btn)
+        layout.addLayout(controls)
+
+        self.table = QTableWidget(0, len(self.HEADERS))
+        self.table.setHorizontalHeaderLabels(self.HEADERS)
+        self.table.setEditTriggers(QAbstractItemView.EditTrigger.NoEditTriggers)
+        self.table.verticalHeader().setVisible(False)
+        self.table.horizontalHeader().setSectionResizeMode(0, QHeaderView.ResizeMode.Stretch)
+        layout.addWidget(self.table)
+
+        self.status_label = QLabel()
+        layout.addWidget(self.status_label)
+        self.setLayout(layout)
+
+        self.dimension_combo.currentIndexChanged.connect(self.show_report)
+        self.metric_combo.currentIndexChanged.connect(self.show_report)
+        refresh_btn.clicked.connect(self.refresh)
+        self.refresh()
+
+    def refresh(self):
+        try:
+            added = self.aggregator.update()
+        except OSError as e:
+            self.status_label.setText(f"Журнал метрик не прочитан: {e}")
+            return
+        self.show_report()
+        if added:
+            self.status_label.setText(f"{self.status_label.text()} (новых: {added})")
+
+    def show_report(self):
+        rows = self.aggregator.report(self.dimension_combo.currentData(), self.metric_combo.currentData())
+        self.table.setRowCount(len(rows))
+        for row, (key, count, p50, p95, peak) in enumerate(rows):
+            self.table.setItem(row, 0, QTableWidgetItem(key))
+            for column, value in enumerate((str(count), f"{p50:.1f}", f"{p95:.1f}", f"{peak:.1f}"), 1):
+                item = QTableWidgetItem(value)
+                item.setTextAlignment(Qt.AlignmentFlag.AlignRight | Qt.AlignmentFlag.AlignVCenter)
+                self.table.setItem(row, column, item)
+        total = sum(row[1] for row in rows)
+        self.status_label.setText(f"Запусков в журнале: {total}" if rows else "В журнале метрик нет запусков")
@@ -0,0 +1,189 @@
+from PyQt6.QtWidgets import QWidget, QVBoxLayout, QLineEdit, QTreeView, QHeaderView
+from PyQt6.QtCore import Qt, QAbstractItemModel, QModelIndex, QTimer
+from PyQt6.QtGui import QStandardItemModel, QStandardItem
+
+
+def is_list_node(node):
+    max_occurs = node.get('maxOccurs', '1')
+    return max_occurs == 'unbounded' or (max_occurs.isdigit() and int(max_occurs) > 1)
+
+
+class _TreeItem:
+    """Обертка над узлом структуры; дети создаются только при раскрытии"""
+    __slots__ = ('node', 'parent', 'row', 'children')
+
+    def __init__(self, node, parent=None, row=0):
+        self.node = node
+        self.parent = parent
+        self.row = row
+        self.children = []
+
+    def total_children(self):
+        return len(self.node.get('children', []))
+
+
+class StructureTreeModel(QAbstractItemModel):
+    # Сколько детей добавлять за один fetchMore
+    FETCH_BATCH = 200
+
+    def __init__(self, structure=None, parent=None):
+        super().__init__(parent)
+        self._root = _TreeItem({'children': [structure] if structure else []})
+
+    def _item(self, index):
+        return index.internalPointer() if index.isValid() else self._root
+
+    def index(self, row, column, parent=QModelIndex()):
+        parent_item = self._item(parent)
+        if 0 <= row < len(parent_item.children) and column in (0, 1):
+            return self.createIndex(row, column, parent_item.children[row])
+        return QModelIndex()
+
+    def parent(self, index):
+        if not index.isValid():
+            return QModelIndex()
+        parent_item = index.internalPointer().parent
+        if parent_item is None or parent_item is self._root:
+            return QModelIndex()
+        return self.createIndex(parent_item.row, 0, parent_item)
+
+    def rowCount(self, parent=QModelIndex()):
+        if parent.column() > 0:
+            return 0
+        return len(self._item(parent).children)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 2
+
+    def hasChildren(self, parent=QModelIndex()):
+        return self._item(parent).total_children() > 0
+
+    def canFetchMore(self, parent):
+        item = self._item(parent)
+        return len(item.children) < item.total_children()
+
+    def fetchMore(self, parent):
+        item = self._item(parent)
+        nodes = item.node.get('children', [])
+        start = len(item.children)
+        end = min(start + self.FETCH_BATCH, len(nodes))
+        if start >= end:
+            return
+        self.beginInsertRows(parent, start, end - 1)
+        item.children.extend(_TreeItem(nodes[row], item, row) for row in range(start, end))
+        self.endInsertRows()
+
+    def data(self, index, role=Qt.ItemDataRole.DisplayRole):
+        if not index.isValid() or role != Qt.ItemDataRole.DisplayRole:
+            return None
+        node = index.internalPointer().node
+        if index.column() == 0:
+            return node.get('name') or 'Без имени'
+        return "список" if is_list_node(node) else "элемент"
+
+    def headerData(self, section, orientation, role=Qt.ItemDataRole.DisplayRole):
+        if orientation == Qt.Orientation.Horizontal and role == Qt.ItemDataRole.DisplayRole:
+            return ("Элемент", "Вид")[section]
+        return None
+
+
+class StructureTreeView(QWidget):
+    """Дерево структуры XSD с ленивой подгрузкой и поиском по именам узлов"""
+
+    # Больше совпадений не показываем, чтобы поиск оставался мгновенным
+    SEARCH_LIMIT = 500
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.structure = None
+        self._flat_index = None
+        self._search_model = None
+
+        layout = QVBoxLayout()
+        layout.setContentsMargins(0, 0, 0, 0)
+
+        self.search_field = QLineEdit()
+        self.search_field.setPlaceholderText("Поиск по имени элемента")
+        self.search_field.textChanged.connect(self._schedule_search)
+        layout.addWidget(self.search_field)
+
+        self.tree = QTreeView()
+        self.tree.setUniformRowHeights(True)
+        self.tree.header().setSectionResizeMode(0, QHeaderView.ResizeMode.Stretch)
+        layout.addWidget(self.tree)
+        self.setLayout(layout)
+
+        self._tree_model = StructureTreeModel()
+        self.tree.setModel(self._tree_model)
+
+        # Откладываем поиск, пока пользователь печатает
+        self._search_timer = QTimer(self)
+        self._search_timer.setSingleShot(True)
+        self._search_timer.setInterval(150)
+        self._search_timer.timeout.connect(self._run_search)
+
+    def set_structure(self, structure):
+        self.structure = structure
+        self._flat_index = None
+        self._tree_model = StructureTreeModel(structure)
+        self.search_field.blockSignals(True)
+        self.search_field.clear()
+        self.search_field.blockSignals(False)
+        self.tree.setModel(self._tree_model)
+        self.tree.header().setSectionResizeMode(0, QHeaderView.ResizeMode.Stretch)
+        if structure:
+            # Корень тоже подгружается лениво: пока fetchMore не вызван, строки 0 нет и индекс недействителен
+            self._tree_model.fetchMore(QModelIndex())
+            self.tree.expand(self._tree_model.index(0, 0))
+
+    def clear(self):
+        self.set_structure(None)
+
+    def _schedule_search(self, _text):
+        self._search_timer.start()
+
+    def _build_flat_index(self):
+        """Плоский список (имя в нижнем регистре, путь, узел) строится один раз при первом поиске"""
+        index = []
+        if self.structure:
+            stack = [(self.structure, "")]
+            while stack:
+                node, path = stack.pop()
+                name = node.get('name') or ''
+                full_path = f"{path}/{name}" if path else name
+                index.append((name.lower(), full_path, node))
+                for child in reversed(node.get('children', [])):
+                    stack.append((child, full_path))
+        return index
+
+    def _run_search(self):
+        text = self.search_field.text().strip().lower()
+        if not text:
+            self.tree.setModel(self._tree_model)
+            self.tree.header().setSectionResizeMode(0, QHeaderView.ResizeMode.Stretch)
+            return
+
+        if self._flat_index is None:
+            self._flat_index = self._build_flat_index()
+
+        model = QStandardItemModel(self)
+        model.setHorizontalHeaderLabels(["Путь", "Вид"])
+        found = 0
+        for name, path, node in self._flat_index:
+            if text in name:
+                path_item = QStandardItem(path)
+                path_item.setEditable(False)
+                kind_item = QStandardItem("список" if is_list_node(node) else "элемент")
+                kind_item.setEditable(False)
+                model.appendRow([path_item, kind_item])
+                found += 1
+                if found >= self.SEARCH_LIMIT:
+                    more_item = QStandardItem(f"... показаны первые {self.SEARCH_LIMIT} совпадений")
+                    more_item.setEditable(False)
+                    model.appendRow([more_item])
+                    break
+        if self._search_model is not None:
+            self._search_model.deleteLater()
+        self._search_model = model
+        self.tree.setModel(model)
+        self.tree.header().setSectionResizeMode(0, QHeaderView.ResizeMode.Stretch)
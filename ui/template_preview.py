@@ -0,0 +1,254 @@
+import codecs
+import os
+from PyQt6.QtWidgets import (QWidget, QVBoxLayout, QHBoxLayout, QLabel,
+                             QPlainTextEdit, QPushButton, QComboBox)
+from PyQt6.QtCore import QRegularExpression
+from PyQt6.QtGui import QSyntaxHighlighter, QTextCharFormat, QColor, QFont, QTextCursor
+
+from logic.output_store import StoredOutput
+
+
+class VelocityHighlighter(QSyntaxHighlighter):
+    """
+    Подсветка XML тегов, директив и $плейсхолдеров Velocity.
+    Блоки раскрашиваются только по запросу highlight_block — для видимой части документа.
+    """
+
+    def __init__(self, document):
+        super().__init__(document)
+        self.highlighted = set()
+        self._requested = False
+        tag_format = QTextCharFormat()
+        tag_format.setForeground(QColor(0, 110, 200))
+
+        directive_format = QTextCharFormat()
+        directive_format.setForeground(QColor(150, 0, 150))
+        directive_format.setFontWeight(QFont.Weight.Bold)
+
+        placeholder_format = QTextCharFormat()
+        placeholder_format.setForeground(QColor(200, 90, 0))
+        placeholder_format.setFontWeight(QFont.Weight.Bold)
+
+        self.rules = [
+            (QRegularExpression(r"</?[\w:.\-]+|/?>"), tag_format),
+            (QRegularExpression(r"#(foreach|end|if|elseif|else|set)\b"), directive_format),
+            (TemplatePreview.PLACEHOLDER_RE, placeholder_format),
+        ]
+
+    def reset(self):
+        self.highlighted.clear()
+
+    def highlight_block(self, block):
+        if block.blockNumber() in self.highlighted:
+            return
+        self.highlighted.add(block.blockNumber())
+        self._requested = True
+        try:
+            self.rehighlightBlock(block)
+        finally:
+            self._requested = False
+
+    def highlightBlock(self, text):
+        # Вставка новых частей файла не должна раскрашивать весь документ
+        if not self._requested:
+            return
+        for pattern, fmt in self.rules:
+            it = pattern.globalMatch(text)
+            while it.hasNext():
+                match = it.next()
+                self.setFormat(match.capturedStart(), match.capturedLength(), fmt)
+
+
+class TemplatePreview(QWidget):
+    """Просмотр сгенерированных шаблонов: файл подгружается частями по мере прокрутки"""
+
+    PLACEHOLDER_RE = QRegularExpression(r"\$\{?[A-Za-z_][\w.]*\}?")
+    # Размер части файла, подгружаемой за раз
+    CHUNK_SIZE = 256 * 1024
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.paths = {}
+        self._path = None
+        self._offset = 0
+        self._size = 0
+        self._decoder = None
+        # Открытый файл из хранилища результатов; файлы на диске открываются заново для каждой части
+        self._stream = None
+        self._carry = b''
+
+        layout = QVBoxLayout()
+        layout.setContentsMargins(0, 0, 0, 0)
+
+        controls_layout = QHBoxLayout()
+        self.file_combo = QComboBox()
+        self.file_combo.currentIndexChanged.connect(self._on_file_changed)
+        controls_layout.addWidget(self.file_combo, 1)
+
+        btn_next_placeholder = QPushButton("Следующий $плейсхолдер")
+        btn_next_placeholder.clicked.connect(self.jump_to_next_placeholder)
+        controls_layout.addWidget(btn_next_placeholder)
+        layout.addLayout(controls_layout)
+
+        self.editor = QPlainTextEdit()
+        self.editor.setReadOnly(True)
+        self.editor.setUndoRedoEnabled(False)
+        self.editor.setLineWrapMode(QPlainTextEdit.LineWrapMode.NoWrap)
+        self.editor.verticalScrollBar().valueChanged.connect(self._on_scroll)
+        self.highlighter = VelocityHighlighter(self.editor.document())
+        self.editor.updateRequest.connect(self._highlight_visible)
+        layout.addWidget(self.editor, 1)
+
+        self.status_label = QLabel("")
+        layout.addWidget(self.status_label)
+
+        self.setLayout(layout)
+
+    def set_files(self, raw_path=None, filled_path=None):
+        """
+        Показывает пару шаблонов; по умолчанию открывается шаблон с подстановкой.
+        Вместо пути можно передать StoredOutput — файл из хранилища результатов.
+        """
+        self.paths = {}
+        if filled_path:
+            self.paths["template_generated.vm (с подстановкой)"] = filled_path
+        if raw_path:
+            self.paths["template_raw.vm (чистый)"] = raw_path
+
+        self.file_combo.blockSignals(True)
+        self.file_combo.clear()
+        self.file_combo.addItems(list(self.paths.keys()))
+        self.file_combo.blockSignals(False)
+        self._open(next(iter(self.paths.values()), None))
+
+    def clear(self):
+        self.set_files()
+
+    def _on_file_changed(self, index):
+        if index >= 0:
+            self._open(self.paths.get(self.file_combo.itemText(index)))
+
+    def _open(self, path):
+        self.editor.clear()
+        self.highlighter.reset()
+        self._close_stream()
+        self._path = None
+        self._offset = 0
+        self._size = 0
+        if not path:
+            self.status_label.setText("")
+            return
+        try:
+            if isinstance(path, StoredOutput):
+                self._size = path.size()
+                self._stream = path.open()
+            else:
+                self._size = os.path.getsize(path)
+        except OSError as e:
+            self.status_label.setText(f"Файл недоступен: {e}")
+            return
+        self._path = path
+        self._decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+        self._load_chunk()
+
+    def is_fully_loaded(self):
+        return self._path is None or self._offset >= self._size
+
+    def _load_chunk(self):
+        """Дочитывает следующую часть файла; части режутся по концу строки"""
+        if self.is_fully_loaded():
+            return False
+        try:
+            if self._stream is not None:
+                data = self._carry + self._stream.read(self.CHUNK_SIZE)
+                self._carry = b''
+            else:
+                with open(self._path, 'rb') as f:
+                    f.seek(self._offset)
+                    data = f.read(self.CHUNK_SIZE)
+        except (OSError, EOFError) as e:
+            self.status_label.setText(f"Ошибка чтения: {e}")
+            self._path = None
+            self._close_stream()
+            return False
+
+        if not data:
+            # Файл укоротили с момента открытия
+            self._offset = self._size
+            self._close_stream()
+            return False
+        final = self._offset + len(data) >= self._size
+        if not final:
+            cut = data.rfind(b'\n')
+            if cut >= 0:
+                if self._stream is not None:
+                    # Сжатый поток не перечитывается с позиции: хвост части идет в начало следующей
+                    self._carry = data[cut + 1:]
+                data = data[:cut + 1]
+        self._offset += len(data)
+        if final:
+            self._close_stream()
+
+        text = self._decoder.decode(data, final=final)
+        if text:
+            scrollbar = self.editor.verticalScrollBar()
+            position = scrollbar.value()
+            cursor = QTextCursor(self.editor.document())
+            cursor.movePosition(QTextCursor.MoveOperation.End)
+            cursor.insertText(text)
+            scrollbar.setValue(position)
+        self._update_status()
+        return True
+
+    def _close_stream(self):
+        self._carry = b''
+        if self._stream is not None:
+            self._stream.close()
+            self._stream = None
+
+    def _update_status(self):
+        if self._size:
+            percent = min(100, int(self._offset * 100 / self._size))
+            self.status_label.setText(f"Загружено {percent}% ({self._offset // 1024} из {self._size // 1024} КБ)")
+        else:
+            self.status_label.setText("Файл пуст")
+
+    def _highlight_visible(self, *_args):
+        """Раскрашивает блоки, попавшие в видимую область"""
+        offset = self.editor.contentOffset()
+        bottom = self.editor.viewport().height()
+        block = self.editor.firstVisibleBlock()
+        while block.isValid():
+            if self.editor.blockBoundingGeometry(block).translated(offset).top() > bottom:
+                break
+            self.highlighter.highlight_block(block)
+            block = block.next()
+
+    def _on_scroll(self, value):
+        scrollbar = self.editor.verticalScrollBar()
+        if value >= scrollbar.maximum() - scrollbar.pageStep():
+            self._load_chunk()
+
+    def jump_to_next_placeholder(self):
+        """Переходит к следующему неразрешенному $плейсхолдеру, при необходимости дочитывая файл"""
+        document = self.editor.document()
+        found = document.find(self.PLACEHOLDER_RE, self.editor.textCursor())
+        while found.isNull():
+            # Ищем только в только что дочитанной части: части режутся по строкам, а плейсхолдер не переносится
+            loaded_end = document.characterCount() - 1
+            if not self._load_chunk():
+                break
+            found = document.find(self.PLACEHOLDER_RE, loaded_end)
+        if not found.isNull():
+            self.editor.setTextCursor(found)
+            self.editor.centerCursor()
+            return True
+
+        # Дошли до конца файла: ищем с начала
+        found = document.find(self.PLACEHOLDER_RE, 0)
+        if not found.isNull():
+            self.editor.setTextCursor(found)
+            self.editor.centerCursor()
+            return True
+        self.status_label.setText("Неразрешенных плейсхолдеров не найдено")
+        return False